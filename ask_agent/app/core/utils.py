@@ -2,11 +2,6 @@ import datetime
 import socket
 import os
 import uuid
-import matplotlib
-matplotlib.use("Agg")  # headless 环境
-import matplotlib.pyplot as plt
-from matplotlib import rcParams
-import matplotlib.font_manager as fm
 import config
 import numpy as np
 
@@ -17,30 +12,49 @@ FONTS_DIR = os.path.join(BASE_DIR, "fonts")
 
 # ================== 中文字体处理 ==================
 simhei_path = os.path.join(FONTS_DIR, "SimHei.ttf")
+_plt = None
 
-if not os.path.exists(simhei_path):
-    raise FileNotFoundError(f"字体文件不存在: {simhei_path}")
 
-# 1. 注册字体
-fm.fontManager.addfont(simhei_path)
+def get_pyplot():
+    """
+    首次画图时才导入 matplotlib 并配置字体（导入 + 注册字体约 1s，不放在服务启动路径上）
+    """
+    global _plt
+    if _plt is not None:
+        return _plt
+
+    import matplotlib
+    matplotlib.use("Agg")  # headless 环境
+    import matplotlib.pyplot as plt
+    from matplotlib import rcParams
+    import matplotlib.font_manager as fm
 
-# 2. 获取字体名称（跨版本兼容）
-simhei_name = fm.FontProperties(fname=simhei_path).get_name()
+    if not os.path.exists(simhei_path):
+        raise FileNotFoundError(f"字体文件不存在: {simhei_path}")
 
-# 3. 强制 matplotlib 使用 SimHei
-rcParams["font.family"] = simhei_name
-rcParams["font.sans-serif"] = [simhei_name]
+    # 1. 注册字体
+    fm.fontManager.addfont(simhei_path)
 
-# 4. 正确显示负号
-rcParams["axes.unicode_minus"] = False
+    # 2. 获取字体名称（跨版本兼容）
+    simhei_name = fm.FontProperties(fname=simhei_path).get_name()
 
-# 默认样式
-rcParams['font.size'] = 12
-rcParams['legend.fontsize'] = 10
-rcParams['xtick.labelsize'] = 10
-rcParams['ytick.labelsize'] = 10
-rcParams['lines.linewidth'] = 2
-rcParams['lines.markersize'] = 6
+    # 3. 强制 matplotlib 使用 SimHei
+    rcParams["font.family"] = simhei_name
+    rcParams["font.sans-serif"] = [simhei_name]
+
+    # 4. 正确显示负号
+    rcParams["axes.unicode_minus"] = False
+
+    # 默认样式
+    rcParams['font.size'] = 12
+    rcParams['legend.fontsize'] = 10
+    rcParams['xtick.labelsize'] = 10
+    rcParams['ytick.labelsize'] = 10
+    rcParams['lines.linewidth'] = 2
+    rcParams['lines.markersize'] = 6
+
+    _plt = plt
+    return _plt
 # ======================================================
 
 def ensure_images_dir():
@@ -51,6 +65,7 @@ def save_diff_chart(image_name: str | None, diffs: list[tuple]) -> str:
     """
     生成差值曲线图并返回可访问 URL
     """
+    plt = get_pyplot()
     ensure_images_dir()
     if not image_name:
         image_name = str(uuid.uuid4())
@@ -105,8 +120,8 @@ def save_multi_series_chart(
     - 标注最大/最小值
     """
     import pandas as pd
-    import matplotlib.pyplot as plt
     from scipy.signal import savgol_filter   # 更稳健的平滑
+    plt = get_pyplot()
     ensure_images_dir()
 
     if not image_name:
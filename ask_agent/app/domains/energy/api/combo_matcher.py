@@ -0,0 +1,104 @@
+# app/domains/energy/api/combo_matcher.py
+"""
+组合权重匹配（apply_combine_weights 的预编译版本）：
+- COMBINE_WEIGHT_LIST 中所有 term 编译进一个 Aho-Corasick 自动机，一次扫描得到文本命中的全部 term
+- 每个组合对应一个比特位（按 weight 降序编号），文本命中的组合压成一个整数 mask
+- 公式名称的 mask 在目录加载时预计算；查询文本的 mask 每次查询只算一次
+- 候选加权 = 查 (公式 mask & ~查询 mask) 对应的乘数表，结果按组合顺序缓存
+"""
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class AhoCorasick:
+    """多模式串匹配自动机（纯 Python，模式串数量通常只有几十到几百个）"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[Set[int]] = [set()]
+        self.always: Set[int] = set()   # 空模式串在任何文本中都视为命中
+
+        for pid, pattern in enumerate(patterns):
+            if not pattern:
+                self.always.add(pid)
+                continue
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(set())
+                state = nxt
+            self.out[state].add(pid)
+        self._build_fail()
+
+    def _build_fail(self):
+        queue = list(self.goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] |= self.out[self.fail[nxt]]
+
+    def find(self, text: str) -> Set[int]:
+        """返回 text 中出现过的模式串编号集合"""
+        hits = set(self.always)
+        state = 0
+        goto, fail, out = self.goto, self.fail, self.out
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                hits |= out[state]
+        return hits
+
+
+class ComboMatcher:
+    def __init__(self, combine_weight_list: List[dict]):
+        # 按 weight 降序（与原逐项遍历顺序一致），空 terms 的组合不参与加权
+        combos = sorted(combine_weight_list, key=lambda c: c.get("weight", 0), reverse=True)
+        combos = [c for c in combos if c.get("terms")]
+
+        term_ids: Dict[str, int] = {}
+        self.combo_terms: List[frozenset] = []
+        self.multipliers: List[float] = []
+        for combo in combos:
+            ids = frozenset(term_ids.setdefault(t, len(term_ids)) for t in combo["terms"])
+            self.combo_terms.append(ids)
+            self.multipliers.append(1.0 + float(combo.get("weight", 0.0)))
+
+        self.automaton = AhoCorasick(list(term_ids))
+        self._factors: Dict[int, Tuple[float, ...]] = {}
+        self._lock = threading.Lock()
+
+    def mask(self, text: str) -> int:
+        """text 完整包含的组合（所有 term 都出现）对应的比特位"""
+        if not self.combo_terms:
+            return 0
+        hits = self.automaton.find(str(text or ""))
+        mask = 0
+        for bit, terms in enumerate(self.combo_terms):
+            if terms <= hits:
+                mask |= 1 << bit
+        return mask
+
+    def factors(self, formula_mask: int, user_mask: int) -> Tuple[float, ...]:
+        """公式命中且用户输入未完整包含的组合，按 weight 降序返回 (1 + weight) 乘数"""
+        key = formula_mask & ~user_mask
+        factors = self._factors.get(key)
+        if factors is None:
+            factors = tuple(m for bit, m in enumerate(self.multipliers) if key >> bit & 1)
+            with self._lock:
+                self._factors[key] = factors
+        return factors
@@ -0,0 +1,245 @@
+# app/domains/energy/api/embedding_store.py
+"""
+公式嵌入的磁盘存储（替代 pickle 缓存）：
+- <base>.npy            : 原始 float32 矩阵，np.load(mmap_mode="r") 打开，
+                          多个 uvicorn worker 共享同一份 page cache，启动无需反序列化
+- <base>.keys.json      : 与矩阵逐行对应的行键 "FORMULAID:名称哈希"，用于增量刷新
+- <base>.manifest.json  : 版本、行数、维度、模型 id、CSV 内容哈希
+- <base>.tokens.json    : normalize_text / jieba 分词结果，按 CSV 哈希失效（热重启跳过分词）
+
+manifest 最后写入，作为“提交标记”；任一字段不一致即视为缓存失效。
+CSV 变化时按行键对齐旧矩阵，只对新增 / 改名的公式重新编码，删除的行直接丢弃。
+"""
+import os
+import json
+import hashlib
+import logging
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+# ================= 日志配置 =================
+logger = logging.getLogger("domains.energy.api.embedding_store")
+if not logger.handlers:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+    )
+
+STORE_VERSION = 2
+TOKENS_VERSION = 1
+
+
+def file_sha256(path: str) -> str:
+    """计算文件内容 sha256（用于检测行数不变的 CSV 修改）"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def embedding_row_key(formula_id: str, clean_name: str) -> str:
+    """行键：FORMULAID + normalize_text 名称哈希，名称变化即视为需要重新编码"""
+    fid = str(formula_id).strip().strip('"').strip("'")
+    name_hash = hashlib.sha1(str(clean_name).encode("utf-8")).hexdigest()[:16]
+    return f"{fid}:{name_hash}"
+
+
+def store_paths(base_path: str):
+    """base_path 去掉扩展名后派生 .npy / .keys.json / .manifest.json 路径"""
+    base = os.path.splitext(base_path)[0]
+    return f"{base}.npy", f"{base}.keys.json", f"{base}.manifest.json"
+
+
+def read_manifest(base_path: str) -> Optional[dict]:
+    _, _, manifest_path = store_paths(base_path)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"⚠️ 读取嵌入 manifest 失败: {e}")
+        return None
+
+
+def _open_matrix(npy_path: str, manifest: dict) -> Optional[np.ndarray]:
+    try:
+        embeddings = np.load(npy_path, mmap_mode="r")
+    except Exception as e:
+        logger.warning(f"⚠️ 打开嵌入文件失败: {e}")
+        return None
+    if embeddings.dtype != np.float32 or embeddings.shape != (manifest.get("rows"), manifest.get("dim")):
+        logger.warning(f"⚠️ 嵌入文件形状不一致: {embeddings.shape} {embeddings.dtype}")
+        return None
+    return embeddings
+
+
+def load_embeddings(base_path: str, rows: int, model_id: str, csv_hash: str) -> Optional[np.ndarray]:
+    """
+    快速路径：CSV 未变化时以只读内存映射方式直接加载；
+    manifest 缺失或与当前 (行数, 模型, CSV 哈希) 不一致时返回 None
+    """
+    npy_path, _, _ = store_paths(base_path)
+    manifest = read_manifest(base_path)
+    if not manifest or not os.path.exists(npy_path):
+        return None
+
+    expected = {"version": STORE_VERSION, "rows": rows, "model_id": model_id, "csv_hash": csv_hash}
+    mismatched = [k for k, v in expected.items() if manifest.get(k) != v]
+    if mismatched:
+        logger.warning(f"⚠️ 嵌入缓存与当前 CSV 不一致: {mismatched}")
+        return None
+    return _open_matrix(npy_path, manifest)
+
+
+def load_embedding_rows(base_path: str, model_id: str) -> Optional[Tuple[List[str], np.ndarray]]:
+    """
+    增量路径：读取旧缓存的 (行键列表, mmap 矩阵)；模型或版本不同则整体不可复用
+    """
+    npy_path, keys_path, _ = store_paths(base_path)
+    manifest = read_manifest(base_path)
+    if not manifest or manifest.get("version") != STORE_VERSION or manifest.get("model_id") != model_id:
+        return None
+    if not os.path.exists(npy_path) or not os.path.exists(keys_path):
+        return None
+    try:
+        with open(keys_path, "r", encoding="utf-8") as f:
+            keys = json.load(f)
+    except Exception as e:
+        logger.warning(f"⚠️ 读取嵌入行键失败: {e}")
+        return None
+    embeddings = _open_matrix(npy_path, manifest)
+    if embeddings is None or len(keys) != len(embeddings):
+        return None
+    return keys, embeddings
+
+
+def merge_embeddings(
+    keys: List[str],
+    texts: List[str],
+    old: Optional[Tuple[List[str], np.ndarray]],
+    encode: Callable[[List[str]], np.ndarray],
+) -> Tuple[np.ndarray, dict]:
+    """
+    按行键合并旧嵌入：
+    - 行键在旧缓存中存在 → 直接复制旧向量
+    - 新增 / 改名 → 只对这些 texts 调用 encode
+    - 旧缓存中多余的行键（已删除公式）自然被丢弃
+    返回 (新矩阵, 统计信息)
+    """
+    old_pos = {}
+    old_matrix = None
+    if old is not None:
+        old_keys, old_matrix = old
+        for i, k in enumerate(old_keys):
+            old_pos.setdefault(k, i)
+
+    reuse_new, reuse_old, missing = [], [], []
+    for i, k in enumerate(keys):
+        j = old_pos.get(k)
+        if j is None:
+            missing.append(i)
+        else:
+            reuse_new.append(i)
+            reuse_old.append(j)
+
+    encoded = None
+    if missing:
+        encoded = np.asarray(encode([texts[i] for i in missing]), dtype=np.float32)
+
+    if old_matrix is not None:
+        dim = old_matrix.shape[1]
+    elif encoded is not None:
+        dim = encoded.shape[1]
+    else:
+        dim = 0
+    merged = np.empty((len(keys), dim), dtype=np.float32)
+    if reuse_new:
+        # 按旧行号排序后读取，对 mmap 更友好
+        order = np.argsort(reuse_old)
+        merged[np.asarray(reuse_new)[order]] = old_matrix[np.asarray(reuse_old)[order]]
+    if encoded is not None:
+        merged[missing] = encoded
+
+    stats = {
+        "reused": len(reuse_new),
+        "encoded": len(missing),
+        "dropped": (len(old_pos) - len(set(reuse_old))) if old is not None else 0,
+    }
+    return merged, stats
+
+
+def save_embeddings(base_path: str, embeddings: np.ndarray, keys: List[str], model_id: str, csv_hash: str):
+    """原子写入 .npy / 行键 / manifest（先写临时文件再 os.replace）"""
+    npy_path, keys_path, manifest_path = store_paths(base_path)
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    # 先删除旧 manifest，写入中途失败时缓存整体失效而不是新旧混用
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    tmp_npy = f"{npy_path}.{os.getpid()}.tmp"
+    with open(tmp_npy, "wb") as f:
+        np.save(f, embeddings)
+    os.replace(tmp_npy, npy_path)
+
+    tmp_keys = f"{keys_path}.{os.getpid()}.tmp"
+    with open(tmp_keys, "w", encoding="utf-8") as f:
+        json.dump(list(keys), f, ensure_ascii=False)
+    os.replace(tmp_keys, keys_path)
+
+    manifest = {
+        "version": STORE_VERSION,
+        "rows": int(embeddings.shape[0]),
+        "dim": int(embeddings.shape[1]),
+        "dtype": "float32",
+        "model_id": model_id,
+        "csv_hash": csv_hash,
+    }
+    tmp_manifest = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_manifest, manifest_path)
+
+
+def tokens_path(base_path: str) -> str:
+    return f"{os.path.splitext(base_path)[0]}.tokens.json"
+
+
+def load_tokens(base_path: str, csv_hash: str, rows: int, tokenizer_id: str) -> Optional[Tuple[List[str], List[str]]]:
+    """读取缓存的 (names_clean, names_tokens)；CSV 哈希、行数或分词器版本不一致时返回 None"""
+    path = tokens_path(base_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        logger.warning(f"⚠️ 读取分词缓存失败: {e}")
+        return None
+    expected = {"version": TOKENS_VERSION, "csv_hash": csv_hash, "rows": rows, "tokenizer": tokenizer_id}
+    if any(data.get(k) != v for k, v in expected.items()):
+        return None
+    names_clean, names_tokens = data.get("names_clean"), data.get("names_tokens")
+    if not isinstance(names_clean, list) or not isinstance(names_tokens, list) or len(names_clean) != rows \
+            or len(names_tokens) != rows:
+        return None
+    return names_clean, names_tokens
+
+
+def save_tokens(base_path: str, csv_hash: str, tokenizer_id: str, names_clean: List[str], names_tokens: List[str]):
+    """原子写入分词缓存"""
+    path = tokens_path(base_path)
+    data = {
+        "version": TOKENS_VERSION,
+        "csv_hash": csv_hash,
+        "rows": len(names_clean),
+        "tokenizer": tokenizer_id,
+        "names_clean": list(names_clean),
+        "names_tokens": list(names_tokens),
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
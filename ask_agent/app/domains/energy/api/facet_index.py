@@ -0,0 +1,117 @@
+# app/domains/energy/api/facet_index.py
+"""
+公式元数据分面（CATEGORYID / ISLATEST / TEMPLATEID / SOURCEID / FIELDNAME 等）：
+- 每列存为 (取值表, int32 编码数组) 的列式结构，不保留整张 DataFrame
+- 低基数列为每个取值建立位图（np.packbits，每行 1 bit）；高基数列（如 TEMPLATEID）按编码现场比较
+- filters 形如 {"ISLATEST": "1", "FIELDNAME": ["SUMVALUE", "REPORTVALUE"]}：
+  同列多个取值为 OR，不同列之间为 AND，结果为长度 N 的布尔掩码
+"""
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+FACET_COLUMNS = ("CATEGORYID", "ISLATEST", "TEMPLATEID", "SOURCEID", "FIELDNAME")
+BITMAP_MAX_VALUES = 1024   # 取值数超过该值的列不建位图，避免 取值数 × N/8 字节的内存开销
+
+FilterSpec = Dict[str, Union[str, List[str]]]
+
+
+def _clean_value(v) -> str:
+    return str(v if v is not None else "").strip().strip('"').strip("'")
+
+
+def parse_filters(spec: str) -> FilterSpec:
+    """
+    解析字符串形式的过滤条件（配置 / HTTP 参数）：
+    "ISLATEST=1,FIELDNAME=SUMVALUE|REPORTVALUE" -> {"ISLATEST": ["1"], "FIELDNAME": ["SUMVALUE", "REPORTVALUE"]}
+    """
+    filters: FilterSpec = {}
+    for part in str(spec or "").split(","):
+        if "=" not in part:
+            continue
+        key, values = part.split("=", 1)
+        key = key.strip().upper()
+        values = [v.strip() for v in values.split("|") if v.strip()]
+        if key and values:
+            filters[key] = values
+    return filters
+
+
+def _is_scalar(v) -> bool:
+    return isinstance(v, (str, int, float)) and not isinstance(v, bool)
+
+
+def normalize_filters(filters: Optional[FilterSpec]) -> tuple:
+    """
+    规范化为可哈希的 ((列, (取值, ...)), ...)，用作结果缓存键；空条件返回 ()。
+    filters 须为 {列名: 取值 或 [取值, ...]}（取值为字符串 / 数字），否则抛出 ValueError。
+    """
+    if not filters:
+        return ()
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object of {column: value | [values]}")
+    items = []
+    for key, values in filters.items():
+        if not isinstance(key, str):
+            raise ValueError(f"filter column must be a string: {key!r}")
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        if not all(_is_scalar(v) for v in values):
+            raise ValueError(f"filter values of {key} must be strings or numbers")
+        items.append((key.strip().upper(), tuple(sorted({_clean_value(v) for v in values}))))
+    return tuple(sorted(items))
+
+
+class FacetIndex:
+    def __init__(self, columns: Dict[str, List[str]], rows: int):
+        self.rows = rows
+        self.values: Dict[str, List[str]] = {}          # 列 -> 取值表
+        self.codes: Dict[str, np.ndarray] = {}          # 列 -> 每行取值编码
+        self.value_ids: Dict[str, Dict[str, int]] = {}  # 列 -> 取值 -> 编码
+        self.bitmaps: Dict[str, List[np.ndarray]] = {}  # 列 -> 每个取值的压缩位图
+
+        for name, column in columns.items():
+            value_ids: Dict[str, int] = {}
+            codes = np.fromiter(
+                (value_ids.setdefault(_clean_value(v), len(value_ids)) for v in column),
+                dtype=np.int32, count=rows
+            )
+            self.value_ids[name] = value_ids
+            self.values[name] = list(value_ids)
+            self.codes[name] = codes
+            if len(value_ids) <= BITMAP_MAX_VALUES:
+                self.bitmaps[name] = [np.packbits(codes == i) for i in range(len(value_ids))]
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.codes)
+
+    def value_counts(self, column: str) -> Dict[str, int]:
+        counts = np.bincount(self.codes[column], minlength=len(self.values[column]))
+        return dict(zip(self.values[column], counts.tolist()))
+
+    def _column_mask(self, column: str, values: tuple) -> np.ndarray:
+        ids = [self.value_ids[column][v] for v in values if v in self.value_ids[column]]
+        if not ids:
+            return np.zeros(self.rows, dtype=bool)
+        if column in self.bitmaps:
+            packed = self.bitmaps[column][ids[0]]
+            for i in ids[1:]:
+                packed = packed | self.bitmaps[column][i]
+            return np.unpackbits(packed, count=self.rows).astype(bool)
+        return np.isin(self.codes[column], ids)
+
+    def mask(self, filters: tuple) -> Optional[np.ndarray]:
+        """
+        filters 为 normalize_filters 的结果；返回布尔掩码，无条件时返回 None。
+        未知列抛出 KeyError（由调用方转换为错误信息）。
+        """
+        if not filters:
+            return None
+        result = None
+        for column, values in filters:
+            if column not in self.codes:
+                raise KeyError(column)
+            m = self._column_mask(column, values)
+            result = m if result is None else (result & m)
+        return result
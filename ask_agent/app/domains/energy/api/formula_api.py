@@ -1,20 +1,32 @@
 # app/domains/energy/api/formula_api.py
 import re
+import copy
 import logging
 import os
-import pickle
-from typing import List, Optional
-import pandas as pd
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional
 import numpy as np
-import jieba
-import torch
 import time
 
-from fastapi import FastAPI, Query
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
 from rapidfuzz import process, fuzz
 from ..utils import normalize_symbol_in_string
+from .vector_index import build_vector_index, search_batch, search_subset
+from .facet_index import FACET_COLUMNS, FacetIndex, parse_filters, normalize_filters
+from .query_cache import LRUCache
+from .combo_matcher import ComboMatcher
+from .typo_index import TypoIndex
+from .search_executor import SearchExecutor
+from .embedding_store import (
+    file_sha256, embedding_row_key, load_embeddings, load_embedding_rows, merge_embeddings, save_embeddings,
+    load_tokens, save_tokens
+)
+
+# pandas / jieba / sentence-transformers / onnxruntime 都在首次使用时才导入，模块导入保持轻量
+if TYPE_CHECKING:
+    import pandas as pd
 
 # ================= 日志配置 =================
 logger = logging.getLogger("domains.energy.api.formula_api")
@@ -24,25 +36,30 @@ if not logger.handlers:
         format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
     )
 
-
-# ================= FastAPI 初始化 =================
-app = FastAPI(title="Formula Query API - Jieba + Semantic (weighted hybrid)")
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"]
-)
-
 from config import (
-    EMBEDDING_CACHE_NAME, FORMULA_CSV_NAME, COMBINE_WEIGHT_LIST, ENABLE_REMOVE_SYMBOLS, ENABLE_TEXT_SCORE_WEIGHT
+    EMBEDDING_CACHE_NAME, FORMULA_CSV_NAME, COMBINE_WEIGHT_LIST, ENABLE_REMOVE_SYMBOLS, ENABLE_TEXT_SCORE_WEIGHT,
+    VECTOR_INDEX_TYPE, VECTOR_INDEX_NLIST, VECTOR_INDEX_NPROBE, VECTOR_INDEX_EVALUATE, EMBEDDING_QUANTIZATION, EMBEDDING_RERANK_TOPK,
+    QUERY_EMBEDDING_CACHE_SIZE, FORMULA_RESULT_CACHE_SIZE, TOKENIZE_WORKERS,
+    EMBEDDING_BACKEND, EMBEDDING_ONNX_FILE, EMBEDDING_ONNX_THREADS, FORMULA_DEFAULT_FILTERS,
+    FORMULA_TYPO_TOLERANCE, FORMULA_TYPO_MAX_DISTANCE, FORMULA_SEARCH_WORKERS, FORMULA_SEARCH_EXECUTOR,
+    FORMULA_INIT_RETRY_BASE_SEC, FORMULA_INIT_RETRY_MAX_SEC
 )
 
-try:
-    from sentence_transformers import SentenceTransformer
-    HAVE_ST = True
-    print(f"✅ sentence-transformers 版本: 5.1.1")
-except Exception as e:
-    HAVE_ST = False
-    print(f"❌ sentence-transformers 导入失败: {e}")
+SentenceTransformer = None
+HAVE_ST = False
+
+
+def _import_sentence_transformers() -> bool:
+    """导入 sentence-transformers（会连带导入 torch，耗时数秒）"""
+    global SentenceTransformer, HAVE_ST
+    try:
+        from sentence_transformers import SentenceTransformer
+        HAVE_ST = True
+        print(f"✅ sentence-transformers 版本: 5.1.1")
+    except Exception as e:
+        HAVE_ST = False
+        print(f"❌ sentence-transformers 导入失败: {e}")
+    return HAVE_ST
 
 # ================= 全局路径配置 =================
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -53,6 +70,11 @@ MODELS_DIR = os.path.join(PROJECT_ROOT, "models", "sbert_offline_models")
 
 EMBEDDING_CACHE_PATH = os.path.join(DATA_DIR, EMBEDDING_CACHE_NAME)
 FORMULA_CSV_PATH = os.path.join(DATA_DIR, FORMULA_CSV_NAME)
+# IVF 近似索引与嵌入缓存放在一起
+VECTOR_INDEX_PATH = os.path.splitext(EMBEDDING_CACHE_PATH)[0] + ".ivf.npz"
+
+# ---- 目录预处理（分词）----
+TOKENIZE_PARALLEL_MIN_ROWS = 20000            # 少于该行数时进程池开销大于收益，串行分词
 
 # ---- 离线模型优先路径 ----
 OFFLINE_MODEL_PATH = os.path.join(MODELS_DIR, "86741b4e3f5cb7765a600d3a3d55a0f6a6cb443d")
@@ -65,13 +87,16 @@ ENV_EMBEDDING_DEVICE = os.environ.get("EMBEDDING_DEVICE", "").lower()
 
 
 # ================= 全局变量 =================
-df: Optional[pd.DataFrame] = None
-_formulanames_raw: List[str] = []
-_formulanames_clean: List[str] = []
-_formulanames_tokens: List[str] = []
-_embeddings: Optional[np.ndarray] = None
 _embedding_model = None
+_embedding_model_id = ""   # 当前模型标识（写入嵌入 manifest）
+_catalog: Optional["FormulaCatalog"] = None   # 当前公式目录快照，热更新时整体替换
+_reload_lock = threading.Lock()                # 同一时间只允许一个重载任务
+_query_embedding_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE, name="query_embedding")  # 输入文本 -> 查询向量
+_result_cache = LRUCache(FORMULA_RESULT_CACHE_SIZE, name="formula_result")  # (快照版本, 输入, topn, method) -> 结果
+_default_filters = parse_filters(FORMULA_DEFAULT_FILTERS)  # 未显式传 filters 时使用，例如 ISLATEST=1
+_search_executor: Optional[SearchExecutor] = None   # 公式检索专用执行器（线程池 / fork 进程池）
 _initialized = False  # ✅ 防止重复初始化
+_init_error: Optional[str] = None   # 后台初始化最近一次失败原因（成功后清空）
 
 
 # ===========================================================
@@ -87,9 +112,15 @@ def normalize_text(s: str) -> str:
     return s
 
 
+def strip_quotes(s) -> str:
+    """去掉首尾空白与引号（CSV quoting=3 读入时会保留引号）"""
+    return str(s).strip().strip('"').strip("'")
+
+
 def tokens_by_jieba(s: str) -> str:
     if not s:
         return ""
+    import jieba
     segs = jieba.cut(s, cut_all=False)
     return " ".join([t for t in segs if t.strip()])
 
@@ -100,6 +131,91 @@ def l2_normalize_matrix(mat: np.ndarray) -> np.ndarray:
     return mat / norms
 
 
+def build_name_indexes(names_raw: List[str], names_clean: List[str]):
+    """
+    构建精确匹配用的哈希索引：
+    - 去引号原始名称 -> 所有行号（保持 CSV 顺序）
+    - normalize_text 名称 -> 第一个行号
+    """
+    name_to_rows: Dict[str, List[int]] = {}
+    clean_name_to_row: Dict[str, int] = {}
+    for i, (raw, clean) in enumerate(zip(names_raw, names_clean)):
+        name_to_rows.setdefault(strip_quotes(raw), []).append(i)
+        clean_name_to_row.setdefault(clean, i)
+    return name_to_rows, clean_name_to_row
+
+
+def build_formulaid_index(formula_ids: List[str]) -> Dict[str, int]:
+    """FORMULAID -> 第一个行号，替代 df["FORMULAID"] == id 的整列扫描"""
+    formulaid_to_row: Dict[str, int] = {}
+    for i, fid in enumerate(formula_ids):
+        formulaid_to_row.setdefault(fid, i)
+    return formulaid_to_row
+
+
+def _preprocess_chunk(names: List[str]):
+    """进程池任务：一批名称的 normalize_text + jieba 分词"""
+    cleans = [normalize_text(s) for s in names]
+    return cleans, [tokens_by_jieba(s) for s in cleans]
+
+
+def preprocess_names(names_raw: List[str]):
+    """
+    目录预处理：返回 (names_clean, names_tokens)。
+    行数较多时按块分发到进程池（fork 启动，子进程继承已加载的 jieba 词典），否则串行执行。
+    """
+    workers = TOKENIZE_WORKERS or min(os.cpu_count() or 1, 8)
+    if workers <= 1 or len(names_raw) < TOKENIZE_PARALLEL_MIN_ROWS \
+            or "fork" not in multiprocessing.get_all_start_methods():
+        return _preprocess_chunk(names_raw)
+
+    chunk = -(-len(names_raw) // (workers * 4))
+    chunks = [names_raw[i:i + chunk] for i in range(0, len(names_raw), chunk)]
+    names_clean, names_tokens = [], []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+            for cleans, tokens in pool.map(_preprocess_chunk, chunks):   # map 保持块顺序
+                names_clean.extend(cleans)
+                names_tokens.extend(tokens)
+    except Exception as e:
+        logger.warning(f"⚠️ 并行分词失败，回退串行: {e}")
+        return _preprocess_chunk(names_raw)
+    logger.info(f"✅ 并行分词完成：{len(names_raw)} 行 / {len(chunks)} 块 / {workers} 进程")
+    return names_clean, names_tokens
+
+
+def index_terms(clean: str, tokens: str) -> set:
+    """
+    倒排索引的检索词：normalize_text 后每段的字二元组（单字段保留单字）+ jieba 分词
+    例如 "1 高炉工序能耗" -> {"1", "高炉", "炉工", "工序", ..., "工序", "能耗"}
+    """
+    terms = set()
+    for seg in clean.lower().split():
+        if len(seg) == 1:
+            terms.add(seg)
+        else:
+            terms.update(seg[i:i + 2] for i in range(len(seg) - 1))
+    terms.update(tokens.lower().split())
+    return terms
+
+
+def build_ngram_index(names_clean: List[str], names_tokens: List[str]) -> Dict[str, np.ndarray]:
+    """检索词 -> 包含该词的行号数组（升序），用于 fuzzy_search 预筛选"""
+    postings: Dict[str, List[int]] = {}
+    for i, (clean, tokens) in enumerate(zip(names_clean, names_tokens)):
+        for term in index_terms(clean, tokens):
+            postings.setdefault(term, []).append(i)
+    return {term: np.asarray(rows, dtype=np.int32) for term, rows in postings.items()}
+
+
+def shortlist_rows(ngram_index: Dict[str, np.ndarray], clean: str, tokens: str) -> np.ndarray:
+    """与查询至少共享一个检索词的行号（升序去重）"""
+    hits = [ngram_index[t] for t in index_terms(clean, tokens) if t in ngram_index]
+    if not hits:
+        return np.empty(0, dtype=np.int32)
+    return np.unique(np.concatenate(hits))
+
+
 def select_embedding_device() -> str:
     """自动选择设备（优先环境变量）"""
     device = "cpu"
@@ -107,6 +223,7 @@ def select_embedding_device() -> str:
         device = ENV_EMBEDDING_DEVICE
         logger.info(f"Using embedding device from environment: {device}")
     else:
+        import torch
         if torch.cuda.is_available():
             device = "cuda"
         elif hasattr(torch.backends, "mps") and torch.backends.mps.is_available():
@@ -118,147 +235,511 @@ def select_embedding_device() -> str:
 # ===========================
 # 1️⃣ apply_combine_weights
 # ===========================
-def apply_combine_weights(formula_name: str, base_score: float, user_input: str = "") -> float:
+_COMBO_MATCHER = ComboMatcher(COMBINE_WEIGHT_LIST)   # 组合 term 预编译为 Aho-Corasick 自动机
+
+
+def apply_combine_weights(formula_name: str, base_score: float, user_input: str = "",
+                          formula_mask: Optional[int] = None, user_mask: Optional[int] = None) -> float:
     """
     根据 COMBINE_WEIGHT_LIST 动态提升分数：
     - 如果 formula_name 包含某组合的所有 terms
     - 且用户输入没有完全包含该组合
-    - 按 weight 提升 base_score
+    - 按 weight 提升 base_score（高权重组合优先相乘）
+    formula_mask / user_mask 为预先算好的组合命中位图（目录加载时 / 每次查询一次），
+    传入后只需查表；未传入时现场计算。
     """
     weighted = float(base_score)
-    formula_text = str(formula_name or "")
-    user_text = str(user_input or "")
 
     if not ENABLE_TEXT_SCORE_WEIGHT or base_score <= 0:
         return weighted
 
-    # 按 weight 降序遍历组合，保证高权重优先
-    combos = sorted(COMBINE_WEIGHT_LIST, key=lambda c: c.get("weight", 0), reverse=True)
+    if formula_mask is None:
+        formula_mask = _COMBO_MATCHER.mask(formula_name)
+    if user_mask is None:
+        user_mask = _COMBO_MATCHER.mask(user_input)
 
-    for combo in combos:
-        terms = combo.get("terms", [])
-        weight = float(combo.get("weight", 0.0))
-        if not terms:
-            continue
-
-        # formula_name 是否包含该组合所有 term
-        if all(term in formula_text for term in terms):
-            # 用户输入是否已包含该组合
-            if not all(term in user_text for term in terms):
-                # 加权提升
-                weighted *= (1.0 + weight)
+    for multiplier in _COMBO_MATCHER.factors(formula_mask, user_mask):
+        # 加权提升
+        weighted *= multiplier
 
     return weighted
 
 
 # ===========================================================
-# 初始化函数（核心改动）
+# 公式目录快照
 # ===========================================================
-def initialize():
-    """初始化公式数据与嵌入，只执行一次"""
-    global df, _formulanames_raw, _formulanames_clean, _formulanames_tokens
-    global _embedding_model, _embeddings, HAVE_ST, _initialized
+def _validate_default_filters(facets: FacetIndex) -> dict:
+    """
+    FORMULA_DEFAULT_FILTERS 在构建快照时校验一次：CSV 中不存在的列直接丢弃并告警，
+    避免每次未传 filters 的查询都返回 Unknown filter
+    """
+    unknown = [c for c in _default_filters if c not in facets.columns]
+    if unknown:
+        logger.warning(f"⚠️ FORMULA_DEFAULT_FILTERS 中的列 {unknown} 不在公式 CSV 中，已忽略")
+    return {c: v for c, v in _default_filters.items() if c in facets.columns}
 
-    # ✅ 避免重复加载（从 main.py 导入不会执行第二次）
-    if _initialized:
-        logger.info("✅ formula_api 已初始化，跳过重复加载。")
+
+class FormulaCatalog:
+    """
+    公式目录快照：一次加载得到的 DataFrame、分词结果、精确匹配索引、嵌入与向量索引。
+    - 构建完成后视为不可变，不要修改其中的字段
+    - 热更新时在后台线程构建新快照，再整体替换模块级引用 _catalog
+    - 查询开始时取一次 _catalog 引用并全程使用，进行中的查询不受替换影响
+    """
+
+    def __init__(self, df: "pd.DataFrame", names_raw: List[str], names_clean: List[str], names_tokens: List[str],
+                 embeddings: Optional[np.ndarray] = None, vector_index=None,
+                 csv_hash: str = "", csv_stat: tuple = (0.0, 0), version: int = 1,
+                 facets: Optional[FacetIndex] = None):
+        self.df = df
+        self.formula_ids: List[str] = df["FORMULAID"].tolist()
+        self.names_raw = names_raw
+        self.names_clean = names_clean
+        self.names_tokens = names_tokens
+        self.names_display: List[str] = [strip_quotes(s) for s in names_raw]   # 去引号名称，直接用于返回
+        # 精确匹配哈希索引（替代逐次全表扫描）
+        self.name_to_rows, self.clean_name_to_row = build_name_indexes(names_raw, names_clean)
+        self.formulaid_to_row = build_formulaid_index(self.formula_ids)
+        self.ngram_index = build_ngram_index(names_clean, names_tokens)   # fuzzy_search 预筛选倒排索引
+        # 错别字 / 拼音容错索引（查询纠错，见 typo_index.py）
+        self.typo_index = TypoIndex(names_tokens, FORMULA_TYPO_MAX_DISTANCE) if FORMULA_TYPO_TOLERANCE else None
+        self.combo_masks: List[int] = [_COMBO_MATCHER.mask(s) for s in self.names_display]   # 组合权重命中位图
+        self.facets = facets if facets is not None else FacetIndex({}, len(df))   # 元数据分面（列式 + 位图）
+        self.default_filters = _validate_default_filters(self.facets)   # 未显式传 filters 时使用
+        self.embeddings = embeddings
+        self.vector_index = vector_index   # FlatIndex / IVFIndex / QuantizedFlatIndex，见 vector_index.py
+        self.csv_hash = csv_hash
+        self.csv_stat = csv_stat           # (mtime, size)，供文件监听判断是否变化
+        self.version = version
+        self.loaded_at = time.time()
+
+    @property
+    def size(self) -> int:
+        return len(self.formula_ids)
+
+
+def _load_embedding_model():
+    """加载嵌入模型（进程内只加载一次，目录重载时复用）"""
+    global _embedding_model, _embedding_model_id
+
+    _query_embedding_cache.clear()   # 缓存的查询向量只对当前模型有效
+
+    if EMBEDDING_BACKEND == "onnx":
+        try:
+            from .onnx_embedder import OnnxSentenceEncoder
+            # ✅ ONNX Runtime（CPU）：与 SentenceTransformer 输出相同，模型 id 不变，嵌入缓存继续有效
+            _embedding_model = OnnxSentenceEncoder(OFFLINE_MODEL_PATH, EMBEDDING_ONNX_FILE, EMBEDDING_ONNX_THREADS)
+            _embedding_model_id = os.path.basename(OFFLINE_MODEL_PATH)
+            logger.info("✅ 已加载 ONNX 嵌入模型。")
+            return
+        except Exception as e:
+            logger.warning(f"⚠️ ONNX 嵌入模型加载失败，回退到 sentence-transformers。错误: {e}")
+
+    # ONNX 后端不需要 torch，只有使用 torch 后端或回退时才导入
+    if SentenceTransformer is None:
+        _import_sentence_transformers()
+    print(f"HAVE_ST : {HAVE_ST}")
+    if not HAVE_ST:
+        logger.warning("⚠️ sentence-transformers not installed — semantic mode DISABLED.")
+        _embedding_model = None
         return
 
+    device = select_embedding_device()
+    try:
+        # ✅ 优先加载本地模型
+        print(f"OFFLINE_MODEL_PATH:{OFFLINE_MODEL_PATH}") 
+        if os.path.exists(OFFLINE_MODEL_PATH):
+            logger.info(f"🧩 尝试加载本地模型: {OFFLINE_MODEL_PATH}")
+            _embedding_model = SentenceTransformer(OFFLINE_MODEL_PATH, device=device)
+            _embedding_model_id = os.path.basename(OFFLINE_MODEL_PATH)
+            logger.info("✅ 已成功加载离线模型。")
+        else:
+            logger.warning("⚠️ 离线模型未找到，使用默认在线模型。")
+            _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+            _embedding_model_id = EMBEDDING_MODEL_NAME
+            logger.info("✅ 已加载在线模型。")
+    except Exception as e:
+        logger.warning(f"⚠️ 本地模型加载失败，回退到在线模型。错误: {e}")
+        _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+        _embedding_model_id = EMBEDDING_MODEL_NAME
+        logger.info("✅ 已加载在线模型。")
+
+
+def build_catalog(version: int = 1) -> FormulaCatalog:
+    """从 FORMULA_CSV_PATH 构建一份完整的新快照（不修改当前 _catalog）"""
     start_time = time.time()
-    logger.info("🔄 正在初始化公式数据（full load）...")
 
     # ---- 加载 CSV ----
     if not os.path.exists(FORMULA_CSV_PATH):
         raise RuntimeError(f"⚠️ 找不到公式数据文件: {os.path.abspath(FORMULA_CSV_PATH)}")
 
+    import pandas as pd
+    import jieba
+    tokenizer_id = f"jieba-{jieba.__version__}"   # 写入分词缓存，jieba 升级后缓存失效
+
     try:
+        st = os.stat(FORMULA_CSV_PATH)
+        csv_hash = file_sha256(FORMULA_CSV_PATH)
         df = pd.read_csv(FORMULA_CSV_PATH, dtype=str, quoting=3, engine="python", on_bad_lines="skip")
         df.columns = [c.strip().replace('"', '') for c in df.columns]
         if not {"FORMULAID", "FORMULANAME"}.issubset(df.columns):
             raise RuntimeError(f"CSV 缺少必要列: {list(df.columns)}")
+        # 元数据列只保留为列式编码 + 位图，DataFrame 仍只保留 ID / 名称
+        facet_columns = [c for c in FACET_COLUMNS if c in df.columns]
+        facets = FacetIndex({c: df[c].fillna("").tolist() for c in facet_columns}, len(df))
         df = df[["FORMULAID", "FORMULANAME"]].fillna("")
-        _formulanames_raw = df["FORMULANAME"].astype(str).tolist()
-        _formulanames_clean = [normalize_text(s) for s in _formulanames_raw]
-        _formulanames_tokens = [tokens_by_jieba(s) for s in _formulanames_clean]
-        _ = list(jieba.cut("测试"))  # 触发 jieba 初始化
-        logger.info(f"✅ Loaded {len(df)} formulas. Tokenization ready.")
+        names_raw = df["FORMULANAME"].astype(str).tolist()
+        cached_tokens = load_tokens(EMBEDDING_CACHE_PATH, csv_hash, len(names_raw), tokenizer_id)
+        if cached_tokens is not None:
+            names_clean, names_tokens = cached_tokens
+            # 分词结果来自缓存，jieba 词典放到后台加载，不阻塞启动
+            threading.Thread(target=jieba.initialize, name="jieba-warmup", daemon=True).start()
+            logger.info(f"✅ Loaded {len(df)} formulas. Tokenization loaded from cache.")
+        else:
+            _ = list(jieba.cut("测试"))  # 触发 jieba 初始化（fork 出的子进程直接继承词典）
+            names_clean, names_tokens = preprocess_names(names_raw)
+            try:
+                save_tokens(EMBEDDING_CACHE_PATH, csv_hash, tokenizer_id, names_clean, names_tokens)
+            except OSError as e:
+                # 分词缓存只用于加速下次启动，写入失败不影响本次构建
+                logger.warning(f"⚠️ 分词缓存写入失败，下次启动将重新分词: {e}")
+            logger.info(f"✅ Loaded {len(df)} formulas. Tokenization ready.")
     except Exception as e:
         logger.exception("❌ Failed to load CSV")
         raise RuntimeError(f"Failed to load CSV: {e}")
-    
-    print(f"HAVE_ST : {HAVE_ST}")
-    # ---- 尝试加载嵌入模型 ----
-    if HAVE_ST:
-        device = select_embedding_device()
-        try:
-            # ✅ 优先加载本地模型
-            print(f"OFFLINE_MODEL_PATH:{OFFLINE_MODEL_PATH}") 
-            if os.path.exists(OFFLINE_MODEL_PATH):
-                logger.info(f"🧩 尝试加载本地模型: {OFFLINE_MODEL_PATH}")
-                _embedding_model = SentenceTransformer(OFFLINE_MODEL_PATH, device=device)
-                logger.info("✅ 已成功加载离线模型。")
-            else:
-                logger.warning("⚠️ 离线模型未找到，使用默认在线模型。")
-                _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
-                logger.info("✅ 已加载在线模型。")
-        except Exception as e:
-            logger.warning(f"⚠️ 本地模型加载失败，回退到在线模型。错误: {e}")
-            _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
-            logger.info("✅ 已加载在线模型。")
 
-        # ---- 加载或生成嵌入缓存 ----
-        if os.path.exists(EMBEDDING_CACHE_PATH):
-            with open(EMBEDDING_CACHE_PATH, "rb") as f:
-                cached_data = pickle.load(f)
-            if cached_data.get("formula_count") == len(_formulanames_raw):
-                _embeddings = cached_data["embeddings"]
-                logger.info(f"✅ Loaded embeddings from cache ({_embeddings.shape})")
-            else:
-                logger.warning("⚠️ Embedding cache formula count mismatch, recalculating...")
-                _embeddings = _compute_and_cache_embeddings()
+    # ---- 加载（mmap）或增量生成嵌入，并构建向量索引 ----
+    embeddings, vector_index = None, None
+    if _embedding_model is not None:
+        formula_ids = df["FORMULAID"].tolist()
+        embeddings = load_embeddings(EMBEDDING_CACHE_PATH, len(names_raw), _embedding_model_id, csv_hash)
+        if embeddings is not None:
+            logger.info(f"✅ Loaded embeddings from cache (mmap, {embeddings.shape})")
         else:
-            _embeddings = _compute_and_cache_embeddings()
-    else:
-        logger.warning("⚠️ sentence-transformers not installed — semantic mode DISABLED.")
-        _embedding_model = None
-        _embeddings = None
+            embeddings = _compute_and_cache_embeddings(formula_ids, names_raw, names_clean, csv_hash)
+
+        vector_index = build_vector_index(
+            embeddings, VECTOR_INDEX_TYPE, VECTOR_INDEX_PATH, VECTOR_INDEX_NLIST, VECTOR_INDEX_NPROBE,
+            quantization=EMBEDDING_QUANTIZATION, rerank=EMBEDDING_RERANK_TOPK, evaluate=VECTOR_INDEX_EVALUATE
+        )
+
+    catalog = FormulaCatalog(
+        df, names_raw, names_clean, names_tokens, embeddings, vector_index,
+        csv_hash=csv_hash, csv_stat=(st.st_mtime, st.st_size), version=version, facets=facets
+    )
+    logger.info(f"✅ 公式目录快照 v{version} 构建完成 ({catalog.size} rows)，用时 {time.time() - start_time:.2f}s")
+    return catalog
+
+
+# ===========================================================
+# 初始化函数（核心改动）
+# ===========================================================
+def initialize(background: bool = False):
+    """
+    初始化公式数据与嵌入，只执行一次。
+    background=True 时立即返回，在后台线程中先构建仅支持 fuzzy 的快照，
+    模型加载完成后再切换到带嵌入的快照（期间 semantic / hybrid 自动回退 fuzzy）。
+    """
+    global _catalog, _initialized
+
+    # ✅ 避免重复加载（从 main.py 导入不会执行第二次）
+    if _initialized:
+        logger.info("✅ formula_api 已初始化，跳过重复加载。")
+        return
+
+    if background:
+        _initialized = True
+        threading.Thread(target=_initialize_in_background, name="formula-init", daemon=True).start()
+        logger.info("🔄 公式数据与嵌入模型将在后台加载...")
+        return
+
+    start_time = time.time()
+    logger.info("🔄 正在初始化公式数据（full load）...")
+
+    if not os.path.exists(FORMULA_CSV_PATH):
+        raise RuntimeError(f"⚠️ 找不到公式数据文件: {os.path.abspath(FORMULA_CSV_PATH)}")
+
+    _load_embedding_model()
+    _catalog = build_catalog(version=1)
 
     _initialized = True
     logger.info(f"✅ 初始化完成，用时 {time.time() - start_time:.2f}s")
 
 
-def _compute_and_cache_embeddings():
-    """重新计算并缓存嵌入"""
-    logger.info("🔄 Computing new embeddings...")
+def _initialize_in_background():
+    """
+    后台初始化：公式目录构建失败（CSV 暂不可读等）时按指数退避重试，直到成功；
+    就绪前 catalog_info()["initialized"] 为 False，/health 报告未就绪
+    """
+    global _catalog, _init_error
+
+    start_time = time.time()
+    delay = FORMULA_INIT_RETRY_BASE_SEC
+    while True:
+        try:
+            with _reload_lock:
+                _catalog = build_catalog(version=1)   # 此时模型尚未加载，只提供精确 / fuzzy 匹配
+            _init_error = None
+            break
+        except Exception as e:
+            _init_error = str(e)
+            logger.exception(f"❌ 后台构建公式目录失败，{delay:.0f}s 后重试: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, FORMULA_INIT_RETRY_MAX_SEC)
+    logger.info(f"✅ 公式目录已就绪（fuzzy），用时 {time.time() - start_time:.2f}s")
+
+    try:
+        _load_embedding_model()
+        if _embedding_model is not None:
+            reload_catalog(force=True, wait=True)
+        logger.info(f"✅ 后台初始化完成，用时 {time.time() - start_time:.2f}s")
+    except Exception as e:
+        logger.exception(f"❌ 后台加载嵌入模型失败，继续只提供精确 / fuzzy 匹配: {e}")
+
+
+def _encode_names(names: List[str]) -> np.ndarray:
     emb_list = _embedding_model.encode(
-        _formulanames_raw, batch_size=64, show_progress_bar=True, convert_to_numpy=True
+        names, batch_size=64, show_progress_bar=len(names) > 256, convert_to_numpy=True
     )
-    embeddings = l2_normalize_matrix(np.asarray(emb_list, dtype=np.float32))
-    with open(EMBEDDING_CACHE_PATH, "wb") as f:
-        pickle.dump({"formula_count": len(_formulanames_raw), "embeddings": embeddings}, f)
-    logger.info(f"✅ Cached new embeddings ({embeddings.shape})")
-    return embeddings
+    return l2_normalize_matrix(np.asarray(emb_list, dtype=np.float32))
+
+
+def encode_query(user_input: str) -> np.ndarray:
+    """
+    查询向量（已 L2 归一化），前置 LRU 缓存：
+    同一指标在 compare / list_query / analysis 中反复解析时跳过模型前向计算
+    """
+    return encode_queries([user_input])[0]
+
+
+def encode_queries(user_inputs: List[str]) -> np.ndarray:
+    """批量查询向量 (B, d)：先查 LRU，未命中的文本合并为一次 encode 调用"""
+    keys = [s.strip() for s in user_inputs]
+    vecs = [_query_embedding_cache.get(k) for k in keys]
+    missing = list(dict.fromkeys(k for k, v in zip(keys, vecs) if v is None))
+    if missing:
+        fresh = {}
+        for k, vec in zip(missing, _encode_names(missing)):
+            vec.flags.writeable = False   # 缓存共享同一数组，禁止调用方原地修改
+            _query_embedding_cache.put(k, vec)
+            fresh[k] = vec
+        vecs = [v if v is not None else fresh[k] for k, v in zip(keys, vecs)]
+    return np.stack(vecs)
+
+
+def query_embedding_cache_stats() -> dict:
+    return _query_embedding_cache.stats()
+
+
+def _compute_and_cache_embeddings(formula_ids: List[str], names_raw: List[str], names_clean: List[str], csv_hash: str):
+    """
+    增量计算并缓存嵌入：
+    - 按 (FORMULAID, 名称哈希) 行键复用旧缓存中的向量
+    - 只对新增 / 改名的公式调用 encode，已删除的公式丢弃
+    """
+    keys = [embedding_row_key(fid, clean) for fid, clean in zip(formula_ids, names_clean)]
+    old = load_embedding_rows(EMBEDDING_CACHE_PATH, _embedding_model_id)
+    logger.info(f"🔄 Refreshing embeddings ({'incremental' if old else 'full'})...")
+    embeddings, stats = merge_embeddings(keys, names_raw, old, _encode_names)
+    try:
+        save_embeddings(EMBEDDING_CACHE_PATH, embeddings, keys, _embedding_model_id, csv_hash)
+    except OSError as e:
+        # 缓存写入失败时直接使用内存中的嵌入，下次构建重新计算
+        logger.warning(f"⚠️ 嵌入缓存写入失败，本次使用内存中的嵌入: {e}")
+        return embeddings
+    logger.info(
+        f"✅ Cached new embeddings ({embeddings.shape}): reused={stats['reused']}, "
+        f"encoded={stats['encoded']}, dropped={stats['dropped']}"
+    )
+    # 重新以 mmap 打开，释放进程内的私有副本（量化模式下 float32 只在精排时按页读取）
+    mapped = load_embeddings(EMBEDDING_CACHE_PATH, len(names_raw), _embedding_model_id, csv_hash)
+    return mapped if mapped is not None else embeddings
+
+
+# ===========================================================
+# 热更新：后台构建新快照并原子替换
+# ===========================================================
+def reload_catalog(force: bool = False, wait: bool = False) -> bool:
+    """
+    同步重建公式目录快照并替换 _catalog：
+    - CSV 内容哈希未变化且非 force 时跳过
+    - 构建失败时保留旧快照继续服务
+    - wait=False 时若已有重载在进行则直接返回
+    返回是否完成了替换
+    """
+    global _catalog
+
+    if not _reload_lock.acquire(blocking=wait):
+        logger.info("⏳ 公式目录正在重载，忽略本次请求。")
+        return False
+    try:
+        old = _catalog
+        if old is not None and not force and file_sha256(FORMULA_CSV_PATH) == old.csv_hash:
+            logger.info("✅ 公式 CSV 未变化，跳过重载。")
+            return False
+
+        new = build_catalog(version=(old.version + 1) if old else 1)
+        _catalog = new  # 引用赋值是原子的，进行中的查询继续使用旧快照
+        _result_cache.clear()
+        logger.info(f"🔁 公式目录已切换到快照 v{new.version} ({new.size} rows)")
+        return True
+    except Exception as e:
+        logger.exception(f"❌ 公式目录重载失败，继续使用旧快照: {e}")
+        return False
+    finally:
+        _reload_lock.release()
+
+
+def start_background_reload(force: bool = False) -> bool:
+    """在后台线程中执行 reload_catalog；已有重载在进行时返回 False"""
+    if _reload_lock.locked():
+        return False
+    threading.Thread(
+        target=reload_catalog, kwargs={"force": force}, name="formula-catalog-reload", daemon=True
+    ).start()
+    return True
+
+
+def catalog_info() -> dict:
+    """当前快照概要（管理接口使用）"""
+    cat = _catalog
+    return {
+        "initialized": cat is not None,
+        "init_error": _init_error,
+        "version": cat.version if cat else 0,
+        "rows": cat.size if cat else 0,
+        "csv_hash": cat.csv_hash if cat else "",
+        "loaded_at": cat.loaded_at if cat else None,
+        "semantic_ready": bool(cat and cat.vector_index is not None),
+        "facets": cat.facets.columns if cat else [],
+        "reloading": _reload_lock.locked(),
+        # 进程模式下查询向量在子进程中编码，各子进程的向量缓存主进程不可见
+        "query_embedding_cache": _query_embedding_cache.stats() if _search_executor is None or _search_executor.mode != "process"
+        else {"name": "query_embedding", "scope": "per-worker process, not reported"},
+        "result_cache": _result_cache.stats(),
+        "search_executor": _search_executor.stats() if _search_executor else None,
+    }
+
+
+async def watch_catalog_task(interval_sec: int = 60):
+    """
+    轮询公式 CSV 的 (mtime, size)，变化时在线程中重建快照。
+    与 persist_all_graphs_task 一样在 startup 中 create_task 启动。
+    """
+    last_stat = _catalog.csv_stat if _catalog else None
+    while True:
+        await asyncio.sleep(interval_sec)
+        try:
+            st = os.stat(FORMULA_CSV_PATH)
+            current = (st.st_mtime, st.st_size)
+            if current != last_stat:
+                logger.info("📂 检测到公式 CSV 变化，开始后台重载...")
+                await asyncio.to_thread(reload_catalog)
+                last_stat = current
+        except Exception as e:
+            logger.warning(f"⚠️ 公式 CSV 监听异常: {e}")
+
+
+# ===========================================================
+# 检索执行器
+# ===========================================================
+def _search_worker_init():
+    """
+    检索子进程初始化：
+    - 每个进程只用一个计算线程，避免 进程数 × 核数 的线程争用
+    - 关闭子进程内的结果缓存：进程模式下结果缓存由主进程的 *_async 入口统一读写，
+      各子进程的副本互不共享，命中率也不会出现在 catalog_info 中
+    """
+    import sys
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(1)
+    _result_cache.maxsize = 0
+    _result_cache.clear()
+
+
+def _prepare_search_fork():
+    """fork 前确保 jieba 词典已加载完成（后台预热线程持有 jieba 的锁时 fork，子进程分词会永久阻塞）"""
+    import jieba
+    jieba.initialize()
+
+
+def get_search_executor() -> SearchExecutor:
+    """返回全局检索执行器（首次调用时创建）"""
+    global _search_executor
+    if _search_executor is None:
+        workers = FORMULA_SEARCH_WORKERS or min(os.cpu_count() or 1, 4)
+        _search_executor = SearchExecutor(
+            workers, FORMULA_SEARCH_EXECUTOR,
+            generation=lambda: _catalog.version if _catalog else 0,
+            initializer=_search_worker_init,
+            prepare=_prepare_search_fork,
+        )
+        logger.info(f"✅ 公式检索执行器已创建（{_search_executor.mode}，{workers} workers）")
+    return _search_executor
+
+
+def shutdown_search_executor():
+    global _search_executor
+    if _search_executor is not None:
+        _search_executor.shutdown()
+        _search_executor = None
 
 
 # ===========================
 # 2️⃣ fuzzy_search
 # ===========================
-def fuzzy_search(user_input: str, topn: int = 5):
+TYPO_SCORE_FACTOR = 0.9   # 纠错候选的 fuzzy 分打折（再乘以纠错质量），拼写正确的匹配优先
+
+
+def _fuzzy_extract(cat: FormulaCatalog, key_clean: str, key_tokens: str, limit: int,
+                   row_mask: Optional[np.ndarray] = None) -> List[tuple]:
+    """token_set_ratio 取前 limit 个 (文本, 分数, 行号)"""
+    # 倒排索引预筛选：只对共享字二元组 / 分词的公式打分；候选过少时回退全表扫描
+    rows = shortlist_rows(cat.ngram_index, key_clean, key_tokens)
+    if row_mask is not None:
+        rows = rows[row_mask[rows]]
+        if len(rows) < limit:
+            rows = np.flatnonzero(row_mask)   # 过滤后的子集内全量扫描
+    if len(rows) >= limit or row_mask is not None:
+        results = process.extract(key_tokens, [cat.names_tokens[i] for i in rows],
+                                  scorer=fuzz.token_set_ratio, limit=limit)
+        return [(text, score, int(rows[j])) for text, score, j in results]
+    return process.extract(key_tokens, cat.names_tokens, scorer=fuzz.token_set_ratio, limit=limit)
+
+
+def fuzzy_search(user_input: str, topn: int = 5, catalog: Optional[FormulaCatalog] = None,
+                 user_mask: Optional[int] = None, row_mask: Optional[np.ndarray] = None):
+    """row_mask 为元数据过滤得到的布尔掩码，只对其中的行打分"""
+    cat = catalog if catalog is not None else _catalog
+    if user_mask is None:
+        user_mask = _COMBO_MATCHER.mask(user_input)
     key_clean = normalize_text(user_input)
     key_tokens = tokens_by_jieba(key_clean)
     if not key_tokens:
         return []
 
-    results = process.extract(key_tokens, _formulanames_tokens, scorer=fuzz.token_set_ratio, limit=topn*3)
+    limit = topn*3
+    results = _fuzzy_extract(cat, key_clean, key_tokens, limit, row_mask)
+
+    # 错别字 / 拼音容错：查询词不在词表内时，用纠正后的分词再取一批候选，与原结果按行取高分合并
+    found = cat.typo_index.correct_scored(key_tokens) if cat.typo_index is not None else None
+    if found:
+        corrected, quality = found
+        best = {j: (text, score, j) for text, score, j in results}
+        for text, score, j in _fuzzy_extract(cat, corrected, corrected, limit, row_mask):
+            score *= TYPO_SCORE_FACTOR * quality
+            if j not in best or score > best[j][1]:
+                best[j] = (text, score, j)
+        results = sorted(best.values(), key=lambda r: r[1], reverse=True)[:limit]
+
     candidates = []
     for rank, (match_text, score, match_index) in enumerate(results, start=1):
-        row = df.iloc[match_index]
-        clean_name = str(row["FORMULANAME"]).strip().strip('"').strip("'")
+        clean_name = cat.names_display[match_index]
         base_score = float(score) / 100.0  # 归一化
-        final_score = apply_combine_weights(clean_name, base_score, user_input)
+        final_score = apply_combine_weights(clean_name, base_score, user_input, cat.combo_masks[match_index], user_mask)
         candidates.append({
             "number": rank,
-            "FORMULAID": row["FORMULAID"],
+            "FORMULAID": cat.formula_ids[match_index],
             "FORMULANAME": clean_name,
             "score": round(final_score, 4),
             "match_kind": "fuzzy_token_set"
@@ -269,23 +750,31 @@ def fuzzy_search(user_input: str, topn: int = 5):
 # ===========================
 # 3️⃣ semantic_search
 # ===========================
-def semantic_search(user_input: str, topn: int = 5):
-    if _embedding_model is None or _embeddings is None:
+def semantic_search(user_input: str, topn: int = 5, catalog: Optional[FormulaCatalog] = None, hits=None,
+                    row_mask: Optional[np.ndarray] = None):
+    """
+    hits 为批量查询预先计算好的 (idxs, sims)，为空时单独编码并检索；
+    row_mask 不为空时只在过滤后的子集内精确检索
+    """
+    cat = catalog if catalog is not None else _catalog
+    if _embedding_model is None or cat.vector_index is None:
         return []
 
-    vec = _embedding_model.encode([user_input], convert_to_numpy=True).astype(np.float32)
-    vec = vec / (np.linalg.norm(vec, axis=1, keepdims=True) + 1e-12)
-    sims = np.dot(_embeddings, vec[0])  # cosine similarity [-1,1]
+    if hits is None and row_mask is not None:
+        hits = search_subset(cat.vector_index, encode_query(user_input), topn*3, np.flatnonzero(row_mask))
+    elif hits is None:
+        hits = cat.vector_index.search(encode_query(user_input), topn*3)
+    idxs, sims = hits  # cosine similarity [-1,1]，已降序
+    user_mask = _COMBO_MATCHER.mask(user_input)
 
     candidates = []
-    for idx in np.argsort(-sims)[:topn*3]:
-        row = df.iloc[idx]
-        clean_name = str(row["FORMULANAME"]).strip().strip('"').strip("'")
-        base_score = (float(sims[idx]) + 1.0) / 2.0  # [-1,1] -> [0,1]
-        final_score = apply_combine_weights(clean_name, base_score, user_input)
+    for idx, sim in zip(idxs, sims):
+        clean_name = cat.names_display[idx]
+        base_score = (float(sim) + 1.0) / 2.0  # [-1,1] -> [0,1]
+        final_score = apply_combine_weights(clean_name, base_score, user_input, cat.combo_masks[idx], user_mask)
         candidates.append({
             "number": len(candidates)+1,
-            "FORMULAID": row["FORMULAID"],
+            "FORMULAID": cat.formula_ids[idx],
             "FORMULANAME": clean_name,
             "score": round(final_score, 4),
             "match_kind": "semantic_cosine"
@@ -297,34 +786,37 @@ def semantic_search(user_input: str, topn: int = 5):
 # ===========================
 # 4️⃣ hybrid_search
 # ===========================
-def hybrid_search(user_input: str, topn: int = 5, fuzzy_weight: float = 0.4, semantic_weight: float = 0.6):
-    fuzzy_candidates = fuzzy_search(user_input, topn=topn*3)
-    if not HAVE_ST or _embeddings is None:
+def hybrid_search(user_input: str, topn: int = 5, fuzzy_weight: float = 0.4, semantic_weight: float = 0.6,
+                  catalog: Optional[FormulaCatalog] = None, row_mask: Optional[np.ndarray] = None):
+    cat = catalog if catalog is not None else _catalog
+    user_mask = _COMBO_MATCHER.mask(user_input)
+    fuzzy_candidates = fuzzy_search(user_input, topn=topn*3, catalog=cat, user_mask=user_mask, row_mask=row_mask)
+    if _embedding_model is None or cat.embeddings is None or not fuzzy_candidates:
         return fuzzy_candidates[:topn]
 
-    vec = _embedding_model.encode([user_input], convert_to_numpy=True).astype(np.float32)
-    vec = vec / (np.linalg.norm(vec, axis=1, keepdims=True) + 1e-12)
-    sims = np.dot(_embeddings, vec[0])  # [-1,1]
+    vec = encode_query(user_input)
+
+    # 只对 fuzzy 候选行计算余弦相似度：O(k·d)，不再整表点积
+    idxs = [cat.formulaid_to_row[c["FORMULAID"]] for c in fuzzy_candidates]
+    sims = np.dot(cat.embeddings[idxs], vec)  # [-1,1]
 
     merged = []
-    for c in fuzzy_candidates:
-        idx = int(df.index[df["FORMULAID"] == c["FORMULAID"]][0])
-        semantic_score = (float(sims[idx]) + 1.0) / 2.0  # [-1,1] -> [0,1]
+    for c, idx, sim in zip(fuzzy_candidates, idxs, sims):
+        semantic_score = (float(sim) + 1.0) / 2.0  # [-1,1] -> [0,1]
         fuzzy_score = float(c["score"])  # 已归一化
         combined_score = fuzzy_weight * fuzzy_score + semantic_weight * semantic_score
-        clean_name = str(df.iloc[idx]["FORMULANAME"]).strip().strip('"').strip("'")
-        final_score = apply_combine_weights(clean_name, combined_score, user_input)
+        clean_name = cat.names_display[idx]
+        final_score = apply_combine_weights(clean_name, combined_score, user_input, cat.combo_masks[idx], user_mask)
         merged.append((final_score, fuzzy_score, semantic_score, idx))
 
     merged.sort(key=lambda x: x[0], reverse=True)
 
     candidates = []
     for rank, (final_score, fuzzy_score, semantic_score, idx) in enumerate(merged[:topn], start=1):
-        row = df.iloc[idx]
         candidates.append({
             "number": rank,
-            "FORMULAID": row["FORMULAID"],
-            "FORMULANAME": str(row["FORMULANAME"]).strip().strip('"').strip("'"),
+            "FORMULAID": cat.formula_ids[idx],
+            "FORMULANAME": cat.names_display[idx],
             "score": round(float(final_score), 4),
             "fuzzy_score": round(float(fuzzy_score), 4),
             "semantic_score": round(float(semantic_score), 4),
@@ -333,69 +825,221 @@ def hybrid_search(user_input: str, topn: int = 5, fuzzy_weight: float = 0.4, sem
 
     return candidates
 
-def hierarchical_exact_match(user_input: str, df, combine_weight_list):
-    user_input = user_input.strip()
-
-    # 按 weight 降序，保证 weight 高的优先
+def build_combo_suffix_table(combine_weight_list) -> List[tuple]:
+    """
+    预计算层级精确匹配用的组合后缀表（启动时执行一次）：
+    - 按 weight 降序，保证 weight 高的优先
+    - suffixes[k] 表示用户输入已命中前 k 个 term 时需要补齐的后缀
+    """
     combos = sorted(combine_weight_list, key=lambda c: c["weight"], reverse=True)
-
+    table = []
     for item in combos:
-        terms = item["terms"]  # 可动态多级，例如 ["实绩","报出值","地区A"]
+        terms = list(item["terms"])  # 可动态多级，例如 ["实绩","报出值","地区A"]
+        suffixes = ["".join(terms[k:]) for k in range(len(terms) + 1)]
+        table.append((terms, suffixes))
+    return table
+
+
+_COMBO_SUFFIX_TABLE = build_combo_suffix_table(COMBINE_WEIGHT_LIST)
+
+
+def hierarchical_exact_match(user_input: str, catalog: Optional[FormulaCatalog] = None,
+                             row_mask: Optional[np.ndarray] = None):
+    """
+    层级精确查找：按组合 weight 降序，为用户输入补齐缺失的层级后缀，
+    依次在名称哈希索引中查找，命中第一个（且满足 row_mask 过滤）即返回。
+    """
+    cat = catalog if catalog is not None else _catalog
+    user_input = user_input.strip()
 
+    for terms, suffixes in _COMBO_SUFFIX_TABLE:
         # 找用户输入命中 terms 的最长前缀长度
         prefix_len = 0
-        for i, term in enumerate(terms):
+        for term in terms:
             if term in user_input:
                 prefix_len += 1
             else:
                 break
 
-        # 剩余层级需要拼接
-        suffix = "".join(terms[prefix_len:])
-        candidate = user_input + suffix if suffix else user_input
-
-        # 避免重复拼接，直接查找精确匹配
-        exact = df[df["FORMULANAME"].str.strip().str.strip('"').str.strip("'") == candidate]
-        if not exact.empty:
-            row = exact.iloc[0]
+        # 剩余层级需要拼接，直接查哈希索引
+        rows = cat.name_to_rows.get(user_input + suffixes[prefix_len])
+        if rows and row_mask is not None:
+            rows = [r for r in rows if row_mask[r]]
+        if rows:
             return {
-                "FORMULAID": row["FORMULAID"].strip().strip('"').strip("'"),
-                "FORMULANAME": row["FORMULANAME"].strip().strip('"').strip("'"),
+                "FORMULAID": strip_quotes(cat.formula_ids[rows[0]]),
+                "FORMULANAME": cat.names_display[rows[0]],
             }
 
     return None
 
 
-# ===========================================================
-# API 接口
-# ===========================================================
-@app.get("/formula_query")
-def formula_query(
-    user_input: str = Query(..., description="User input: keyword or exact formula name"),
-    topn: int = Query(5, ge=1, le=50, description="Number of candidates to return"),
-    method: str = Query("hybrid", description="Search method: fuzzy | semantic | hybrid")
-):
-    return JSONResponse(content=formula_query_dict(user_input, topn, method))
-
-
 # ===========================================================
 # formula_query_dict 改写版
 # ===========================================================
-def formula_query_dict(user_input: str, topn: int = 5, method: str = "hybrid") -> dict:
+def formula_query_dict(user_input: str, topn: int = 5, method: str = "hybrid", filters: Optional[dict] = None) -> dict:
     """
     返回候选公式的 dict，规则：
     1️⃣ 精确匹配优先（FORMULANAME 完全等于输入或 normalize_text 后相等）
     2️⃣ 若无精确匹配，根据 method 调用 fuzzy / semantic / hybrid
     3️⃣ 分数归一化 [0,1]，应用组合权重
     4️⃣ 返回 topn 结果
+    filters 为元数据过滤条件（如 {"ISLATEST": "1", "FIELDNAME": "SUMVALUE"}），
+    精确匹配与搜索都只在满足条件的公式内进行；为 None 时使用 FORMULA_DEFAULT_FILTERS。
+    整个查询只读取一次 _catalog，热更新替换快照不影响进行中的查询。
     """
+    cat = _catalog
+    if cat is None:
+        return {"done": False, "message": "Formula catalog not initialized.", "candidates": []}
+
+    try:
+        filter_key = normalize_filters(cat.default_filters if filters is None else filters)
+        row_mask = cat.facets.mask(filter_key)
+    except KeyError as e:
+        return {"done": False, "message": f"Unknown filter: {e.args[0]}", "candidates": []}
+    except ValueError as e:
+        return {"done": False, "message": f"Invalid filters: {e}", "candidates": []}
+
     user_input = str(user_input or "").strip().strip('"').strip("'")
     if not user_input:
         return {"done": False, "message": "Empty input.", "candidates": []}
     # 解决1号高炉工序能耗在当前excel版本下无法匹配的问题
     user_input = normalize_symbol_in_string(user_input)
+
+    # 结果缓存：键包含快照版本，热更新后旧结果自然失效
+    cache_key = (cat.version, user_input, topn, str(method).lower(), filter_key)
+    cached = _result_cache.get(cache_key)
+    if cached is not None:
+        return copy.deepcopy(cached)   # 调用方会把候选写入上下文，返回副本
+
+    result = _formula_query(user_input, topn, method, cat, row_mask=row_mask)
+    _cache_result(cache_key, result)
+    return result
+
+
+def formula_query_batch(user_inputs: List[str], topn: int = 5, method: str = "hybrid",
+                        filters: Optional[dict] = None) -> List[dict]:
+    """
+    批量解析指标名称，返回与输入一一对应的结果（格式同 formula_query_dict）：
+    - 精确 / 层级匹配与结果缓存逐条处理
+    - 需要语义检索的输入合并为一次 encode；semantic 模式在 flat 索引上只做一次矩阵乘法
+    - fuzzy 阶段仍逐条执行
+    """
+    cat = _catalog
+    if cat is None:
+        return [{"done": False, "message": "Formula catalog not initialized.", "candidates": []} for _ in user_inputs]
+
+    try:
+        filter_key = normalize_filters(cat.default_filters if filters is None else filters)
+        row_mask = cat.facets.mask(filter_key)
+    except KeyError as e:
+        return [{"done": False, "message": f"Unknown filter: {e.args[0]}", "candidates": []} for _ in user_inputs]
+    except ValueError as e:
+        return [{"done": False, "message": f"Invalid filters: {e}", "candidates": []} for _ in user_inputs]
+
+    method_str = str(method).lower()
+    results: List[Optional[dict]] = [None] * len(user_inputs)
+    pending = []   # (位置, 规范化输入, 缓存键)
+    for i, raw in enumerate(user_inputs):
+        user_input = str(raw or "").strip().strip('"').strip("'")
+        if not user_input:
+            results[i] = {"done": False, "message": "Empty input.", "candidates": []}
+            continue
+        user_input = normalize_symbol_in_string(user_input)
+        cache_key = (cat.version, user_input, topn, method_str, filter_key)
+        cached = _result_cache.get(cache_key)
+        if cached is not None:
+            results[i] = copy.deepcopy(cached)
+        else:
+            pending.append((i, user_input, cache_key))
+
+    # 需要向量的输入：一次 encode（结果进入查询向量 LRU，hybrid_search 直接命中）
+    semantic_hits = {}
+    if method_str in ("semantic", "hybrid") and _embedding_model is not None and cat.vector_index is not None:
+        texts = list(dict.fromkeys(u for _, u, _ in pending if _exact_lookup(u, cat, row_mask) is None))
+        if texts:
+            try:
+                queries = encode_queries(texts)
+                if method_str == "semantic" and row_mask is None:   # 有过滤条件时逐条在子集内检索
+                    hits = search_batch(cat.vector_index, queries, topn*3)
+                    semantic_hits = dict(zip(texts, hits))
+            except Exception:
+                logger.exception("❌ Batch encode error")   # 逐条查询时会重新编码并返回错误信息
+
+    for i, user_input, cache_key in pending:
+        result = _formula_query(user_input, topn, method, cat, semantic_hits.get(user_input), row_mask)
+        _cache_result(cache_key, result)
+        results[i] = result
+    return results
+
+
+def _parent_cache_key(user_input, topn: int, method: str, filters: Optional[dict]) -> Optional[tuple]:
+    """与 formula_query_dict 相同的结果缓存键（进程模式下在主进程计算），无法计算时返回 None"""
+    cat = _catalog
+    user_input = str(user_input or "").strip().strip('"').strip("'")
+    if cat is None or not user_input:
+        return None
+    try:
+        filter_key = normalize_filters(cat.default_filters if filters is None else filters)
+    except Exception:
+        return None
+    return (cat.version, normalize_symbol_in_string(user_input), topn, str(method).lower(), filter_key)
+
+
+async def formula_query_dict_async(user_input: str, topn: int = 5, method: str = "hybrid",
+                                   filters: Optional[dict] = None) -> dict:
+    """
+    在检索执行器中执行 formula_query_dict（供事件循环中的调用方使用）。
+    进程模式下结果缓存留在主进程：先查缓存，未命中再交给子进程，结果写回主进程缓存。
+    """
+    executor = get_search_executor()
+    if executor.mode != "process":
+        return await executor.run(formula_query_dict, user_input, topn, method, filters)
+
+    cache_key = _parent_cache_key(user_input, topn, method, filters)
+    cached = _result_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        return copy.deepcopy(cached)
+    result = await executor.run(formula_query_dict, user_input, topn, method, filters)
+    if cache_key:
+        _cache_result(cache_key, result)
+    return result
+
+
+async def formula_query_batch_async(user_inputs: List[str], topn: int = 5, method: str = "hybrid",
+                                    filters: Optional[dict] = None) -> List[dict]:
+    """在检索执行器中执行 formula_query_batch；进程模式下同样只把主进程缓存未命中的输入交给子进程"""
+    executor = get_search_executor()
+    if executor.mode != "process":
+        return await executor.run(formula_query_batch, user_inputs, topn, method, filters)
+
+    keys = [_parent_cache_key(u, topn, method, filters) for u in user_inputs]
+    results: List[Optional[dict]] = [None] * len(user_inputs)
+    pending = []
+    for i, key in enumerate(keys):
+        cached = _result_cache.get(key) if key else None
+        if cached is not None:
+            results[i] = copy.deepcopy(cached)
+        else:
+            pending.append(i)
+    if pending:
+        fetched = await executor.run(formula_query_batch, [user_inputs[i] for i in pending], topn, method, filters)
+        for i, result in zip(pending, fetched):
+            if keys[i]:
+                _cache_result(keys[i], result)
+            results[i] = result
+    return results
+
+
+def _cache_result(cache_key: tuple, result: dict):
+    if not result["message"].startswith("Search error"):
+        _result_cache.put(cache_key, copy.deepcopy(result))
+
+
+def _exact_lookup(user_input: str, cat: FormulaCatalog, row_mask: Optional[np.ndarray] = None) -> Optional[dict]:
+    """层级精确查找 + 名称哈希精确匹配，命中时返回完整结果 dict（只考虑 row_mask 内的行）"""
     # 0️⃣ 层级精确查找
-    hier = hierarchical_exact_match(user_input, df, COMBINE_WEIGHT_LIST)
+    hier = hierarchical_exact_match(user_input, catalog=cat, row_mask=row_mask)
     if hier:
         logger.info(f"✅ Hierarchical exact match: {hier['FORMULANAME']}")
         return {
@@ -404,36 +1048,50 @@ def formula_query_dict(user_input: str, topn: int = 5, method: str = "hybrid") -
             "exact_matches": [hier]
         }
 
-    # ===== 1️⃣ 精确匹配 =====
-    exact = df[df["FORMULANAME"].str.strip().str.strip('"').str.strip("'") == user_input]
-    if exact.empty:
+    # ===== 1️⃣ 精确匹配（哈希索引 O(1)） =====
+    rows = cat.name_to_rows.get(user_input)
+    if not rows:
         # 尝试 normalize_text 后匹配
-        clean_input = normalize_text(user_input)
-        matches_idx = [i for i, v in enumerate(_formulanames_clean) if v == clean_input]
-        if matches_idx:
-            exact = pd.DataFrame([df.iloc[matches_idx[0]]])
-
-    if not exact.empty:
-        exact_matches = exact[["FORMULAID", "FORMULANAME"]].to_dict(orient="records")
-        for item in exact_matches:
-            item["FORMULANAME"] = str(item["FORMULANAME"]).strip().strip('"').strip("'")
+        pos = cat.clean_name_to_row.get(normalize_text(user_input))
+        rows = [pos] if pos is not None else []
+    if rows and row_mask is not None:
+        rows = [i for i in rows if row_mask[i]]
+
+    if rows:
+        exact_matches = [
+            {"FORMULAID": cat.formula_ids[i], "FORMULANAME": cat.names_display[i]}
+            for i in rows
+        ]
         return {
             "done": True,
             "message": f"Exact match found: {exact_matches[0]['FORMULANAME']}",
             "exact_matches": exact_matches,
             "candidates": exact_matches
         }
+    return None
+
+
+def _formula_query(user_input: str, topn: int, method: str, cat: FormulaCatalog, semantic_hits=None,
+                   row_mask: Optional[np.ndarray] = None) -> dict:
+    """formula_query_dict 的实际查询逻辑（输入已规范化，不经过结果缓存）"""
+    exact = _exact_lookup(user_input, cat, row_mask)
+    if exact is not None:
+        return exact
 
     # ===== 2️⃣ 模糊 / 语义 / 混合搜索 =====
     method_str = str(method).lower()
     candidates = []
     try:
         if method_str == "fuzzy":
-            candidates = fuzzy_search(user_input, topn=topn)
+            candidates = fuzzy_search(user_input, topn=topn, catalog=cat, row_mask=row_mask)
         elif method_str == "semantic":
-            candidates = semantic_search(user_input, topn=topn)
+            if cat.vector_index is None:
+                # 嵌入模型尚未就绪（后台加载中或未安装），回退 fuzzy
+                candidates = fuzzy_search(user_input, topn=topn, catalog=cat, row_mask=row_mask)
+            else:
+                candidates = semantic_search(user_input, topn=topn, catalog=cat, hits=semantic_hits, row_mask=row_mask)
         elif method_str == "hybrid":
-            candidates = hybrid_search(user_input, topn=topn)
+            candidates = hybrid_search(user_input, topn=topn, catalog=cat, row_mask=row_mask)
         else:
             return {"done": False, "message": f"Unknown method: {method_str}", "candidates": []}
     except Exception as e:
@@ -452,13 +1110,7 @@ def formula_query_dict(user_input: str, topn: int = 5, method: str = "hybrid") -
         "message": f"{len(candidates_sorted)} candidates returned.",
         "candidates": candidates_sorted
     }
-    
-
 
-@app.on_event("startup")
-def load_csv_and_prepare():
-    """FastAPI 启动时自动调用"""
-    initialize()
 
 # ===========================================================
 # 独立运行支持（python formula_api.py）
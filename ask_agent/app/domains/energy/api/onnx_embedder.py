@@ -0,0 +1,119 @@
+# app/domains/energy/api/onnx_embedder.py
+"""
+ONNX Runtime 版句向量编码器（CPU）：
+- 直接加载 OFFLINE_MODEL_PATH 下导出的 MiniLM（onnx/model.onnx 或 model.onnx）
+- 使用模型目录内的 tokenizer.json（tokenizers 库，不依赖 torch / transformers）
+- 输出与 SentenceTransformer 相同：token 向量按 attention_mask 做 mean pooling，
+  因此嵌入缓存（按模型 id 校验）无需重建
+
+encode() 的签名与 SentenceTransformer.encode 保持一致，formula_api 可以无差别调用。
+导出模型见 tools/export_sbert_onnx.py。
+"""
+import os
+import json
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+# ================= 日志配置 =================
+logger = logging.getLogger("domains.energy.api.onnx_embedder")
+if not logger.handlers:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+    )
+
+try:
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+    HAVE_ORT = True
+except Exception as e:
+    HAVE_ORT = False
+    logger.warning(f"⚠️ onnxruntime / tokenizers 导入失败，ONNX 后端不可用: {e}")
+
+ONNX_CANDIDATES = ("onnx/model.onnx", "model.onnx")
+DEFAULT_MAX_SEQ_LENGTH = 128
+
+
+def find_onnx_model(model_dir: str, onnx_file: str = "") -> Optional[str]:
+    """按配置或默认候选路径查找 .onnx 文件"""
+    candidates = [onnx_file] if onnx_file else ONNX_CANDIDATES
+    for name in candidates:
+        path = name if os.path.isabs(name) else os.path.join(model_dir, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _read_max_seq_length(model_dir: str) -> int:
+    """与 SentenceTransformer 一致，从 sentence_bert_config.json 读取截断长度"""
+    path = os.path.join(model_dir, "sentence_bert_config.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(json.load(f).get("max_seq_length", DEFAULT_MAX_SEQ_LENGTH))
+    except Exception:
+        return DEFAULT_MAX_SEQ_LENGTH
+
+
+def mean_pooling(token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """按 attention_mask 对 token 向量求平均（padding 不参与）"""
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (token_embeddings * mask).sum(axis=1)
+    counts = np.clip(mask.sum(axis=1), 1e-9, None)
+    return summed / counts
+
+
+class OnnxSentenceEncoder:
+    def __init__(self, model_dir: str, onnx_file: str = "", num_threads: int = 0):
+        if not HAVE_ORT:
+            raise RuntimeError("onnxruntime / tokenizers not installed")
+        model_path = find_onnx_model(model_dir, onnx_file)
+        if model_path is None:
+            raise RuntimeError(f"未找到 ONNX 模型文件: {model_dir}")
+        tokenizer_path = os.path.join(model_dir, "tokenizer.json")
+        if not os.path.exists(tokenizer_path):
+            raise RuntimeError(f"未找到 tokenizer.json: {model_dir}")
+
+        self.max_seq_length = _read_max_seq_length(model_dir)
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding()   # 按批内最长序列补齐
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        logger.info(f"✅ ONNX 模型已加载: {model_path} (max_seq_length={self.max_seq_length})")
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+        token_embeddings = self.session.run(None, feeds)[0]
+        return mean_pooling(token_embeddings, attention_mask)
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        """与 SentenceTransformer.encode 相同的调用方式，返回 float32 矩阵（未归一化）"""
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        if not sentences:
+            return np.empty((0, 0), dtype=np.float32)
+
+        # 按长度排序后分批，减少 padding；输出再恢复原顺序
+        order = np.argsort([-len(s) for s in sentences], kind="stable")
+        out = [None] * len(sentences)
+        for start in range(0, len(sentences), batch_size):
+            idx = order[start:start + batch_size]
+            vecs = self._encode_batch([sentences[i] for i in idx])
+            for i, v in zip(idx, vecs):
+                out[i] = v
+            if show_progress_bar:
+                logger.info(f"🔄 ONNX encode {min(start + batch_size, len(sentences))}/{len(sentences)}")
+        return np.asarray(out, dtype=np.float32)
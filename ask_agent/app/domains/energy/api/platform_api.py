@@ -4,10 +4,15 @@ import asyncio
 import time
 import hashlib
 import logging
+from typing import Any, Dict, List, Optional
 from config import (
     TENANT_NAME, APP_KEY, APP_SECRET, USER_NAME,
-    LOGIN_URL, QUERY_URL, RANGE_QUERY_URL, TOKEN_EXPIRE_DURATION
+    LOGIN_URL, QUERY_URL, RANGE_QUERY_URL, TOKEN_EXPIRE_DURATION,
+    PLATFORM_HTTP_LIMIT, PLATFORM_HTTP_LIMIT_PER_HOST, PLATFORM_HTTP_KEEPALIVE, PLATFORM_HTTP_DNS_TTL,
+    PLATFORM_BATCH_MAX_FORMULAS, PLATFORM_BATCH_SHAPE, PLATFORM_BATCH_RECORD_KEY, PLATFORM_CACHE_SIZE, PLATFORM_CACHE_CURRENT_TTL,
+    PLATFORM_CACHE_SETTLE_SEC, PLATFORM_CACHE_CLOSED_TTL
 )
+from .platform_cache import PlatformResultCache
 
 # ================= 日志配置 =================
 logger = logging.getLogger("domains.energy.api.platform_api")
@@ -19,6 +24,18 @@ if not logger.handlers:
 
 _cached_token = None
 _token_timestamp = 0
+_token_refresh: Optional[asyncio.Task] = None   # 进行中的登录任务（单飞）
+
+# 进程内共享的查询结果缓存（按周期是否结束分层 TTL），PLATFORM_CACHE_SIZE=0 时关闭
+_result_cache: Optional[PlatformResultCache] = (
+    PlatformResultCache(PLATFORM_CACHE_SIZE, PLATFORM_CACHE_CURRENT_TTL, PLATFORM_CACHE_SETTLE_SEC, PLATFORM_CACHE_CLOSED_TTL)
+    if PLATFORM_CACHE_SIZE > 0 else None
+)
+
+# 进程内共享的 ClientSession：复用 TCP / TLS 连接，启动时创建、关闭时释放
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+_closing_tasks: set = set()   # 后台关闭旧 session 的任务（保持引用，避免被回收）
 
 
 def md5_upper(source: str) -> str:
@@ -26,16 +43,94 @@ def md5_upper(source: str) -> str:
     return hashlib.md5(source.encode("utf-8")).hexdigest().upper()
 
 
+def _discard_session(session: Optional[aiohttp.ClientSession], session_loop: Optional[asyncio.AbstractEventLoop]):
+    """
+    替换前关闭旧 session，释放其连接池中的连接：
+    旧事件循环仍在运行（其他线程）时交给它关闭，否则在当前事件循环中后台关闭
+    """
+    if session is None or session.closed:
+        return
+    if session_loop is not None and session_loop.is_running() and session_loop is not asyncio.get_running_loop():
+        asyncio.run_coroutine_threadsafe(session.close(), session_loop)
+        return
+    task = asyncio.get_running_loop().create_task(_close_quietly(session))
+    _closing_tasks.add(task)
+    task.add_done_callback(_closing_tasks.discard)
+
+
+async def _close_quietly(session: aiohttp.ClientSession):
+    try:
+        await session.close()
+    except Exception as e:
+        logger.warning(f"⚠️ 关闭旧的平台接口连接池失败: {e}")
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    返回全局共享 ClientSession（须在事件循环中调用）。
+    不存在、已关闭或属于其他事件循环（例如脚本中多次 asyncio.run）时重新创建。
+    """
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _discard_session(_session, _session_loop)
+        connector = aiohttp.TCPConnector(
+            limit=PLATFORM_HTTP_LIMIT,
+            limit_per_host=PLATFORM_HTTP_LIMIT_PER_HOST,
+            keepalive_timeout=PLATFORM_HTTP_KEEPALIVE,
+            ttl_dns_cache=PLATFORM_HTTP_DNS_TTL,
+            use_dns_cache=True,
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+        _session_loop = loop
+        logger.info(f"✅ 平台接口连接池已创建（limit={PLATFORM_HTTP_LIMIT}, per_host={PLATFORM_HTTP_LIMIT_PER_HOST}）")
+    return _session
+
+
+async def init_session():
+    """服务启动时创建共享 ClientSession"""
+    get_session()
+
+
+async def close_session():
+    """服务关闭时释放共享 ClientSession 及其连接"""
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("🔌 平台接口连接池已关闭")
+    _session, _session_loop = None, None
+
+
+def _token_valid(now: float) -> bool:
+    return bool(_cached_token) and (now - _token_timestamp) < TOKEN_EXPIRE_DURATION.total_seconds()
+
+
 async def _get_token():
     """
     获取或刷新 token（缓存 TOKEN_EXPIRE_DURATION 时间）
     """
-    global _cached_token, _token_timestamp
-    now = time.time()
-
     # 若缓存未过期则直接返回
-    if _cached_token and (now - _token_timestamp) < TOKEN_EXPIRE_DURATION.total_seconds():
+    if _token_valid(time.time()):
         return _cached_token
+    return await _refresh_token()
+
+
+async def _refresh_token():
+    """
+    单飞刷新：同一时刻只有一个登录请求，并发调用方等待同一个任务的结果。
+    shield 保证某个调用方被取消时不会连带取消其他调用方正在等待的登录。
+    """
+    global _token_refresh
+    loop = asyncio.get_running_loop()
+    if _token_refresh is None or _token_refresh.done() or _token_refresh.get_loop() is not loop:
+        _token_refresh = loop.create_task(_login())
+    return await asyncio.shield(_token_refresh)
+
+
+async def _login():
+    """调用登录接口获取新 token 并写入缓存"""
+    global _cached_token, _token_timestamp
+    now = time.time()
 
     # 生成加密签名
     ts = int(now * 1000)
@@ -50,25 +145,47 @@ async def _get_token():
         "enc": enc
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(LOGIN_URL, json=body) as resp:
-            resp.raise_for_status()
-            data = await resp.json()
-            logger.info("🟢 登录返回：%s", data)
+    async with get_session().post(LOGIN_URL, json=body) as resp:
+        resp.raise_for_status()
+        data = await resp.json()
+        logger.info("🟢 登录返回：%s", data)
 
-            # token 位于 data.data.token
-            token = (
-                data.get("data", {}).get("token") or  # ✅ 正确路径
-                data.get("token") or
-                data.get("data")
-            )
+        # token 位于 data.data.token
+        token = (
+            data.get("data", {}).get("token") or  # ✅ 正确路径
+            data.get("token") or
+            data.get("data")
+        )
 
-            if not token:
-                raise ValueError(f"登录接口未返回有效 token: {data}")
+        if not token:
+            raise ValueError(f"登录接口未返回有效 token: {data}")
 
-            _cached_token = token
-            _token_timestamp = now
-            return token
+        _cached_token = token
+        _token_timestamp = now
+        return token
+
+
+async def token_refresh_task(margin_sec: float = 300, retry_sec: float = 60):
+    """
+    后台提前刷新 token：在过期前 margin_sec 秒（不超过有效期的一半）重新登录，
+    用户请求始终拿到未过期的缓存 token，不需要等待登录往返。
+    与 persist_all_graphs_task 一样在 startup 中 create_task 启动；登录失败时 retry_sec 秒后重试。
+    """
+    expire = TOKEN_EXPIRE_DURATION.total_seconds()
+    margin = min(margin_sec, expire / 2)
+    while True:
+        delay = 0.0
+        if _cached_token:
+            delay = max(0.0, _token_timestamp + expire - margin - time.time())
+        await asyncio.sleep(delay)
+        try:
+            await _refresh_token()
+            logger.info("🔑 token 已后台刷新")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ 后台刷新 token 失败，{retry_sec:.0f}s 后重试: {e}")
+            await asyncio.sleep(retry_sec)
 
 
 def is_range_query(time_string: str) -> bool:
@@ -78,20 +195,9 @@ def is_range_query(time_string: str) -> bool:
     return any(sym in time_string for sym in ["～", "~"])
 
 
-async def query_platform(formula: str, timeString: str, timeType: str):
-    """
-    智能判断查询类型：
-    - 若 timeString 含 “～” 或 “~” => 调区间接口 RANGE_QUERY_URL
-    - 否则 => 调单点接口 QUERY_URL
-    - timeType 始终原样透传
-    """
-
-    token = await _get_token()
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-
+def _build_request(formulas: List[str], timeString: str, timeType: str):
+    """按时间格式选择接口并组装请求体，formulas 以 {公式: 公式} 形式放入同一个请求"""
+    expressions = {f: f for f in formulas}
     if is_range_query(timeString):
         # 区间查询: 例如 "2024-09-01~2024-09-07"
         start_date, end_date = [x.strip() for x in timeString.replace("～", "~").split("~", 1)]
@@ -99,32 +205,164 @@ async def query_platform(formula: str, timeString: str, timeType: str):
         payload = {
             "startClock": start_date,
             "endClock": end_date,
-            "formulas": {formula: formula},
+            "formulas": expressions,
             "timeGranId": timeType  # ✅ 传入原始 timeType，不强制改成 DAY
         }
-        url = RANGE_QUERY_URL
-    else:
-        # 单点查询
-        payload = {
-            "expressionList": {formula: formula},
-            "clock": timeString,
-            "timegranId": timeType
-        }
-        url = QUERY_URL
+        return RANGE_QUERY_URL, payload
+
+    # 单点查询
+    payload = {
+        "expressionList": expressions,
+        "clock": timeString,
+        "timegranId": timeType
+    }
+    return QUERY_URL, payload
+
+
+async def _post_query(url: str, payload: dict):
+    token = await _get_token()
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
 
     logger.info("🟡 调用接口: %s", url)
     logger.info("🧩 请求参数: %s", payload)
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=payload, headers=headers) as resp:
-            resp.raise_for_status()
-            data = await resp.json()
-            print("🟢 返回数据:", data)
+    async with get_session().post(url, json=payload, headers=headers) as resp:
+        resp.raise_for_status()
+        data = await resp.json()
+        print("🟢 返回数据:", data)
+
+        if "data" not in data:
+            raise ValueError(f"接口返回格式错误: {data}")
+
+        return data["data"]
+
+
+async def query_platform(formula: str, timeString: str, timeType: str):
+    """
+    智能判断查询类型：
+    - 若 timeString 含 “～” 或 “~” => 调区间接口 RANGE_QUERY_URL
+    - 否则 => 调单点接口 QUERY_URL
+    - timeType 始终原样透传
+    - 结果写入进程内缓存，相同 (formula, timeString, timeType) 在 TTL 内直接返回
+    """
+    if _result_cache is not None:
+        cached = _result_cache.get(formula, timeString, timeType)
+        if cached is not None:
+            logger.info("💾 平台查询缓存命中: %s %s(%s)", formula, timeString, timeType)
+            return cached
+    return await _query_and_cache(formula, timeString, timeType)
+
+
+async def _query_and_cache(formula: str, timeString: str, timeType: str):
+    """请求平台（不读缓存）并写入缓存"""
+    url, payload = _build_request([formula], timeString, timeType)
+    result = await _post_query(url, payload)
+    if _result_cache is not None:
+        _result_cache.put(formula, timeString, timeType, result)
+    return result
+
+
+def invalidate_cache(formula: Optional[str] = None, timeString: Optional[str] = None,
+                     timeType: Optional[str] = None) -> int:
+    """
+    失效查询结果缓存（平台补录 / 重算数据后调用），参数为 None 表示不限，全部为 None 时清空。
+    返回删除的条目数。
+    """
+    if _result_cache is None:
+        return 0
+    removed = _result_cache.invalidate(formula, timeString, timeType)
+    logger.info(f"🧹 平台查询缓存已失效 {removed} 条 (formula={formula}, timeString={timeString}, timeType={timeType})")
+    return removed
+
+
+def cache_stats() -> dict:
+    """查询结果缓存命中率（总体与 current / settling / closed 各层）"""
+    if _result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **_result_cache.stats()}
+
+
+def split_batch_result(data, formulas: List[str], shape: str = "records",
+                       record_key: str = "formula") -> Optional[Dict[str, Any]]:
+    """
+    按配置的返回格式把一次多公式请求的返回拆回每个公式，格式与单公式 query_platform 的返回一致：
+    - shape="dict"   ：{公式: 值} -> 每个公式得到 {公式: 值}
+    - shape="records"：[{record_key: 公式, ...}, ...] -> 按 record_key 分组
+    返回与配置不符时返回 None，由调用方退回逐个公式查询
+    """
+    if shape == "dict":
+        if isinstance(data, dict) and all(f in data for f in formulas):
+            return {f: {f: data[f]} for f in formulas}
+        return None
+    if shape == "records" and isinstance(data, list):
+        grouped: Dict[str, list] = {f: [] for f in formulas}
+        for record in data:
+            if not isinstance(record, dict) or record.get(record_key) not in grouped:
+                return None
+            grouped[record[record_key]].append(record)
+        return grouped
+    return None
+
+
+def batch_enabled(timeString: str) -> bool:
+    """
+    只有确认过平台批量返回格式（PLATFORM_BATCH_SHAPE 为 dict / records）时才合并请求；
+    区间查询的返回是按时间排列的记录，无法按公式拆分，始终逐个公式查询
+    """
+    return PLATFORM_BATCH_SHAPE in ("dict", "records") and not is_range_query(timeString)
+
+
+async def _query_each(formulas: List[str], timeString: str, timeType: str) -> Dict[str, Any]:
+    """逐个公式并发查询，同时在途的请求数不超过 PLATFORM_HTTP_LIMIT_PER_HOST（与连接池单主机上限一致）"""
+    sem = asyncio.Semaphore(max(1, PLATFORM_HTTP_LIMIT_PER_HOST))
+
+    async def _one(formula):
+        async with sem:
+            return await _query_and_cache(formula, timeString, timeType)
+
+    return dict(zip(formulas, await asyncio.gather(*(_one(f) for f in formulas))))
+
+
+async def query_platform_batch(formulas: List[str], timeString: str, timeType: str) -> Dict[str, Any]:
+    """
+    同一 (timeString, timeType) 下的多个公式合并为一个请求（expressionList / formulas 本身就是字典），
+    返回 {公式: 与 query_platform(公式, ...) 相同格式的结果}；缓存命中的公式不再请求。
+    超过 PLATFORM_BATCH_MAX_FORMULAS 个时分块请求；未配置批量返回格式（batch_enabled）、区间查询
+    或返回与配置不符时逐个公式并发查询。
+    """
+    formulas = list(dict.fromkeys(f for f in formulas if f))
+    results: Dict[str, Any] = {}
+    if _result_cache is not None:
+        for f in formulas:
+            cached = _result_cache.get(f, timeString, timeType)
+            if cached is not None:
+                results[f] = cached
+        if results:
+            logger.info(f"💾 平台查询缓存命中 {len(results)}/{len(formulas)} 个公式")
+    missing = [f for f in formulas if f not in results]
 
-            if "data" not in data:
-                raise ValueError(f"接口返回格式错误: {data}")
+    if not batch_enabled(timeString):
+        results.update(await _query_each(missing, timeString, timeType))
+        return {f: results[f] for f in formulas}
 
-            return data["data"]
+    for i in range(0, len(missing), PLATFORM_BATCH_MAX_FORMULAS):
+        chunk = missing[i:i + PLATFORM_BATCH_MAX_FORMULAS]
+        if len(chunk) == 1:
+            results[chunk[0]] = await _query_and_cache(chunk[0], timeString, timeType)
+            continue
+        url, payload = _build_request(chunk, timeString, timeType)
+        split = split_batch_result(await _post_query(url, payload), chunk, PLATFORM_BATCH_SHAPE, PLATFORM_BATCH_RECORD_KEY)
+        if split is None:
+            logger.warning(f"⚠️ 批量查询返回与 PLATFORM_BATCH_SHAPE={PLATFORM_BATCH_SHAPE} 不符，改为逐个公式查询，请检查配置")
+            split = await _query_each(chunk, timeString, timeType)
+        elif _result_cache is not None:
+            for f, value in split.items():
+                _result_cache.put(f, timeString, timeType, value)
+        results.update(split)
+    return {f: results[f] for f in formulas}
 
 
 # === 测试入口 ===
@@ -140,5 +378,6 @@ if __name__ == "__main__":
         # 区间查询示例2
         result3 = await query_platform("GXNHLT1100.IXRL", "2022-09~2022-10", "MONTH")
         logger.info("📅 区间查询结果：%s", result3)
+        await close_session()
 
     asyncio.run(main())
@@ -0,0 +1,156 @@
+# app/domains/energy/api/platform_cache.py
+"""
+平台查询结果缓存（进程内，所有用户共享）：
+- 键为 (formula, timeString, timeType)，graph.find_node 只在单个用户的图谱内复用，这里跨用户 / 跨会话复用
+- 按 timeString 所在周期与当前时间的关系分层设置 TTL：
+    current  ：周期尚未结束（本小时 / 今天 / 本月 ...），数据仍在变化，按 timeType 缓存几分钟
+    settling ：周期刚结束，平台可能仍在补录 / 重算，沿用 current 的 TTL
+    closed   ：周期结束已超过 settle_sec，历史值不再变化，缓存 closed_ttl（0 表示不过期，仅受容量淘汰）
+- 空结果（数据可能尚未入库）最多缓存 current TTL
+- 无法解析的 timeString 按 current 处理
+"""
+import copy
+import re
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Optional, Tuple
+
+from .query_cache import TTLCache
+
+# 周期未结束时各粒度的 TTL（秒）：粒度越粗，单位时间内的变化占比越小，可缓存更久
+CURRENT_TTL_BY_TYPE = {
+    "HOUR": 60,
+    "SHIFT": 120,
+    "DAY": 300,
+    "WEEK": 600,
+    "TENDAYS": 600,
+    "MONTH": 900,
+    "QUARTER": 1800,
+    "YEAR": 1800,
+}
+
+# 夜班跨零点，次日上午才结束
+SHIFT_TAIL = timedelta(hours=12)
+
+_WEEK_RE = re.compile(r"(\d{4})\s*-?\s*W(\d{1,2})", re.I)
+_QUARTER_RE = re.compile(r"(\d{4})\s*-?\s*Q([1-4])", re.I)
+_TENDAYS_RE = re.compile(r"(\d{4})-(\d{1,2})\s*(上旬|中旬|下旬)?")
+
+
+def _next_month(year: int, month: int) -> datetime:
+    return datetime(year + month // 12, month % 12 + 1, 1)
+
+
+def period_end(time_string: str, time_type: str) -> Optional[datetime]:
+    """
+    返回 timeString 所表示周期的结束时刻（不含），区间查询取区间末端所在周期；无法解析返回 None。
+    格式与 LLM 解析输出一致：HOUR "YYYY-MM-DD HH"、SHIFT "YYYY-MM-DD 早班"、DAY "YYYY-MM-DD"、
+    WEEK "YYYY W##"、TENDAYS "YYYY-MM 上旬"、MONTH "YYYY-MM"、QUARTER "YYYY Q#"、YEAR "YYYY"
+    """
+    if not time_string:
+        return None
+    s = str(time_string).replace("～", "~")
+    if "~" in s:
+        s = s.split("~", 1)[1]
+    s = s.strip()
+    t = (time_type or "").upper()
+    try:
+        if t == "HOUR":
+            return datetime.strptime(s[:13], "%Y-%m-%d %H") + timedelta(hours=1)
+        if t == "SHIFT":
+            return datetime.strptime(s[:10], "%Y-%m-%d") + timedelta(days=1) + SHIFT_TAIL
+        if t == "DAY":
+            return datetime.strptime(s[:10], "%Y-%m-%d") + timedelta(days=1)
+        if t == "WEEK":
+            m = _WEEK_RE.match(s)
+            return datetime.fromisocalendar(int(m.group(1)), int(m.group(2)), 1) + timedelta(weeks=1) if m else None
+        if t == "TENDAYS":
+            m = _TENDAYS_RE.match(s)
+            if not m:
+                return None
+            year, month = int(m.group(1)), int(m.group(2))
+            if m.group(3) == "上旬":
+                return datetime(year, month, 11)
+            if m.group(3) == "中旬":
+                return datetime(year, month, 21)
+            return _next_month(year, month)
+        if t == "MONTH":
+            month_start = datetime.strptime(s[:7], "%Y-%m")
+            return _next_month(month_start.year, month_start.month)
+        if t == "QUARTER":
+            m = _QUARTER_RE.match(s)
+            return _next_month(int(m.group(1)), int(m.group(2)) * 3) if m else None
+        if t == "YEAR":
+            return datetime(int(s[:4]) + 1, 1, 1)
+    except ValueError:
+        return None
+    return None
+
+
+def cache_policy(time_string: str, time_type: str, now: Optional[datetime] = None,
+                 current_ttl: float = 300, settle_sec: float = 3600,
+                 closed_ttl: Optional[float] = None) -> Tuple[str, Optional[float]]:
+    """返回 (tier, ttl 秒)；ttl 为 None 表示不过期"""
+    now = now or datetime.now()
+    ttl = CURRENT_TTL_BY_TYPE.get((time_type or "").upper(), current_ttl)
+    end = period_end(time_string, time_type)
+    if end is None or now < end:
+        return "current", ttl
+    if now < end + timedelta(seconds=settle_sec):
+        return "settling", ttl
+    return "closed", closed_ttl
+
+
+class PlatformResultCache:
+    def __init__(self, maxsize: int = 4096, current_ttl: float = 300,
+                 settle_sec: float = 3600, closed_ttl: float = 0):
+        """closed_ttl <= 0 表示已结束周期的结果不过期"""
+        self._cache = TTLCache(maxsize, name="platform_result")
+        self.current_ttl = current_ttl
+        self.settle_sec = settle_sec
+        self.closed_ttl = closed_ttl if closed_ttl and closed_ttl > 0 else None
+        self._lock = threading.Lock()
+        self.tier_hits: Counter = Counter()
+        self.tier_misses: Counter = Counter()
+
+    def policy(self, time_string: str, time_type: str) -> Tuple[str, Optional[float]]:
+        return cache_policy(time_string, time_type, current_ttl=self.current_ttl,
+                            settle_sec=self.settle_sec, closed_ttl=self.closed_ttl)
+
+    def get(self, formula: str, time_string: str, time_type: str) -> Optional[Any]:
+        """命中时返回结果副本（调用方可能修改返回值），未命中返回 None"""
+        value = self._cache.get((formula, time_string, time_type))
+        tier, _ = self.policy(time_string, time_type)
+        with self._lock:
+            (self.tier_hits if value is not None else self.tier_misses)[tier] += 1
+        return copy.deepcopy(value) if value is not None else None
+
+    def put(self, formula: str, time_string: str, time_type: str, value: Any):
+        if value is None:
+            return
+        tier, ttl = self.policy(time_string, time_type)
+        if not value:
+            # 空结果可能只是数据尚未入库，不做长期缓存
+            current = CURRENT_TTL_BY_TYPE.get((time_type or "").upper(), self.current_ttl)
+            ttl = current if ttl is None else min(ttl, current)
+        self._cache.put((formula, time_string, time_type), copy.deepcopy(value), ttl)
+
+    def invalidate(self, formula: Optional[str] = None, time_string: Optional[str] = None,
+                   time_type: Optional[str] = None) -> int:
+        """删除匹配的条目（参数为 None 表示不限），全部为 None 时清空；返回删除数量"""
+        def match(key):
+            f, ts, tt = key
+            return ((formula is None or f == formula)
+                    and (time_string is None or ts == time_string)
+                    and (time_type is None or tt == time_type))
+        return self._cache.invalidate(match)
+
+    def stats(self) -> dict:
+        result = self._cache.stats()
+        with self._lock:
+            result["tiers"] = {
+                tier: {"hits": self.tier_hits[tier], "misses": self.tier_misses[tier]}
+                for tier in ("current", "settling", "closed")
+            }
+        return result
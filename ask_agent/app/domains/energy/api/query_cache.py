@@ -0,0 +1,104 @@
+# app/domains/energy/api/query_cache.py
+"""
+进程内有界 LRU 缓存（线程安全）：
+- 查询在检索执行器（search_executor.py）的线程中并发执行，读写都在锁内完成
+- 超出 maxsize 时淘汰最久未使用的条目
+- stats() 返回条目数、命中 / 未命中次数与命中率，便于观察缓存效果
+- TTLCache：在 LRU 基础上每个条目带过期时间（平台查询结果缓存使用）
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024, name: str = "lru"):
+        self.maxsize = max(0, int(maxsize))
+        self.name = name
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """命中时返回缓存值并标记为最近使用，未命中返回 None"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class TTLCache(LRUCache):
+    """
+    带过期时间的有界 LRU：put 时为每个条目指定 ttl 秒（None 表示不过期，只受容量淘汰），
+    读取到已过期的条目时删除并按未命中计数。
+    """
+    def __init__(self, maxsize: int = 1024, name: str = "ttl"):
+        super().__init__(maxsize, name)
+        self.expired = 0
+
+    def get(self, key: Hashable, now: Optional[float] = None) -> Optional[Any]:
+        now = time.time() if now is None else now
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at is None or expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.expired += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None, now: Optional[float] = None):
+        if ttl is not None and ttl <= 0:
+            return
+        expires_at = None if ttl is None else (time.time() if now is None else now) + ttl
+        super().put(key, (expires_at, value))
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """删除所有 predicate(key) 为真的条目，返回删除数量"""
+        with self._lock:
+            keys = [k for k in self._data if predicate(k)]
+            for k in keys:
+                del self._data[k]
+            return len(keys)
+
+    def stats(self) -> dict:
+        result = super().stats()
+        result["expired"] = self.expired
+        return result
@@ -0,0 +1,135 @@
+# app/domains/energy/api/search_executor.py
+"""
+公式检索专用执行器（与 asyncio 默认线程池隔离）：
+- 检索是 CPU 密集型（rapidfuzz / NumPy / 编码），放进默认线程池会和文件 IO、其他 to_thread 任务互相排队
+- 线程数固定（有界），排队深度 = 进行中任务数 - 线程数，stats() 中给出当前 / 历史最大排队深度与耗时
+- mode="process"：fork 出的子进程继承已加载的公式目录，嵌入矩阵为 mmap，多个进程共享同一份物理页，
+  并发查询不再受单个进程 GIL 限制；公式目录版本变化（热更新）后重建进程池，新进程继承新快照。
+  非 fork 平台（Windows）自动退回线程模式。
+  进程模式下子进程内的模块级缓存各自独立、主进程不可见，共享的缓存需由调用方留在主进程（见 formula_api）。
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+# ================= 日志配置 =================
+logger = logging.getLogger("domains.energy.api.search_executor")
+if not logger.handlers:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+    )
+
+
+class SearchExecutor:
+    def __init__(self, max_workers: int = 4, mode: str = "thread",
+                 generation: Optional[Callable[[], int]] = None,
+                 initializer: Optional[Callable[[], None]] = None,
+                 prepare: Optional[Callable[[], None]] = None):
+        """
+        generation：进程模式下返回当前公式目录版本，版本变化时重建进程池
+        initializer：进程模式下每个子进程启动时执行一次
+        prepare：进程模式下 fork 之前在主进程执行（例如等待后台线程持有的锁释放，避免子进程继承已加锁的锁）
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.mode = "thread"
+        if mode == "process":
+            if "fork" in multiprocessing.get_all_start_methods():
+                self.mode = "process"
+            else:
+                logger.warning("⚠️ 当前平台不支持 fork，公式检索执行器使用线程模式")
+        self._generation = generation
+        self._initializer = initializer
+        self._prepare = prepare
+        self._pool: Optional[Executor] = None
+        self._pool_generation = None
+        self._lock = threading.Lock()
+
+        # 以下计数只在事件循环线程中修改
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self._total_ms = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """已提交但还没有空闲 worker 执行的任务数"""
+        return max(0, self.in_flight - self.max_workers)
+
+    def _create_pool(self) -> Executor:
+        if self.mode == "process":
+            if self._prepare is not None:
+                self._prepare()
+            return ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=self._initializer,
+            )
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="formula-search")
+
+    def _get_pool(self) -> Executor:
+        with self._lock:
+            generation = self._generation() if self.mode == "process" and self._generation else None
+            if self._pool is None or generation != self._pool_generation:
+                old = self._pool
+                self._pool = self._create_pool()
+                self._pool_generation = generation
+                if old is not None:
+                    # 旧进程池中已提交的任务继续执行完
+                    old.shutdown(wait=False)
+                    logger.info(f"🔄 公式目录已更新（v{generation}），检索进程池已重建")
+            return self._pool
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """在检索执行器中执行 fn(*args, **kwargs)；进程模式下 fn 与参数需可 pickle（模块级函数）"""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        self.submitted += 1
+        self.in_flight += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        start = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+        except BrokenProcessPool:
+            # 子进程异常退出，下次调用重建进程池
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            self.failed += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        # completed / avg_ms 只统计成功的调用，失败单独计入 failed
+        self.completed += 1
+        self._total_ms += (time.perf_counter() - start) * 1000
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_ms": round(self._total_ms / self.completed, 3) if self.completed else 0.0,
+        }
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait)
+                self._pool = None
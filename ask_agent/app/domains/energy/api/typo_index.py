@@ -0,0 +1,241 @@
+# app/domains/energy/api/typo_index.py
+"""
+公式名称的错别字 / 拼音容错索引（fuzzy_search 的查询纠错）：
+- 词表为全部公式名称的 jieba 分词，查询中的词若在词表内直接保留
+- 同音字：汉字词转无声调拼音（pypinyin），按拼音查同音词表，例如 "高路" -> "gaolu" -> "高炉"；
+  多音字（如 "轧" ya / zha / ga）的各个读音都建键
+- 拼音输入："gaolu dianhao" 按拼音键直接查；连写的 "gaoludianhao" 按已知拼音键切分
+- 编辑距离：SymSpell 式删除字典，汉字词与拼音键各一份，查询只需生成删除变体做哈希查找，
+  再用 Levenshtein 距离校验，单次查询在亚毫秒级
+- 汉字词的同音纠错要求与原词至少有一个相同的字；拼音编辑距离只用于拼音输入，
+  汉字词仍受 allowed_distance 约束（两字词不做编辑距离纠错，避免 "高炉" 被改成 "锅炉"）
+纠错结果是词表中的词，交给 fuzzy_search 原有的 token_set_ratio 打分；
+correct_scored 另给出纠错质量（0~1，字形与读音相似度），fuzzy_search 按它给纠错候选打折。
+pypinyin 为可选依赖，未安装时只做汉字词的编辑距离纠错。
+"""
+import itertools
+import logging
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from rapidfuzz.distance import Levenshtein
+
+# ================= 日志配置 =================
+logger = logging.getLogger("domains.energy.api.typo_index")
+if not logger.handlers:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+    )
+
+try:
+    from pypinyin import Style, pinyin
+    HAVE_PINYIN = True
+except Exception as e:
+    HAVE_PINYIN = False
+    logger.warning(f"⚠️ pypinyin 导入失败，公式名称不支持拼音 / 同音字纠错: {e}")
+
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]")
+_PINYIN_RE = re.compile(r"^[a-z]+$")
+MAX_PINYIN_KEY_LENGTH = 32   # 连写拼音切分时单个键的最大长度
+MAX_PINYIN_VARIANTS = 8      # 多音字组合读音的上限，避免长词组合爆炸
+
+
+def has_cjk(s: str) -> bool:
+    return bool(_CJK_RE.search(s))
+
+
+def pinyin_variants(s: str) -> List[str]:
+    """
+    无声调拼音连写，非汉字原样保留："高炉" -> ["gaolu"]；
+    多音字按读音组合展开（常用读音在前）："冷轧" -> ["lengya", "lengzha", ...]
+    """
+    readings = pinyin(s, style=Style.NORMAL, heteronym=True)
+    combos = itertools.islice(itertools.product(*readings), MAX_PINYIN_VARIANTS)
+    return list(dict.fromkeys("".join(c).lower() for c in combos))
+
+
+def allowed_distance(s: str, max_distance: int) -> int:
+    """
+    按词长决定允许的编辑距离：
+    - 汉字词：两字词错一个字语义已完全不同，只有 3 字及以上允许 1 个字的差异
+    - 拼音 / 字母：4~7 个字母允许 1，8 个及以上允许 2
+    """
+    if has_cjk(s):
+        return min(max_distance, 1) if len(s) >= 3 else 0
+    if len(s) < 4:
+        return 0
+    return min(max_distance, 1 if len(s) < 8 else 2)
+
+
+def deletes(word: str, distance: int) -> Set[str]:
+    """word 删除至多 distance 个字符得到的全部变体（含 word 本身）"""
+    result = {word}
+    frontier = {word}
+    for _ in range(distance):
+        nxt = set()
+        for w in frontier:
+            if len(w) <= 1:
+                continue
+            nxt.update(w[:i] + w[i + 1:] for i in range(len(w)))
+        nxt -= result
+        result |= nxt
+        frontier = nxt
+    return result
+
+
+class _DeletionDictionary:
+    """SymSpell 式删除字典：删除变体 -> 原词，查询时两侧删除变体相交即为候选"""
+
+    def __init__(self, words: Dict[str, int], max_distance: int):
+        self.words = words              # 原词 -> 出现次数（用于同距离候选排序）
+        self.max_distance = max_distance
+        self.table: Dict[str, List[str]] = {}
+        for word in words:
+            for v in deletes(word, allowed_distance(word, max_distance)):
+                self.table.setdefault(v, []).append(word)
+
+    def lookup(self, word: str) -> Optional[str]:
+        """编辑距离最小的词（同距离取出现次数多的），超出允许距离返回 None"""
+        distance = allowed_distance(word, self.max_distance)
+        if distance == 0:
+            return None
+        best = None
+        for v in deletes(word, distance):
+            for cand in self.table.get(v, ()):
+                d = Levenshtein.distance(word, cand, score_cutoff=distance)
+                if d > distance:
+                    continue
+                key = (d, -self.words[cand], cand)
+                if best is None or key < best:
+                    best = key
+        return best[2] if best else None
+
+
+class TypoIndex:
+    def __init__(self, names_tokens: List[str], max_distance: int = 2):
+        # 每个词按出现的公式数计数，同音 / 同距离时优先常见词
+        freq = Counter(t for tokens in names_tokens for t in set(tokens.lower().split()))
+        self.vocab: Dict[str, int] = dict(freq)
+        self.max_distance = max_distance
+
+        # 拼音键 -> 同音词（按出现次数降序）
+        self.pinyin_to_terms: Dict[str, List[str]] = {}
+        if HAVE_PINYIN:
+            for term in sorted(freq, key=lambda t: (-freq[t], t)):
+                if has_cjk(term):
+                    for py in pinyin_variants(term):
+                        self.pinyin_to_terms.setdefault(py, []).append(term)
+        self.pinyin_keys = {py: freq[terms[0]] for py, terms in self.pinyin_to_terms.items()}
+
+        cjk_terms = {t: n for t, n in freq.items() if has_cjk(t)}
+        self.term_deletes = _DeletionDictionary(cjk_terms, max_distance)
+        self.pinyin_deletes = _DeletionDictionary(self.pinyin_keys, max_distance)
+
+    def _segment_pinyin(self, s: str) -> Optional[List[str]]:
+        """连写拼音按已知拼音键切分（键数最少的切法），切不开返回 None"""
+        best: List[Optional[List[str]]] = [None] * (len(s) + 1)
+        best[0] = []
+        for i in range(len(s)):
+            if best[i] is None:
+                continue
+            for j in range(i + 1, min(len(s), i + MAX_PINYIN_KEY_LENGTH) + 1):
+                if s[i:j] in self.pinyin_keys and (best[j] is None or len(best[i]) + 1 < len(best[j])):
+                    best[j] = best[i] + [s[i:j]]
+        return best[len(s)]
+
+    def _quality(self, term: str, terms: List[str]) -> float:
+        """纠错质量：汉字词取字形相似度与读音相似度的平均，拼音输入取拼音相似度"""
+        fixed = "".join(terms)
+        if has_cjk(term):
+            char_sim = Levenshtein.normalized_similarity(term, fixed)
+            if not HAVE_PINYIN:
+                return char_sim
+            py_sim = max(Levenshtein.normalized_similarity(a, b)
+                         for a in pinyin_variants(term) for b in pinyin_variants(fixed))
+            return (char_sim + py_sim) / 2
+        return max(Levenshtein.normalized_similarity(term, py) for py in pinyin_variants(fixed)) if HAVE_PINYIN else 0.0
+
+    def lookup_scored(self, term: str) -> Optional[Tuple[List[str], float]]:
+        """
+        单个查询词的纠错结果（词表中的一个或多个词）与纠错质量，无法纠正返回 None。
+        顺序：词表命中 -> 同音词 -> 拼音键 / 连写拼音切分 -> 汉字编辑距离 -> 拼音编辑距离（仅拼音输入）
+        """
+        term = term.lower()
+        if term in self.vocab:
+            return [term], 1.0
+        cjk = has_cjk(term)
+        if cjk:
+            variants = pinyin_variants(term) if HAVE_PINYIN else []
+        elif _PINYIN_RE.match(term):
+            variants = [term]
+        else:
+            return None   # 数字、字母数字混合的编号不做纠错
+
+        for py in variants:
+            for cand in self.pinyin_to_terms.get(py, ()):
+                # 同音词须与原词共享至少一个字（"高路" -> "高炉"），全异的同音词视为不同的词
+                if not cjk or set(term) & set(cand):
+                    return [cand], self._quality(term, [cand])
+        if cjk:
+            match = self.term_deletes.lookup(term)
+            return ([match], self._quality(term, [match])) if match else None
+
+        keys = self._segment_pinyin(term)
+        if keys:
+            return [self.pinyin_to_terms[k][0] for k in keys], 1.0
+        match = self.pinyin_deletes.lookup(term)
+        if match:
+            fixed = [self.pinyin_to_terms[match][0]]
+            return fixed, self._quality(term, fixed)
+        return None
+
+    def lookup(self, term: str) -> Optional[List[str]]:
+        found = self.lookup_scored(term)
+        return found[0] if found else None
+
+    def correct(self, tokens: str) -> Optional[str]:
+        found = self.correct_scored(tokens)
+        return found[0] if found else None
+
+    def correct_scored(self, tokens: str) -> Optional[Tuple[str, float]]:
+        """
+        tokens 为查询的 jieba 分词（空格分隔）；返回 (纠正后的分词, 纠错质量)，
+        全部词都在词表内或无法纠正时返回 None。质量按字数加权：1 - Σ 被纠正词字数 × (1 - 词质量) / 总字数。
+        连续的未知词（jieba 常把错别字切成单字）先合并查一次，失败再逐个查。
+        """
+        terms = tokens.lower().split()
+        if all(t in self.vocab for t in terms):
+            return None
+
+        out: List[str] = []
+        penalty = 0.0
+        changed = False
+        i = 0
+        while i < len(terms):
+            if terms[i] in self.vocab:
+                out.append(terms[i])
+                i += 1
+                continue
+            j = i
+            while j < len(terms) and terms[j] not in self.vocab:
+                j += 1
+            run = terms[i:j]
+            merged = self.lookup_scored("".join(run)) if len(run) > 1 else None
+            if merged:
+                out.extend(merged[0])
+                penalty += len("".join(run)) * (1 - merged[1])
+                changed = True
+            else:
+                for t in run:
+                    fixed = self.lookup_scored(t)
+                    out.extend(fixed[0] if fixed else [t])
+                    if fixed:
+                        penalty += len(t) * (1 - fixed[1])
+                        changed = True
+            i = j
+        if not changed:
+            return None
+        total = sum(len(t) for t in terms)
+        return " ".join(out), max(0.0, 1 - penalty / total)
@@ -0,0 +1,394 @@
+# app/domains/energy/api/vector_index.py
+"""
+公式名称向量检索索引（纯 NumPy 实现，可插拔）：
+- FlatIndex : 精确检索，argpartition 取 top-k，替代整表 argsort
+- IVFIndex  : 倒排文件近似检索（球面 k-means 粗聚类 + nprobe 探查），
+              构建结果以 .npz 持久化在嵌入缓存旁边，重启直接加载
+- QuantizedFlatIndex : int8（按行缩放）/ float16 量化存储的整表扫描，
+              可选对前 rerank 行用 float32 原始向量精排
+
+所有索引假设 embeddings 已做 L2 归一化，search 返回 (行号数组, 余弦相似度数组)，按相似度降序。
+"""
+import os
+import time
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# ================= 日志配置 =================
+logger = logging.getLogger("domains.energy.api.vector_index")
+if not logger.handlers:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+    )
+
+# VECTOR_INDEX_TYPE=auto 时，低于该行数使用 FlatIndex（整表点积已经足够快），达到后切换为 IVF
+AUTO_IVF_MIN_ROWS = 20000
+INDEX_FILE_VERSION = 2   # 2：指纹改为全量内容哈希
+
+
+# ===========================================================
+# 工具函数
+# ===========================================================
+def topk_desc(scores: np.ndarray, k: int) -> np.ndarray:
+    """返回 scores 中最大的 k 个下标（降序），O(N + k log k)"""
+    n = len(scores)
+    k = min(int(k), n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(n)
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def embeddings_fingerprint(embeddings: np.ndarray, chunk: int = 8192) -> str:
+    """
+    嵌入矩阵指纹（形状 + 全部行内容），用于判断持久化索引是否仍然有效。
+    分块读取，mmap 的嵌入文件不会被整体载入内存；任意一行变化都会改变指纹。
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(embeddings.shape).encode("utf-8"))
+    for start in range(0, len(embeddings), chunk):
+        h.update(np.ascontiguousarray(embeddings[start:start + chunk], dtype=np.float32).tobytes())
+    return h.hexdigest()
+
+
+# ===========================================================
+# FlatIndex：精确检索
+# ===========================================================
+class FlatIndex:
+    kind = "flat"
+
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def search(self, vec: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        sims = np.dot(self.embeddings, vec)
+        idxs = topk_desc(sims, k)
+        return idxs, sims[idxs]
+
+    def search_batch(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """多个查询一次矩阵乘法 (N, d) x (d, B)，整表只扫描一遍"""
+        sims = np.dot(self.embeddings, queries.T)
+        results = []
+        for j in range(sims.shape[1]):
+            col = sims[:, j]
+            idxs = topk_desc(col, k)
+            results.append((idxs, col[idxs]))
+        return results
+
+
+# ===========================================================
+# QuantizedFlatIndex：量化整表扫描 + float32 精排
+# ===========================================================
+QUANTIZATION_MODES = ("int8", "float16")
+
+
+def quantize_embeddings(embeddings: np.ndarray, mode: str, chunk: int = 8192):
+    """
+    量化嵌入矩阵，返回 (codes, scales)：
+    - int8   : 每行对称缩放 scale = max|x| / 127，x ≈ codes * scale
+    - float16: 直接转半精度，scales 为 None
+    """
+    n, dim = embeddings.shape
+    if mode == "float16":
+        return np.asarray(embeddings, dtype=np.float16), None
+    if mode != "int8":
+        raise ValueError(f"Unknown quantization mode: {mode}")
+
+    codes = np.empty((n, dim), dtype=np.int8)
+    scales = np.empty(n, dtype=np.float32)
+    for start in range(0, n, chunk):
+        block = np.asarray(embeddings[start:start + chunk], dtype=np.float32)
+        block_scales = np.abs(block).max(axis=1) / 127.0
+        block_scales[block_scales == 0] = 1.0
+        codes[start:start + chunk] = np.round(block / block_scales[:, None]).astype(np.int8)
+        scales[start:start + chunk] = block_scales
+    return codes, scales
+
+
+class QuantizedFlatIndex:
+    """
+    量化后的精确扫描：常驻内存只有 codes（int8 为 1/4，float16 为 1/2），
+    embeddings（通常是 mmap 的 float32 文件）只在精排时按行读取。
+    """
+
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray], mode: str,
+                 embeddings: Optional[np.ndarray] = None, rerank: int = 200, chunk: int = 256):
+        self.codes = codes
+        self.scales = scales
+        self.mode = mode
+        self.kind = f"flat-{mode}"
+        self.embeddings = embeddings
+        self.rerank = max(0, int(rerank)) if embeddings is not None else 0
+        self.chunk = chunk
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, mode: str = "int8", rerank: int = 200) -> "QuantizedFlatIndex":
+        codes, scales = quantize_embeddings(embeddings, mode)
+        return cls(codes, scales, mode, embeddings=embeddings if rerank > 0 else None, rerank=rerank)
+
+    def approx_scores(self, vec: np.ndarray) -> np.ndarray:
+        """分块把量化行转换为 float32 后做点积，避免整表解码"""
+        vec = np.asarray(vec, dtype=np.float32)
+        n = len(self.codes)
+        out = np.empty(n, dtype=np.float32)
+        buf = np.empty((self.chunk, self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, n, self.chunk):
+            block = self.codes[start:start + self.chunk]
+            b = buf[:len(block)]
+            np.copyto(b, block, casting="unsafe")
+            np.dot(b, vec, out=out[start:start + len(block)])
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+    def search(self, vec: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        approx = self.approx_scores(vec)
+        if self.rerank <= 0:
+            idxs = topk_desc(approx, k)
+            return idxs, approx[idxs]
+
+        # 量化分数取前 max(k, rerank) 行，再用 float32 原始向量精排
+        cand = topk_desc(approx, max(int(k), self.rerank))
+        cand_sorted = np.sort(cand)  # 顺序读取 mmap 更友好
+        exact = np.dot(np.asarray(self.embeddings[cand_sorted], dtype=np.float32), vec)
+        top = topk_desc(exact, k)
+        return cand_sorted[top], exact[top]
+
+
+# ===========================================================
+# IVFIndex：倒排近似检索
+# ===========================================================
+def _spherical_kmeans(x: np.ndarray, nlist: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    """在抽样数据上训练球面 k-means，返回 L2 归一化的聚类中心 (nlist, dim)"""
+    rng = np.random.default_rng(seed)
+    n_train = min(len(x), max(nlist * 64, 10000))
+    train = x[rng.choice(len(x), n_train, replace=False)] if n_train < len(x) else x
+    train = np.asarray(train, dtype=np.float32)
+    centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = np.argmax(train @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, train)
+        counts = np.bincount(assign, minlength=nlist)
+        # 空簇保持原中心
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = centroids / norms
+    return centroids
+
+
+def _assign_rows(x: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    """分块计算每行所属聚类，避免 N×nlist 大矩阵一次性占用内存"""
+    assign = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), chunk):
+        block = np.asarray(x[start:start + chunk], dtype=np.float32)
+        assign[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, embeddings: np.ndarray, centroids: np.ndarray,
+                 list_rows: np.ndarray, list_offsets: np.ndarray, nprobe: int = 8):
+        self.embeddings = embeddings
+        self.centroids = centroids
+        self.list_rows = list_rows          # 按聚类排序后的行号
+        self.list_offsets = list_offsets    # 第 c 个聚类对应 list_rows[offsets[c]:offsets[c+1]]
+        self.nprobe = max(1, min(int(nprobe), len(centroids)))
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, nlist: Optional[int] = None, nprobe: int = 8, seed: int = 0) -> "IVFIndex":
+        n = len(embeddings)
+        nlist = int(nlist or max(1, int(np.sqrt(n))))
+        nlist = max(1, min(nlist, n))
+        centroids = _spherical_kmeans(embeddings, nlist, seed=seed)
+        assign = _assign_rows(embeddings, centroids)
+        list_rows = np.argsort(assign, kind="stable").astype(np.int64)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+        return cls(embeddings, centroids, list_rows, list_offsets, nprobe=nprobe)
+
+    def search(self, vec: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        probe = topk_desc(np.dot(self.centroids, vec), self.nprobe)
+        rows = np.concatenate([self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe])
+        if len(rows) == 0:
+            return rows, np.empty(0, dtype=np.float32)
+        sims = np.dot(self.embeddings[rows], vec)
+        top = topk_desc(sims, k)
+        return rows[top], sims[top]
+
+    # ---- 持久化 ----
+    def save(self, path: str):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            version=np.array(INDEX_FILE_VERSION),
+            fingerprint=np.array(embeddings_fingerprint(self.embeddings)),
+            centroids=self.centroids,
+            list_rows=self.list_rows,
+            list_offsets=self.list_offsets,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, embeddings: np.ndarray, nprobe: int = 8) -> Optional["IVFIndex"]:
+        """加载持久化索引；版本或嵌入指纹不一致时返回 None"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data["version"]) != INDEX_FILE_VERSION:
+                    return None
+                if str(data["fingerprint"]) != embeddings_fingerprint(embeddings):
+                    return None
+                return cls(embeddings, data["centroids"], data["list_rows"], data["list_offsets"], nprobe=nprobe)
+        except Exception as e:
+            logger.warning(f"⚠️ 读取向量索引失败，将重新构建: {e}")
+            return None
+
+
+# ===========================================================
+# 评估：相对 FlatIndex 的召回率与延迟
+# ===========================================================
+def search_batch(index, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """批量检索：索引实现了 search_batch 时走批量路径，否则逐条 search"""
+    if hasattr(index, "search_batch"):
+        return index.search_batch(queries, k)
+    return [index.search(q, k) for q in queries]
+
+
+def search_subset(index, vec: np.ndarray, k: int, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    只在 rows（升序行号，例如元数据过滤后的子集）内精确检索，返回全表行号。
+    子集直接做点积，不经过 IVF 聚类；量化索引未保留 float32 向量时用量化值计算。
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    embeddings = getattr(index, "embeddings", None)
+    if embeddings is not None:
+        sims = np.dot(np.asarray(embeddings[rows], dtype=np.float32), vec)
+    else:
+        sims = np.dot(index.codes[rows].astype(np.float32), vec)
+        if index.scales is not None:
+            sims *= index.scales[rows]
+    order = topk_desc(sims, k)
+    return rows[order], sims[order]
+
+
+def evaluate_index(index, embeddings: np.ndarray, k: int = 15, n_queries: int = 200,
+                   noise: float = 0.05, seed: int = 0) -> Dict[str, float]:
+    """
+    用加噪后的样本行作为查询，比较 index 与 FlatIndex：
+    - recall@k：index 返回结果与精确 top-k 的交集比例
+    - flat_ms / index_ms：单次查询平均耗时
+    """
+    rng = np.random.default_rng(seed)
+    n_queries = min(n_queries, len(embeddings))
+    if n_queries == 0:
+        return {"recall": 1.0, "flat_ms": 0.0, "index_ms": 0.0, "k": k, "queries": 0}
+    rows = rng.choice(len(embeddings), n_queries, replace=False)
+    queries = np.asarray(embeddings[rows], dtype=np.float32)
+    queries = queries + rng.normal(0, noise, queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True) + 1e-12
+
+    flat = FlatIndex(embeddings)
+    t0 = time.perf_counter()
+    truth: List[set] = [set(flat.search(q, k)[0].tolist()) for q in queries]
+    flat_ms = (time.perf_counter() - t0) * 1000 / n_queries
+
+    t0 = time.perf_counter()
+    found = [index.search(q, k)[0].tolist() for q in queries]
+    index_ms = (time.perf_counter() - t0) * 1000 / n_queries
+
+    hits = sum(len(t.intersection(f)) for t, f in zip(truth, found))
+    total = sum(len(t) for t in truth) or 1
+    return {"recall": hits / total, "flat_ms": flat_ms, "index_ms": index_ms, "k": k, "queries": n_queries}
+
+
+def _log_evaluation(index, embeddings: np.ndarray):
+    stats = evaluate_index(index, embeddings)
+    logger.info(
+        f"📊 {index.kind} vs Flat: recall@{stats['k']}={stats['recall']:.3f}, "
+        f"flat {stats['flat_ms']:.3f}ms/query, {index.kind} {stats['index_ms']:.3f}ms/query"
+    )
+
+
+# ===========================================================
+# 构建入口
+# ===========================================================
+def build_vector_index(embeddings: Optional[np.ndarray], kind: str = "flat", index_path: Optional[str] = None,
+                       nlist: Optional[int] = None, nprobe: int = 8,
+                       quantization: str = "none", rerank: int = 200, evaluate: bool = False):
+    """
+    根据 kind 构建索引：
+    - flat : FlatIndex；quantization 为 int8 / float16 时使用 QuantizedFlatIndex（rerank 行 float32 精排）
+    - ivf  : IVFIndex（优先从 index_path 加载，否则构建并保存）
+    - auto : 行数 >= AUTO_IVF_MIN_ROWS 时使用 ivf，否则 flat（需显式配置，切换到 ivf 时记录警告）
+    evaluate=True 时对新建的近似索引做一次相对 FlatIndex 的召回评估并记录日志（整表暴力检索，
+    只用于排查；服务启动 / 热更新默认关闭，离线评估见 tools/bench_formula_search.py）
+    """
+    if embeddings is None:
+        return None
+
+    kind = (kind or "flat").lower()
+    if kind == "auto":
+        kind = "ivf" if len(embeddings) >= AUTO_IVF_MIN_ROWS else "flat"
+        if kind == "ivf":
+            logger.warning(
+                f"⚠️ 公式数 {len(embeddings)} >= {AUTO_IVF_MIN_ROWS}，auto 模式切换为 IVF 近似检索（召回率低于精确检索），"
+                f"需要精确结果请设置 VECTOR_INDEX_TYPE=flat"
+            )
+    if kind != "ivf":
+        if kind != "flat":
+            logger.warning(f"⚠️ 未知向量索引类型 {kind}，回退为 flat。")
+        quantization = (quantization or "none").lower()
+        if quantization in QUANTIZATION_MODES:
+            start = time.time()
+            index = QuantizedFlatIndex.build(embeddings, quantization, rerank=rerank)
+            logger.info(
+                f"✅ 使用 QuantizedFlatIndex ({len(embeddings)} rows, {quantization}, rerank={index.rerank}, "
+                f"{index.codes.nbytes / 1e6:.1f}MB vs float32 {len(embeddings) * embeddings.shape[1] * 4 / 1e6:.1f}MB) "
+                f"用时 {time.time() - start:.2f}s"
+            )
+            if evaluate:
+                _log_evaluation(index, embeddings)
+            return index
+        if quantization != "none":
+            logger.warning(f"⚠️ 未知量化模式 {quantization}，使用 float32。")
+        logger.info(f"✅ 使用 FlatIndex ({len(embeddings)} rows)")
+        return FlatIndex(embeddings)
+
+    start = time.time()
+    index = IVFIndex.load(index_path, embeddings, nprobe=nprobe) if index_path else None
+    if index is not None:
+        logger.info(f"✅ Loaded IVF index from cache (nlist={len(index.centroids)}, nprobe={index.nprobe})")
+        return index
+
+    index = IVFIndex.build(embeddings, nlist=nlist, nprobe=nprobe)
+    logger.info(f"✅ Built IVF index (nlist={len(index.centroids)}, nprobe={index.nprobe}) 用时 {time.time() - start:.2f}s")
+    if evaluate:
+        _log_evaluation(index, embeddings)
+    if index_path:
+        try:
+            index.save(index_path)
+        except Exception as e:
+            logger.warning(f"⚠️ 保存向量索引失败: {e}")
+    return index
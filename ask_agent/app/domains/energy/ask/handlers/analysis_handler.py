@@ -2,7 +2,7 @@
 import logging
 from app import core
 from app.domains import energy as energy_domain
-from .common import _resolve_formula, _execute_query, _finish
+from .common import _resolve_formula, _prefetch_formulas, _parse_candidates, _prepare_entries, _query_entries, _finish
 from .. import reply_templates
 
 logger = logging.getLogger("energy.ask.handlers.analysis")
@@ -60,19 +60,14 @@ async def handle_analysis(
         kept = [item for item in indicators if item.get("status") != "active"]
         parsed = []
 
-        # 2) 解析新的 candidates 为 active
-        for c in candidates:
+        # 2) 并发解析新的 candidates 为 active（结果顺序与 candidates 一致）
+        for parsed_res in await _parse_candidates(candidates):
             entry = core.default_indicators()
             entry["status"] = "active"
+            for key in ("indicator", "formula", "timeString", "timeType"):
+                if parsed_res.get(key):
+                    entry[key] = parsed_res[key]
 
-            try:
-                parsed_res = await energy_domain.llm.parse_user_input(c)
-                for key in ("indicator", "formula", "timeString", "timeType"):
-                    if parsed_res.get(key):
-                        entry[key] = parsed_res[key]
-            except Exception as e:
-                logger.warning("parse_user_input 解析失败: %s → %s", c, e)
-        
             # 自动补时间槽
             if entry.get("timeString") and entry.get("timeType"):
                 entry["slot_status"]["time"] = "filled"
@@ -85,55 +80,44 @@ async def handle_analysis(
     # -------------------------------------------------------
     # ③ 针对每个 indicator entry 开始补槽
     # -------------------------------------------------------
-    entries_results = []
-    for entry in indicators:
+    await _prefetch_formulas(indicators, graph)   # 多个指标一次批量解析
+
+    def _check(entry):
         # 3.1 缺指标
         if not entry.get("indicator"):
-            reply = "请告诉我您要查询的每个指标名称。"
-            return _finish(user_id, graph, user_input, intent_info, reply, reply_templates.reply_ask_indicator())
-        
+            return "请告诉我您要查询的每个指标名称。", reply_templates.reply_ask_indicator()
         # 3.2 补齐时间
         if entry["slot_status"]["time"] != "filled":
-            reply = f"我不太确定您查询时间范围，请告诉我您要查询的具体时间区间。"
-            return _finish(user_id, graph, user_input, intent_info, reply, reply_templates.reply_ask_time_unknown())
+            return "我不太确定您查询时间范围，请告诉我您要查询的具体时间区间。", reply_templates.reply_ask_time_unknown()
+        return None
 
+    async def _prepare(entry):
         if not ("~" in entry.get("timeString", "")):
             # 对于趋势分析，时间段格式需要特殊处理
             # 对时间进行LLM区间增强
             parsed_range = await energy_domain.llm.normalize_time_range(entry.get("timeString"), entry.get("timeType"))
             if not ("~" in parsed_range.get("timeString", "")):
                 reply = f"您提供的时间已经是最小粒度，无法提取用于趋势分析的时间范围。" 
-                return _finish(user_id, graph, user_input, intent_info, reply, reply_templates.reply_time_range_normalized_error())  
+                return reply, reply_templates.reply_time_range_normalized_error()
             logger.info(f"🧩 时间区间增强：{entry.get("timeString")}({entry.get("timeType")}) -> {parsed_range.get("timeString")}({parsed_range.get("timeType")})")
             entry["timeString"] = parsed_range.get("timeString")
             entry["timeType"] = parsed_range.get("timeType")
             entry["slot_status"]["time"] = "filled"
 
-        # 3.3 解析公式  
+        # 3.3 解析公式（返回非空 reply 时需要用户选择公式）
         reply, human_reply = await _resolve_formula(entry, graph)
-        if reply:
-            # 需要用户选择公式
-            return _finish(user_id, graph, user_input, intent_info, reply, human_reply)
-        
-        # 3.4 查询缓存节点
-        nid = graph.find_node(entry["indicator"], entry["timeString"])
-        if nid:
-            node = graph.get_node(nid)
-            ie = node.get("indicator_entry", {})
-            entry["value"] = ie.get("value")
-            entry["note"] = ie.get("note")
-            entry["status"] = "completed"
-            entries_results.append(entry)
-            continue
+        return (reply, human_reply) if reply else None
+
+    # 各指标并发补槽（区间增强 + 公式解析），按顺序提示第一个缺失槽位
+    prompt, ready = await _prepare_entries(indicators, _check, _prepare)
 
-        # 3.5 平台查询
-        reply, human_reply, done = await _execute_query(entry)
-        if not done:
-            return _finish(user_id, graph, user_input, intent_info, reply, human_reply)
-        entry["status"] = "completed"
-        graph.set_intent_info(intent_info)
-        graph.add_node(entry)
-        entries_results.append(entry)
+    # 3.4 复用已有节点 / 3.5 平台查询（同一时间区间的多个指标一次请求，不同区间并发）
+    # 成功的指标全部写入图谱，再提示第一个失败
+    # 需要用户补槽 / 选择公式时，先查询其之前已就绪的指标，再返回提示
+    failure, _ = await _query_entries(ready, graph, intent_info)
+    if prompt or failure:
+        return _finish(user_id, graph, user_input, intent_info, *(prompt or failure))
+    entries_results = [entry for entry in indicators if entry.get("status") == "completed"]
     # -------------------------------------------------------
     # ④ 所有指标完成 → 写关系、输出回复
     # -------------------------------------------------------
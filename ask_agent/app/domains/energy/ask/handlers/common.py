@@ -6,6 +6,7 @@ import inspect
 from app import core
 from .. import reply_templates
 from app.domains import energy as energy_domain
+from config import ASK_MAX_CONCURRENCY
 
 logger = logging.getLogger("energy.ask.handlers.common")
 if not logger.handlers:
@@ -25,6 +26,67 @@ def _finish(user_id: str,graph: core.ContextGraph, user_input, intent_info, repl
     core.set_graph(user_id, graph)
     return reply, human_reply, graph.to_state()
 
+async def _gather_limited(coros, limit: int | None = None):
+    """
+    并发执行协程（同时最多 limit 个，默认 ASK_MAX_CONCURRENCY），返回结果顺序与输入顺序一致。
+    """
+    sem = asyncio.Semaphore(max(1, limit or ASK_MAX_CONCURRENCY))
+
+    async def _run(coro):
+        async with sem:
+            return await coro
+
+    return await asyncio.gather(*(_run(c) for c in coros))
+
+async def _parse_candidates(candidates):
+    """并发 LLM 解析多个 candidate，返回与 candidates 顺序一致的解析结果（失败为 {}）"""
+    async def _parse(c):
+        try:
+            return await energy_domain.llm.parse_user_input(c) or {}
+        except Exception as e:
+            logger.warning("parse_user_input 解析失败: %s → %s", c, e)
+            return {}
+
+    return await _gather_limited(_parse(c) for c in candidates)
+
+async def _prepare_entries(entries, check, prepare):
+    """
+    多指标补槽流水线：
+    - check(entry)：同步检查（缺指标 / 缺时间），按顺序执行，遇到第一个缺失即停止
+    - prepare(entry)：异步补槽（时间区间增强、公式解析），对 check 通过的 entry 并发执行
+    两者均返回 None 或 (reply, human_reply)。返回 (prompt, ready)：
+    prompt 为按 entries 顺序的第一个提示（与逐条执行时提示的是同一个缺失槽位），全部就绪时为 None；
+    ready 为该提示之前已补齐槽位的 entry，调用方可先查询它们（与逐条执行时一样不阻塞在后面的提示上）。
+    """
+    candidates, blocked = [], None
+    for entry in entries:
+        blocked = check(entry)
+        if blocked:
+            break
+        candidates.append(entry)
+    ready = []
+    for entry, prompt in zip(candidates, await _gather_limited(prepare(e) for e in candidates)):
+        if prompt:
+            return prompt, ready
+        ready.append(entry)
+    return blocked, ready
+
+async def _prefetch_formulas(entries, graph: core.ContextGraph):
+    """
+    多指标场景：把待解析的指标一次交给 formula_query_batch（一次 encode），
+    结果进入 formula_api 的结果缓存，随后逐条 _resolve_formula 直接命中。
+    """
+    texts = [
+        e["indicator"] for e in entries
+        if e.get("indicator") and e.get("status") != "completed" and not graph.get_preference(e["indicator"])
+    ]
+    if len(texts) < 2:
+        return
+    try:
+        await energy_domain.formula_api.formula_query_batch_async(texts)
+    except Exception as e:
+        logger.warning(f"⚠️ 批量解析公式失败，逐条解析: {e}")
+
 async def _resolve_formula(current, graph: core.ContextGraph):
     # 仅仅用formula 已确定，不能判断，因为如果因为网络问题导致最后一步平台接口失败，重新询问一遍会导致指标名称被覆盖，这个时候必须再查一遍
     if current["status"] == "completed":
@@ -38,7 +100,7 @@ async def _resolve_formula(current, graph: core.ContextGraph):
         current["slot_status"]["formula"] = "filled"
         return None, None
 
-    resp = await asyncio.to_thread(energy_domain.formula_api.formula_query_dict, current["indicator"])
+    resp = await energy_domain.formula_api.formula_query_dict_async(current["indicator"])
     exact = resp.get("exact_matches") or []
     cand = resp.get("candidates") or []
 
@@ -129,6 +191,9 @@ async def _execute_query(indicator_entry):
         logger.exception("❌ platform_api 查询失败: %s", e)
         return f"查询失败: {e}", reply_templates.reply_api_error(), False 
 
+    return _apply_query_result(indicator_entry, result)
+
+def _apply_query_result(indicator_entry, result):
     val = None
     if isinstance(result, dict):
         val = result.get("value") or next(iter(result.values()), None)
@@ -140,6 +205,80 @@ async def _execute_query(indicator_entry):
     indicator_entry["note"] = reply
     human_reply = reply_templates.reply_success_single(indicator_entry)
     return reply, human_reply, True
+
+async def _execute_queries(indicator_entries):
+    """
+    多指标平台查询：按 (timeString, timeType) 分组，每组一个 query_platform_batch 请求（各组并发），
+    结果按公式拆回各 entry。返回与 indicator_entries 顺序一致的 [(reply, human_reply, done), ...]。
+    """
+    groups = {}
+    outcomes = {}
+    for entry in indicator_entries:
+        if not entry.get("formula"):
+            # 公式未解析的 entry 不能当作查询成功
+            logger.warning(f"⚠️ 指标【{entry.get('indicator')}】未解析到公式，跳过平台查询")
+            outcomes[id(entry)] = (f"查询失败: 指标【{entry.get('indicator')}】未解析到公式",
+                                   reply_templates.reply_no_formula(entry.get("indicator")), False)
+            continue
+        groups.setdefault((entry.get("timeString"), entry.get("timeType")), []).append(entry)
+
+    async def _run_group(time_str, time_type, entries):
+        if len(entries) == 1:
+            return [await _execute_query(entries[0])]
+        try:
+            results = await energy_domain.platform_api.query_platform_batch(
+                [e.get("formula") for e in entries], time_str, time_type
+            )
+            logger.info(f"⚙️ 平台批量查询成功: {len(entries)} 个指标 / 1 组 ({time_str}, {time_type})")
+        except Exception as e:
+            logger.exception("❌ platform_api 批量查询失败: %s", e)
+            return [(f"查询失败: {e}", reply_templates.reply_api_error(), False) for _ in entries]
+        group_results = []
+        for entry in entries:
+            if entry.get("formula") not in results:
+                # 批量结果缺少该公式，视为查询失败而不是值为 None 的成功
+                group_results.append((f"查询失败: 公式 {entry.get('formula')} 无返回结果", reply_templates.reply_api_error(), False))
+            else:
+                group_results.append(_apply_query_result(entry, results[entry.get("formula")]))
+        return group_results
+
+    # 不同时间的分组互不依赖，并发请求
+    group_outcomes = await _gather_limited(_run_group(ts, tt, entries) for (ts, tt), entries in groups.items())
+    for entries, results in zip(groups.values(), group_outcomes):
+        for entry, outcome in zip(entries, results):
+            outcomes[id(entry)] = outcome
+    return [outcomes[id(entry)] for entry in indicator_entries]
+
+async def _query_entries(entries, graph: core.ContextGraph, intent_info):
+    """
+    多指标查询并写入图谱：已有节点的 entry 直接复用，其余经 _execute_queries 并发查询。
+    所有成功的 entry 都标记 completed 并 add_node（不因前面的失败而丢弃），
+    返回 (第一个失败的 (reply, human_reply) 或 None, {id(entry): node})。
+    """
+    nodes, pending = {}, []
+    for entry in entries:
+        # 查询缓存节点
+        nid = graph.find_node(entry.get("indicator"), entry.get("timeString"))
+        if nid:
+            node = graph.get_node(nid)
+            ie = node.get("indicator_entry", {})
+            entry["value"] = ie.get("value")
+            entry["note"] = ie.get("note")
+            entry["status"] = "completed"
+            nodes[id(entry)] = node
+            continue
+        pending.append(entry)
+
+    failure = None
+    for entry, (reply, human_reply, done) in zip(pending, await _execute_queries(pending)):
+        if not done:
+            failure = failure or (reply, human_reply)
+            continue
+        entry["status"] = "completed"
+        graph.set_intent_info(intent_info)   # 必须在 add_node 前
+        nodes[id(entry)] = graph.get_node(graph.add_node(entry))
+    return failure, nodes
+
 # ==== 2. 判断是否为重选场景 ====
 def _is_reselect_intent(intent_info: dict, user_input: str) -> bool:
     """
@@ -2,7 +2,7 @@
 import logging
 from app import core
 from app.domains import energy as energy_domain
-from .common import _resolve_formula, _execute_query, _finish
+from .common import _resolve_formula, _execute_query, _parse_candidates, _prepare_entries, _query_entries, _finish
 from .. import reply_templates
 
 logger = logging.getLogger("energy.ask.handlers.compare")
@@ -23,6 +23,7 @@ async def handle_compare(
     compare 主入口（重构版）
     - 支持 one-step / two-step / three-step
     - 复用 _load_or_init_indicator, _resolve_formula, _execute_query, _finish
+    - one-step 的两个指标并发解析与查询（_prepare_entries / _query_entries）
     - 所有分支通过 _finish 统一写状态并返回 (reply, human_reply, state)
     - 最终输出为：表格（reply_success_list） + LLM 分析总结
     """
@@ -65,16 +66,12 @@ async def handle_compare(
         """
         logger.info("🔎 compare: one-step 使用 candidates 解析: %s", candidates)
         parsed_items = []
-        # only consider first two candidates
-        for c in candidates[:2]:
+        # only consider first two candidates (parsed concurrently, order preserved)
+        for parsed in await _parse_candidates(candidates[:2]):
             item = core.default_indicators()
-            try:
-                parsed = await energy_domain.llm.parse_user_input(c)
-                for key in ("indicator", "formula", "timeString", "timeType"):
-                    if parsed.get(key):
-                        item[key] = parsed[key]
-            except Exception as e:
-                logger.warning("parse_user_input 单 candidate 解析失败: %s -> %s", c, e)
+            for key in ("indicator", "formula", "timeString", "timeType"):
+                if parsed.get(key):
+                    item[key] = parsed[key]
             item["slot_status"]["time"] = "filled" if item.get("timeString") and item.get("timeType") else "missing"
             parsed_items.append(item)
 
@@ -86,46 +83,34 @@ async def handle_compare(
         # replace intent indicators
         intent_info["indicators"] = parsed_items
 
-        node_compares = []
-        for item in parsed_items:
+        def _check(item):
             if not item.get("indicator"):
-                return _finish(user_id, graph, user_input, intent_info, "请告诉我您要对比的指标名称。", reply_templates.reply_ask_indicator())
+                return "请告诉我您要对比的指标名称。", reply_templates.reply_ask_indicator()
+            return None
 
+        async def _prepare(item):
             # resolve formula (uses your existing helper that returns (reply, human_reply) when needs user)
             formula_reply, human_reply = await _resolve_formula(item, graph)
             if formula_reply:
-                # persist intent_info and ask user to choose formula / re-enter
-                return _finish(user_id, graph, user_input, intent_info, formula_reply, human_reply)
+                return formula_reply, human_reply
 
             # ensure time
             if item.get("slot_status", {}).get("time") != "filled":
                 ask = f"好的，要对比【{item.get('indicator')}】，请告诉我时间。"
                 item["note"] = ask
-                return _finish(user_id, graph, user_input, intent_info, ask, reply_templates.reply_compare_single_missing_time(item.get("indicator")))
-
-            # try retrieve existing node
-            nid = graph.find_node(item.get("indicator"), item.get("timeString"))
-            if nid:
-                node = graph.get_node(nid)
-                ie = node.get("indicator_entry")
-                item["value"] = ie.get("value")
-                item["note"] = ie.get("note")
-                item["status"] = "completed"
-                graph.set_intent_info(intent_info)
-                node_compares.append(node)
-                continue
-
-            # execute platform query
-            reply, human_reply, done = await _execute_query(item)
-            if not done:
-                return _finish(user_id, graph, user_input, intent_info, reply, human_reply)
-            item["status"] = "completed"
-             # 必须在addNode前
-            graph.set_intent_info(intent_info)
-            # 写入 graph.node
-            node_id = graph.add_node(item)
-            node_obj = graph.get_node(node_id)
-            node_compares.append(node_obj)
+                return ask, reply_templates.reply_compare_single_missing_time(item.get("indicator"))
+            return None
+
+        # two items resolve concurrently; the first missing slot (in order) is asked
+        prompt, ready = await _prepare_entries(parsed_items, _check, _prepare)
+
+        # reuse existing nodes, query the ready items concurrently (same-time items share one request);
+        # items before a prompt are still queried so their results are kept for the next turn
+        failure, nodes = await _query_entries(ready, graph, intent_info)
+        if prompt or failure:
+            # persist intent_info and ask user to choose formula / re-enter / give time
+            return _finish(user_id, graph, user_input, intent_info, *(prompt or failure))
+        node_compares = [nodes[id(item)] for item in parsed_items if id(item) in nodes]
 
         # must have two entries
         if len(node_compares) != 2:
@@ -34,6 +34,27 @@ LOGIN_URL = os.getenv("LOGIN_URL")
 QUERY_URL = os.getenv("QUERY_URL")
 RANGE_QUERY_URL = os.getenv("RANGE_QUERY_URL")
 TOKEN_EXPIRE_DURATION = timedelta(hours=float(os.getenv("TOKEN_EXPIRE_HOURS", 1)))
+# 过期前多少秒在后台提前刷新 token（0 表示关闭，仅在请求时发现过期才登录）
+TOKEN_REFRESH_MARGIN = float(os.getenv("TOKEN_REFRESH_MARGIN", 300))
+# 平台接口共享连接池（整个进程一个 aiohttp.ClientSession）：总连接数 / 单主机连接数 / 空闲连接保活秒数 / DNS 缓存秒数
+PLATFORM_HTTP_LIMIT = int(os.getenv("PLATFORM_HTTP_LIMIT", 100))
+PLATFORM_HTTP_LIMIT_PER_HOST = int(os.getenv("PLATFORM_HTTP_LIMIT_PER_HOST", 20))
+PLATFORM_HTTP_KEEPALIVE = float(os.getenv("PLATFORM_HTTP_KEEPALIVE", 60))
+PLATFORM_HTTP_DNS_TTL = int(os.getenv("PLATFORM_HTTP_DNS_TTL", 300))
+# query_platform_batch 单个请求最多携带的公式数
+PLATFORM_BATCH_MAX_FORMULAS = int(os.getenv("PLATFORM_BATCH_MAX_FORMULAS", 50))
+# 平台多公式单点查询的返回格式，确认后才合并请求：off（默认，逐个公式请求）/ dict（{公式: 值}）/ records（记录列表）
+PLATFORM_BATCH_SHAPE = os.getenv("PLATFORM_BATCH_SHAPE", "off").lower()
+# records 格式下标识记录所属公式的字段
+PLATFORM_BATCH_RECORD_KEY = os.getenv("PLATFORM_BATCH_RECORD_KEY", "formula")
+# 平台查询结果缓存（进程内共享）：条目数上限（0 关闭缓存）
+PLATFORM_CACHE_SIZE = int(os.getenv("PLATFORM_CACHE_SIZE", 4096))
+# 未知 timeType / 无法解析的时间使用的 TTL（秒）；已知 timeType 的当前周期 TTL 见 platform_cache.CURRENT_TTL_BY_TYPE
+PLATFORM_CACHE_CURRENT_TTL = int(os.getenv("PLATFORM_CACHE_CURRENT_TTL", 300))
+# 周期结束后仍可能补录 / 重算的时长（秒），期间按当前周期 TTL 缓存
+PLATFORM_CACHE_SETTLE_SEC = int(os.getenv("PLATFORM_CACHE_SETTLE_SEC", 3600))
+# 已结束周期的 TTL（秒），0 表示不过期
+PLATFORM_CACHE_CLOSED_TTL = int(os.getenv("PLATFORM_CACHE_CLOSED_TTL", 0))
 
 # === 模型配置 ===
 LLM_CHAIN = os.getenv("LLM_CHAIN", "api,remote,local").lower().split(",")
@@ -50,6 +71,44 @@ LOCAL_MODEL = os.getenv("LOCAL_MODEL")
 EMBEDDING_CACHE_NAME = os.getenv("EMBEDDING_CACHE_NAME")
 FORMULA_CSV_NAME = os.getenv("FORMULA_CSV_NAME")
 
+# 向量索引：flat（精确，默认）/ ivf（近似，召回率低于精确检索，需显式开启）/ auto（公式数 >= 20000 时切换为 ivf）
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat").lower()
+VECTOR_INDEX_NLIST = int(os.getenv("VECTOR_INDEX_NLIST", 0)) or None  # 0 表示按 sqrt(N) 自动计算
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", 8))
+# 构建 ivf / 量化索引后做一次相对精确检索的召回评估（整表暴力检索，拖慢启动与热更新，仅排查时开启）
+VECTOR_INDEX_EVALUATE = os.getenv("VECTOR_INDEX_EVALUATE") in ["True", "true", "1"]
+# 嵌入量化（仅 flat 索引）：none / int8 / float16；RERANK 为 float32 精排行数，0 表示不精排
+# CPU 上推荐 int8（内存 1/4 且扫描更快）；float16 只省内存，NumPy 半精度转换较慢
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "none").lower()
+EMBEDDING_RERANK_TOPK = int(os.getenv("EMBEDDING_RERANK_TOPK", 200))
+# 嵌入模型后端：torch（sentence-transformers）/ onnx（ONNX Runtime CPU，需先用 tools/export_sbert_onnx.py 导出）
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")              # 为空时依次查找 onnx/model.onnx、model.onnx
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", 0))    # 0 表示由 onnxruntime 自动决定
+# 查询向量 LRU 缓存条目数（0 表示关闭）
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 2048))
+# formula_query_dict 结果 LRU 缓存条目数（0 表示关闭），公式目录重载后自动失效
+FORMULA_RESULT_CACHE_SIZE = int(os.getenv("FORMULA_RESULT_CACHE_SIZE", 1024))
+# 公式目录分词进程数（0 表示按 CPU 自动选择，1 表示串行）
+TOKENIZE_WORKERS = int(os.getenv("TOKENIZE_WORKERS", 0))
+# 后台初始化：服务端口先开放，公式目录与嵌入模型在后台加载，模型就绪前只做精确 / fuzzy 匹配
+FORMULA_BACKGROUND_INIT = os.getenv("FORMULA_BACKGROUND_INIT") in ["True", "true", "1"]
+# 后台初始化构建公式目录失败时的重试间隔（秒）：从 BASE 开始指数退避，最长 MAX
+FORMULA_INIT_RETRY_BASE_SEC = float(os.getenv("FORMULA_INIT_RETRY_BASE_SEC", 5))
+FORMULA_INIT_RETRY_MAX_SEC = float(os.getenv("FORMULA_INIT_RETRY_MAX_SEC", 300))
+# 公式查询默认元数据过滤条件，例如 "ISLATEST=1" 或 "ISLATEST=1,FIELDNAME=SUMVALUE|REPORTVALUE"（为空表示不过滤）
+FORMULA_DEFAULT_FILTERS = os.getenv("FORMULA_DEFAULT_FILTERS", "")
+# 公式 CSV 热更新轮询间隔（秒），0 表示不监听，只能通过 /admin/formula/reload 手动触发
+FORMULA_WATCH_INTERVAL = int(os.getenv("FORMULA_WATCH_INTERVAL", 0))
+# 公式名称错别字 / 拼音容错（默认开启）：查询词不在公式词表内时按同音字、拼音与编辑距离纠正后再做 fuzzy 打分
+FORMULA_TYPO_TOLERANCE = os.getenv("FORMULA_TYPO_TOLERANCE", "true") in ["True", "true", "1"]
+# 容错允许的最大编辑距离（实际按词长收紧：汉字 3 字以上为 1，拼音 8 字母以上才用到 2）
+FORMULA_TYPO_MAX_DISTANCE = int(os.getenv("FORMULA_TYPO_MAX_DISTANCE", 2))
+# 公式检索专用执行器：worker 数（0 表示 min(CPU 数, 4)）与模式
+# thread：独立线程池，不占用 asyncio 默认线程池；process：fork 进程池，共享 mmap 嵌入，不受 GIL 限制（仅 Linux / macOS）
+FORMULA_SEARCH_WORKERS = int(os.getenv("FORMULA_SEARCH_WORKERS", 0))
+FORMULA_SEARCH_EXECUTOR = os.getenv("FORMULA_SEARCH_EXECUTOR", "thread").lower()
+
 TEXT_SCORE_WEIGHT_FILE = os.getenv("TEXT_SCORE_WEIGHT_FILE")
 ENABLE_TEXT_SCORE_WEIGHT = os.getenv("ENABLE_TEXT_SCORE_WEIGHT") in ["True", "true", "1"]
 
@@ -57,6 +116,9 @@ ENABLE_GRAGH_DEBUG_JSON = os.getenv("ENABLE_GRAGH_DEBUG_JSON") in ["True", "true
 
 ENABLE_REMOVE_SYMBOLS = os.getenv("ENABLE_REMOVE_SYMBOLS") in ["True", "true", "1"]
 
+# 多指标问答（list / analysis / compare）中并发执行的 LLM 解析、公式解析、平台查询上限
+ASK_MAX_CONCURRENCY = int(os.getenv("ASK_MAX_CONCURRENCY", 4))
+
 with open(CONFIG_DIR / TEXT_SCORE_WEIGHT_FILE, "r", encoding="utf-8") as f:
     raw_cfg = json.load(f)
 
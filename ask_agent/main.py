@@ -11,6 +11,7 @@ from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from tools.agent_state import get_state, update_state, cleanup_expired_sessions
+import config # 导入配置
 
 TOP_N = 5  # 显示候选数量
 
@@ -41,6 +42,7 @@ async def startup_event():
     在服务启动时执行：
       - 初始化公式数据（同步加载）；
       - 启动清理任务；
+      - 创建平台接口共享连接池，启动 token 后台刷新；
     """
     try:
         start = time.time()
@@ -53,6 +55,18 @@ async def startup_event():
     asyncio.create_task(cleanup_expired_sessions())
     logger.info("🧹 已启动 session 定期清理任务。")
 
+    await energy_domain.platform_api.init_session()
+    if config.TOKEN_REFRESH_MARGIN > 0:
+        asyncio.create_task(energy_domain.platform_api.token_refresh_task(config.TOKEN_REFRESH_MARGIN))
+        logger.info("🔑 已启动 token 后台刷新任务。")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭公式检索执行器与平台接口连接池"""
+    energy_domain.formula_api.shutdown_search_executor()
+    await energy_domain.platform_api.close_session()
+
 
 # ----------------------
 # 接口定义
@@ -171,7 +185,7 @@ async def handle_chat(user_id: str, user_input: str):
         # Step5️⃣ 调用 formula_api 匹配公式
         if not slots.get("formula") and slots.get("indicator"):
             t0 = time.time()
-            formula_resp = await asyncio.to_thread(energy_domain.formula_api.formula_query_dict, slots["indicator"])
+            formula_resp = await energy_domain.formula_api.formula_query_dict_async(slots["indicator"])
             logger.info(f"✅ formula_api.formula_query_dict 用时 {time.time() - t0:.2f}s")
 
             if formula_resp.get("done"):
@@ -50,14 +50,16 @@ app.mount("/images", StaticFiles(directory=images_dir), name="images")
 async def startup_event():
     """
     在服务启动时执行：
-      - 初始化公式数据（同步加载）；
+      - 初始化公式数据（同步加载；FORMULA_BACKGROUND_INIT 时在后台加载）；
       - 启动清理任务；
+      - 创建平台接口共享连接池，启动 token 后台刷新；
+      - 可选：启动公式 CSV 热更新监听；
     """
     try:
         start = time.time()
         # 只初始化一次，不会重复加载
-        energy_domain.formula_api.initialize()
-        logger.info(f"✅ formula_api 初始化完成，用时 {time.time() - start:.2f}s")
+        energy_domain.formula_api.initialize(background=config.FORMULA_BACKGROUND_INIT)
+        logger.info(f"✅ formula_api 初始化{'已转入后台' if config.FORMULA_BACKGROUND_INIT else '完成'}，用时 {time.time() - start:.2f}s")
     except Exception as e:
         logger.exception("❌ 初始化 formula_api 失败: %s", e)
 
@@ -66,6 +68,21 @@ async def startup_event():
     asyncio.create_task(core.persist_all_graphs_task(300))
     logger.info("🧹 已启动 graph 定期持久任务。")
 
+    await energy_domain.platform_api.init_session()
+    if config.TOKEN_REFRESH_MARGIN > 0:
+        asyncio.create_task(energy_domain.platform_api.token_refresh_task(config.TOKEN_REFRESH_MARGIN))
+        logger.info("🔑 已启动 token 后台刷新任务。")
+
+    if config.FORMULA_WATCH_INTERVAL > 0:
+        asyncio.create_task(energy_domain.formula_api.watch_catalog_task(config.FORMULA_WATCH_INTERVAL))
+        logger.info(f"📂 已启动公式 CSV 热更新监听（{config.FORMULA_WATCH_INTERVAL}s）。")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭公式检索执行器（进程模式下回收子进程）与平台接口连接池"""
+    energy_domain.formula_api.shutdown_search_executor()
+    await energy_domain.platform_api.close_session()
+
 @app.get("/chat")
 async def chat_get(
     user_id: str = Query(..., description="用户唯一标识，例如 test1"),
@@ -75,6 +92,81 @@ async def chat_get(
     result = await route_intent(user_id, message, pretty)
     return result
 
+@app.get("/health")
+async def health():
+    """就绪检查：公式目录加载前返回 503（status=starting），formula 字段反映公式目录与语义模型是否就绪"""
+    info = energy_domain.formula_api.catalog_info()
+    if not info["initialized"]:
+        return JSONResponse({"status": "starting", "formula": info}, status_code=503)
+    return {"status": "ok", "formula": info}
+
+@app.get("/formula_query")
+async def formula_query(
+    user_input: str = Query(..., description="User input: keyword or exact formula name"),
+    topn: int = Query(5, ge=1, le=50, description="Number of candidates to return"),
+    method: str = Query("hybrid", description="Search method: fuzzy | semantic | hybrid"),
+    filters: str = Query("", description="Metadata filters, e.g. ISLATEST=1,FIELDNAME=SUMVALUE|REPORTVALUE")
+):
+    parsed = energy_domain.formula_api.parse_filters(filters) if filters else None
+    return await energy_domain.formula_api.formula_query_dict_async(user_input, topn, method, parsed)
+
+@app.post("/formula_query_batch")
+async def formula_query_batch(request: Request):
+    """
+    批量解析指标：{"inputs": ["1#高炉工序能耗", ...], "topn": 5, "method": "hybrid", "filters": {"ISLATEST": "1"}}
+    返回与 inputs 一一对应的结果列表（格式同 /formula_query）
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "request body must be JSON"}, status_code=400)
+    if not isinstance(data, dict):
+        return JSONResponse({"error": "request body must be a JSON object"}, status_code=400)
+    inputs = data.get("inputs") or []
+    if not isinstance(inputs, list):
+        return JSONResponse({"error": "inputs must be a list"}, status_code=400)
+    # 与 /formula_query 一致：缺省为 5，须为 1~50 的整数
+    topn = data.get("topn")
+    if topn is None:
+        topn = 5
+    elif isinstance(topn, str) and topn.strip().isdigit():
+        topn = int(topn)
+    if isinstance(topn, bool) or not isinstance(topn, int) or not 1 <= topn <= 50:
+        return JSONResponse({"error": "topn must be an integer between 1 and 50"}, status_code=400)
+    method = data.get("method", "hybrid")
+    filters = data.get("filters")
+    if isinstance(filters, str):
+        filters = energy_domain.formula_api.parse_filters(filters)
+    try:
+        energy_domain.formula_api.normalize_filters(filters)   # 须为 {列名: 取值 或 [取值, ...]}
+    except ValueError as e:
+        return JSONResponse({"error": f"invalid filters: {e}"}, status_code=400)
+    results = await energy_domain.formula_api.formula_query_batch_async(inputs, topn, method, filters)
+    return {"results": results}
+
+@app.post("/admin/formula/reload")
+async def reload_formula_catalog(
+    force: bool = Query(False, description="CSV 未变化时也强制重建")
+):
+    """后台重建公式目录快照，构建完成前旧快照继续提供查询"""
+    started = energy_domain.formula_api.start_background_reload(force)
+    return {"started": started, **energy_domain.formula_api.catalog_info()}
+
+@app.get("/admin/platform/cache")
+async def platform_cache_stats():
+    """平台查询结果缓存命中率（总体与 current / settling / closed 各层）"""
+    return energy_domain.platform_api.cache_stats()
+
+@app.post("/admin/platform/cache/invalidate")
+async def invalidate_platform_cache(
+    formula: str = Query(None, description="只失效该公式，默认不限"),
+    timeString: str = Query(None, description="只失效该时间，默认不限"),
+    timeType: str = Query(None, description="只失效该时间粒度，默认不限")
+):
+    """平台补录 / 重算数据后失效对应缓存，参数全部为空时清空"""
+    removed = energy_domain.platform_api.invalidate_cache(formula, timeString, timeType)
+    return {"removed": removed, **energy_domain.platform_api.cache_stats()}
+
 # 检查接口（非必须，StaticFiles 已能直接提供文件）
 @app.get("/image/{filename}")
 async def get_image(filename: str):
@@ -0,0 +1,102 @@
+# tests/unit/test_ask_pipeline.py
+import asyncio
+
+from app.domains.energy.api import platform_api
+from app.domains.energy.ask.handlers import common
+
+
+def test_gather_limited_keeps_order_and_limit():
+    state = {"running": 0, "peak": 0}
+
+    async def job(i):
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        await asyncio.sleep(0.01 * (5 - i))   # 后提交的先完成
+        state["running"] -= 1
+        return i
+
+    results = asyncio.run(common._gather_limited((job(i) for i in range(5)), limit=2))
+    assert results == [0, 1, 2, 3, 4]
+    assert state["peak"] == 2
+
+
+def test_prepare_entries_returns_first_prompt_in_order():
+    entries = [{"name": "a"}, {"name": "b", "choose": True}, {"name": "c", "choose": True}, {"name": None}, {"name": "e"}]
+    prepared = []
+
+    def check(entry):
+        return None if entry["name"] else ("缺指标", None)
+
+    async def prepare(entry):
+        # 越靠前的越慢完成，结果仍按顺序选择
+        await asyncio.sleep(0.01 * (3 - len(prepared)))
+        prepared.append(entry["name"])
+        return (f"请选择 {entry['name']}", None) if entry.get("choose") else None
+
+    prompt, ready = asyncio.run(common._prepare_entries(entries, check, prepare))
+    assert prompt == ("请选择 b", None)
+    # 提示之前已就绪的 entry 返回给调用方先行查询
+    assert ready == entries[:1]
+    # 第一个缺失槽位之后的 entry 不做补槽
+    assert sorted(prepared) == ["a", "b", "c"]
+
+    prepared.clear()
+    prompt, ready = asyncio.run(common._prepare_entries(entries[:1] + entries[3:], check, prepare))
+    assert prompt == ("缺指标", None) and ready == entries[:1]
+    assert prepared == ["a"]
+
+    assert asyncio.run(common._prepare_entries(entries[:1], check, prepare)) == (None, entries[:1])
+
+
+def test_execute_queries_marks_unresolved_and_missing_formulas_failed(monkeypatch):
+    async def fake_batch(formulas, time_string, time_type):
+        return {"A": {"A": 1.5}}   # 缺少 B 的结果
+
+    monkeypatch.setattr(platform_api, "query_platform_batch", fake_batch)
+    entries = [
+        {"indicator": "甲", "formula": "A", "timeString": "2024-09-01", "timeType": "DAY"},
+        {"indicator": "乙", "formula": None, "timeString": "2024-09-01", "timeType": "DAY"},
+        {"indicator": "丙", "formula": "B", "timeString": "2024-09-01", "timeType": "DAY"},
+    ]
+    outcomes = asyncio.run(common._execute_queries(entries))
+    assert [done for _, _, done in outcomes] == [True, False, False]
+    assert entries[0]["value"] == 1.5
+    assert "value" not in entries[2]
+
+
+class _FakeGraph:
+    def __init__(self):
+        self.nodes = {}
+
+    def find_node(self, indicator, time_string):
+        return next((nid for nid, n in self.nodes.items()
+                     if n["indicator_entry"]["indicator"] == indicator and n["indicator_entry"]["timeString"] == time_string), None)
+
+    def get_node(self, nid):
+        return self.nodes[nid]
+
+    def add_node(self, entry):
+        nid = f"n{len(self.nodes)}"
+        self.nodes[nid] = {"indicator_entry": dict(entry)}
+        return nid
+
+    def set_intent_info(self, intent_info):
+        pass
+
+
+def test_query_entries_keeps_successes_after_a_failure(monkeypatch):
+    async def fake_batch(formulas, time_string, time_type):
+        return {"B": {"B": 2.0}}   # A 查询失败，B 成功
+
+    monkeypatch.setattr(platform_api, "query_platform_batch", fake_batch)
+    graph = _FakeGraph()
+    entries = [
+        {"indicator": "甲", "formula": "A", "timeString": "2024-09-01", "timeType": "DAY"},
+        {"indicator": "乙", "formula": "B", "timeString": "2024-09-01", "timeType": "DAY"},
+    ]
+    failure, nodes = asyncio.run(common._query_entries(entries, graph, {}))
+    assert failure is not None
+    # 失败之后的成功结果同样写入图谱，下一轮直接复用
+    assert entries[1]["status"] == "completed" and id(entries[1]) in nodes
+    assert "status" not in entries[0]
+    assert graph.find_node("乙", "2024-09-01") and not graph.find_node("甲", "2024-09-01")
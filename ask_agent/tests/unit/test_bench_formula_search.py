@@ -0,0 +1,38 @@
+# tests/unit/test_bench_formula_search.py
+from tools.bench_formula_search import (
+    build_labeled_queries, generate_synthetic_rows, latency_summary, ranking_metrics
+)
+
+ROWS = [
+    {"FORMULAID": "F1", "FORMULANAME": "1#高炉工序能耗", "ISLATEST": "1"},
+    {"FORMULAID": "F2", "FORMULANAME": "酸轧纯水使用量", "ISLATEST": "0"},
+]
+
+
+def test_generate_synthetic_rows_scales_with_unique_ids():
+    rows = generate_synthetic_rows(ROWS, 7)
+    assert len(rows) == 7
+    assert rows[:2] == ROWS
+    assert len({r["FORMULAID"] for r in rows}) == 7
+    assert rows[2] == {"FORMULAID": "F1.S1", "FORMULANAME": "2#高炉工序能耗", "ISLATEST": "1"}
+    assert rows[3]["FORMULANAME"] == "2#酸轧纯水使用量"
+    assert generate_synthetic_rows(ROWS, 1) == ROWS[:1]
+
+
+def test_build_labeled_queries_is_deterministic():
+    a = build_labeled_queries(ROWS, 2, seed=1)
+    assert a == build_labeled_queries(ROWS, 2, seed=1)
+    assert [q["kind"] for q in a] == ["exact", "drop_char"]
+    assert all(q["expected"][0] in ("F1", "F2") for q in a)
+
+
+def test_ranking_metrics_and_latency_summary():
+    ranked = [["F1", "F2"], ["F3", "F2"], []]
+    expected = [["F1"], ["F2"], ["F9"]]
+    m = ranking_metrics(ranked, expected, ks=(1, 2))
+    assert m["recall@1"] == round(1 / 3, 4)
+    assert m["recall@2"] == round(2 / 3, 4)
+    assert m["mrr"] == round((1 + 0.5) / 3, 4)
+
+    s = latency_summary(range(1, 101))
+    assert s["p50_ms"] == 50.5 and s["max_ms"] == 100.0
@@ -0,0 +1,39 @@
+# tests/unit/test_combo_matcher.py
+import random
+from app.domains.energy.api.combo_matcher import AhoCorasick, ComboMatcher
+
+
+def _naive_weight(combos, formula_text, user_text, base=1.0):
+    weighted = base
+    for combo in sorted(combos, key=lambda c: c.get("weight", 0), reverse=True):
+        terms = combo.get("terms", [])
+        if terms and all(t in formula_text for t in terms) and not all(t in user_text for t in terms):
+            weighted *= 1.0 + combo["weight"]
+    return weighted
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    ac = AhoCorasick(["报出值", "出值", "实绩", "绩报", "累计值"])
+    assert ac.find("高炉实绩报出值") == {0, 1, 2, 3}
+    assert ac.find("计划累计值") == {4}
+    assert ac.find("") == set()
+
+
+def test_combo_matcher_matches_naive_weighting():
+    combos = [
+        {"terms": ["实绩", "报出值"], "weight": 0.12},
+        {"terms": ["计划", "报出值"], "weight": 0.08},
+        {"terms": ["实绩", "累计值"], "weight": 0.05},
+        {"terms": ["报出值"], "weight": 0.02},
+        {"terms": [], "weight": 0.5},
+    ]
+    matcher = ComboMatcher(combos)
+    parts = ["高炉", "实绩", "计划", "报出值", "累计值", "能耗"]
+    rng = random.Random(0)
+    for _ in range(200):
+        formula = "".join(rng.choices(parts, k=4))
+        user = "".join(rng.choices(parts, k=2))
+        weighted = 1.0
+        for m in matcher.factors(matcher.mask(formula), matcher.mask(user)):
+            weighted *= m
+        assert weighted == _naive_weight(combos, formula, user)
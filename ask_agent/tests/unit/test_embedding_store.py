@@ -0,0 +1,58 @@
+# tests/unit/test_embedding_store.py
+import numpy as np
+from app.domains.energy.api import embedding_store
+
+
+def test_save_and_mmap_load(tmp_path):
+    base = str(tmp_path / "formula_embeddings.pkl")
+    emb = np.random.default_rng(0).normal(size=(10, 8)).astype(np.float32)
+    keys = [f"F{i}:x" for i in range(10)]
+    embedding_store.save_embeddings(base, emb, keys, "model-a", "hash-1")
+
+    loaded = embedding_store.load_embeddings(base, 10, "model-a", "hash-1")
+    assert isinstance(loaded, np.memmap)
+    assert np.array_equal(np.asarray(loaded), emb)
+
+    # 行数相同但 CSV 内容 / 模型变化 → 快速路径失效
+    assert embedding_store.load_embeddings(base, 10, "model-a", "hash-2") is None
+    assert embedding_store.load_embeddings(base, 10, "model-b", "hash-1") is None
+    assert embedding_store.load_embeddings(base, 11, "model-a", "hash-1") is None
+
+    # 增量路径只要求模型一致
+    old_keys, old_matrix = embedding_store.load_embedding_rows(base, "model-a")
+    assert old_keys == keys and np.array_equal(np.asarray(old_matrix), emb)
+    assert embedding_store.load_embedding_rows(base, "model-b") is None
+
+
+def test_merge_embeddings_only_encodes_changed_rows():
+    old_keys = ["F1:a", "F2:b", "F3:c"]
+    old_matrix = np.arange(6, dtype=np.float32).reshape(3, 2)
+    encoded_texts = []
+
+    def encode(texts):
+        encoded_texts.extend(texts)
+        return np.full((len(texts), 2), -1, dtype=np.float32)
+
+    # F2 改名、F3 删除、F4 新增
+    keys = ["F1:a", "F2:b2", "F4:d"]
+    merged, stats = embedding_store.merge_embeddings(keys, ["n1", "n2", "n4"], (old_keys, old_matrix), encode)
+
+    assert encoded_texts == ["n2", "n4"]
+    assert stats == {"reused": 1, "encoded": 2, "dropped": 2}
+    assert merged[0].tolist() == [0, 1]
+    assert merged[1:].tolist() == [[-1, -1], [-1, -1]]
+
+
+def test_embedding_row_key_ignores_id_quotes():
+    assert embedding_store.embedding_row_key('"F1"', "高炉") == embedding_store.embedding_row_key("F1", "高炉")
+    assert embedding_store.embedding_row_key("F1", "高炉") != embedding_store.embedding_row_key("F1", "高炉 电耗")
+
+
+def test_tokens_cache_keyed_by_csv_hash(tmp_path):
+    base = str(tmp_path / "formula_embeddings.pkl")
+    clean, tokens = ["1 高炉工序能耗"], ["1 高炉 工序 能耗"]
+    embedding_store.save_tokens(base, "hash-1", "jieba-0.42.1", clean, tokens)
+
+    assert embedding_store.load_tokens(base, "hash-1", 1, "jieba-0.42.1") == (clean, tokens)
+    assert embedding_store.load_tokens(base, "hash-2", 1, "jieba-0.42.1") is None
+    assert embedding_store.load_tokens(base, "hash-1", 1, "jieba-0.43") is None
@@ -0,0 +1,45 @@
+# tests/unit/test_facet_index.py
+import numpy as np
+import pytest
+from app.domains.energy.api import facet_index
+from app.domains.energy.api.facet_index import FacetIndex, normalize_filters, parse_filters
+
+
+def _index():
+    return FacetIndex({
+        "ISLATEST": ['"1"', '"0"', '"1"', '"1"'],
+        "FIELDNAME": ["REPORTVALUE", "REPORTVALUE", "SUMVALUE", "SUMVALUE"],
+    }, 4)
+
+
+def test_parse_and_normalize_filters():
+    assert parse_filters("islatest=1, FIELDNAME=SUMVALUE|REPORTVALUE") == {
+        "ISLATEST": ["1"], "FIELDNAME": ["SUMVALUE", "REPORTVALUE"]
+    }
+    assert normalize_filters({"fieldname": ["SUMVALUE", "REPORTVALUE"], "ISLATEST": 1}) == (
+        ("FIELDNAME", ("REPORTVALUE", "SUMVALUE")), ("ISLATEST", ("1",))
+    )
+    assert normalize_filters(None) == ()
+
+
+def test_normalize_filters_rejects_bad_shapes():
+    for bad in (["ISLATEST"], 1, {"ISLATEST": [{"v": 1}]}, {"ISLATEST": None}, {1: "1"}):
+        with pytest.raises(ValueError):
+            normalize_filters(bad)
+
+
+def test_facet_mask_and_or():
+    index = _index()
+    assert index.mask(()) is None
+    # 取值会去掉 CSV 中保留的引号
+    assert index.mask(normalize_filters({"ISLATEST": "1"})).tolist() == [True, False, True, True]
+    assert index.mask(normalize_filters({"ISLATEST": "1", "FIELDNAME": "SUMVALUE"})).tolist() == [False, False, True, True]
+    assert index.mask(normalize_filters({"ISLATEST": ["0", "1"]})).all()
+    assert not index.mask(normalize_filters({"ISLATEST": "2"})).any()
+
+
+def test_high_cardinality_column_without_bitmaps(monkeypatch):
+    monkeypatch.setattr(facet_index, "BITMAP_MAX_VALUES", 2)
+    index = FacetIndex({"TEMPLATEID": ["T1", "T2", "T3", "T1"]}, 4)
+    assert "TEMPLATEID" not in index.bitmaps
+    assert np.flatnonzero(index.mask(normalize_filters({"TEMPLATEID": ["T1", "T3"]}))).tolist() == [0, 2, 3]
@@ -0,0 +1,160 @@
+# tests/unit/test_formula_api.py
+from app.domains.energy.api import formula_api
+
+
+def test_build_name_indexes():
+    raw = ['"1#高炉工序能耗"', "2#高炉工序能耗", "1#高炉工序能耗", "酸轧 纯水#使用量"]
+    clean = [formula_api.normalize_text(s) for s in raw]
+    name_to_rows, clean_name_to_row = formula_api.build_name_indexes(raw, clean)
+
+    # 去引号后同名的行全部保留，且保持 CSV 顺序
+    assert name_to_rows["1#高炉工序能耗"] == [0, 2]
+    assert name_to_rows["2#高炉工序能耗"] == [1]
+    # normalize_text 索引只记录第一个行号
+    assert clean_name_to_row[formula_api.normalize_text("1#高炉工序能耗")] == 0
+    assert clean_name_to_row["酸轧 纯水 使用量"] == 3
+
+
+def test_build_combo_suffix_table():
+    combos = [
+        {"terms": ["计划", "报出值"], "weight": 0.08},
+        {"terms": ["实绩", "报出值"], "weight": 0.12},
+    ]
+    table = formula_api.build_combo_suffix_table(combos)
+
+    # weight 高的组合排在前面
+    assert [terms for terms, _ in table] == [["实绩", "报出值"], ["计划", "报出值"]]
+    # suffixes[k]：已命中前 k 个 term 时需要补齐的后缀
+    assert table[0][1] == ["实绩报出值", "报出值", ""]
+
+
+def test_reload_catalog_swaps_snapshot(tmp_path, monkeypatch):
+    csv_path = tmp_path / "formula.csv"
+    csv_path.write_text("FORMULAID,FORMULANAME\nF1,1#高炉工序能耗\n", encoding="utf-8")
+    monkeypatch.setattr(formula_api, "FORMULA_CSV_PATH", str(csv_path))
+    monkeypatch.setattr(formula_api, "_embedding_model", None)
+    monkeypatch.setattr(formula_api, "_catalog", None)
+
+    assert formula_api.reload_catalog() is True
+    old = formula_api._catalog
+    assert old.version == 1 and old.size == 1
+
+    # 内容未变化时跳过
+    assert formula_api.reload_catalog() is False
+    assert formula_api._catalog is old
+
+    # 结果缓存命中时返回副本
+    first = formula_api.formula_query_dict("2#高炉工序能耗")
+    assert "exact_matches" not in first
+    first["candidates"].clear()
+    assert formula_api.formula_query_dict("2#高炉工序能耗")["candidates"]
+
+    csv_path.write_text("FORMULAID,FORMULANAME\nF1,1#高炉工序能耗\nF2,2#高炉工序能耗\n", encoding="utf-8")
+    assert formula_api.reload_catalog() is True
+    new = formula_api._catalog
+    assert new.version == 2 and new.size == 2
+    # 旧快照保持不变，进行中的查询不受影响；结果缓存随快照切换失效
+    assert old.size == 1
+    assert formula_api.formula_query_dict("2#高炉工序能耗")["exact_matches"][0]["FORMULAID"] == "F2"
+
+
+def test_build_catalog_survives_cache_write_failure(tmp_path, monkeypatch):
+    csv_path = tmp_path / "formula.csv"
+    csv_path.write_text("FORMULAID,FORMULANAME\nF1,1#高炉工序能耗\n", encoding="utf-8")
+
+    def read_only(*args):
+        raise PermissionError("read-only file system")
+
+    monkeypatch.setattr(formula_api, "FORMULA_CSV_PATH", str(csv_path))
+    monkeypatch.setattr(formula_api, "EMBEDDING_CACHE_PATH", str(tmp_path / "emb.npy"))
+    monkeypatch.setattr(formula_api, "_embedding_model", None)
+    monkeypatch.setattr(formula_api, "save_tokens", read_only)
+
+    catalog = formula_api.build_catalog(version=1)
+    assert catalog.size == 1 and catalog.names_clean
+
+
+def test_unknown_default_filter_columns_are_dropped(tmp_path, monkeypatch):
+    csv_path = tmp_path / "formula.csv"
+    csv_path.write_text("FORMULAID,FORMULANAME,ISLATEST\nF1,1#高炉工序能耗,1\nF2,2#高炉工序能耗,0\n", encoding="utf-8")
+    monkeypatch.setattr(formula_api, "FORMULA_CSV_PATH", str(csv_path))
+    monkeypatch.setattr(formula_api, "EMBEDDING_CACHE_PATH", str(tmp_path / "emb.npy"))
+    monkeypatch.setattr(formula_api, "_embedding_model", None)
+    monkeypatch.setattr(formula_api, "_catalog", None)
+    monkeypatch.setattr(formula_api, "_default_filters", {"ISLATEST": ["1"], "SOURCEID": ["7"]})
+
+    assert formula_api.reload_catalog() is True
+    assert formula_api._catalog.default_filters == {"ISLATEST": ["1"]}
+    result = formula_api.formula_query_dict("高炉工序能耗", method="fuzzy")
+    assert [c["FORMULAID"] for c in result["candidates"]] == ["F1"]
+    # 显式传入的未知列仍然报错
+    assert formula_api.formula_query_dict("高炉工序能耗", filters={"SOURCEID": "7"})["message"] == "Unknown filter: SOURCEID"
+    # 格式错误的 filters 返回错误结果而不是抛出异常
+    assert formula_api.formula_query_dict("高炉工序能耗", filters=["ISLATEST"])["message"].startswith("Invalid filters")
+    assert formula_api.formula_query_batch(["高炉工序能耗"], filters={"ISLATEST": [None]})[0]["done"] is False
+
+
+def test_background_init_retries_until_catalog_loads(monkeypatch):
+    calls = []
+
+    def flaky_build(version):
+        calls.append(version)
+        if len(calls) < 3:
+            raise OSError("csv not readable yet")
+        return "catalog"
+
+    sleeps = []
+    monkeypatch.setattr(formula_api, "build_catalog", flaky_build)
+    monkeypatch.setattr(formula_api, "_load_embedding_model", lambda: None)
+    monkeypatch.setattr(formula_api, "_embedding_model", None)
+    monkeypatch.setattr(formula_api, "_catalog", None)
+    monkeypatch.setattr(formula_api, "FORMULA_INIT_RETRY_BASE_SEC", 1)
+    monkeypatch.setattr(formula_api, "FORMULA_INIT_RETRY_MAX_SEC", 1.5)
+    monkeypatch.setattr(formula_api.time, "sleep", sleeps.append)
+
+    formula_api._initialize_in_background()
+    assert formula_api._catalog == "catalog"
+    assert len(calls) == 3 and sleeps == [1, 1.5]   # 指数退避，不超过上限
+    assert formula_api._init_error is None
+
+
+def test_ngram_index_shortlist():
+    clean = ["1 高炉工序能耗", "酸轧 纯水 使用量", "2 高炉 电耗"]
+    tokens = ["1 高炉 工序 能耗", "酸 轧 纯水 使用量", "2 高炉 电耗"]
+    index = formula_api.build_ngram_index(clean, tokens)
+
+    rows = formula_api.shortlist_rows(index, "高炉 能耗", "高炉 能耗")
+    assert rows.tolist() == [0, 2]
+    assert formula_api.shortlist_rows(index, "纯水", "纯水").tolist() == [1]
+    assert len(formula_api.shortlist_rows(index, "焦化", "焦化")) == 0
+
+
+def test_process_mode_keeps_result_cache_in_parent(tmp_path, monkeypatch):
+    import asyncio
+    csv_path = tmp_path / "formula.csv"
+    csv_path.write_text("FORMULAID,FORMULANAME\nF1,1#高炉工序能耗\nF2,2#高炉工序能耗\n", encoding="utf-8")
+    monkeypatch.setattr(formula_api, "FORMULA_CSV_PATH", str(csv_path))
+    monkeypatch.setattr(formula_api, "_embedding_model", None)
+    monkeypatch.setattr(formula_api, "_catalog", None)
+    formula_api.reload_catalog()
+
+    class _ProcessLikeExecutor:
+        """进程模式的替身：记录交给子进程的调用"""
+        mode = "process"
+        calls = []
+
+        async def run(self, fn, *args):
+            self.calls.append((fn.__name__, args[0]))
+            return fn(*args)
+
+    executor = _ProcessLikeExecutor()
+    monkeypatch.setattr(formula_api, "_search_executor", executor)
+
+    async def main():
+        await formula_api.formula_query_dict_async("高炉工序能耗")
+        await formula_api.formula_query_dict_async("高炉工序能耗")
+        return await formula_api.formula_query_batch_async(["高炉工序能耗", "1#高炉工序能耗"])
+
+    results = asyncio.run(main())
+    assert executor.calls == [("formula_query_dict", "高炉工序能耗"), ("formula_query_batch", ["1#高炉工序能耗"])]
+    assert results[1]["exact_matches"][0]["FORMULAID"] == "F1"
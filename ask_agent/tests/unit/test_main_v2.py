@@ -0,0 +1,33 @@
+# tests/unit/test_main_v2.py
+from fastapi.testclient import TestClient
+
+import main_v2
+from app.domains.energy.api import formula_api
+
+
+def _client(monkeypatch):
+    async def fake_batch(inputs, topn, method, filters):
+        return [{"input": i, "topn": topn, "filters": filters} for i in inputs]
+
+    monkeypatch.setattr(formula_api, "formula_query_batch_async", fake_batch)
+    return TestClient(main_v2.app)   # 不进入上下文，不触发 startup
+
+
+def test_formula_query_batch_defaults_and_validates_topn(monkeypatch):
+    client = _client(monkeypatch)
+    assert client.post("/formula_query_batch", json={"inputs": ["a"]}).json()["results"][0]["topn"] == 5
+    assert client.post("/formula_query_batch", json={"inputs": ["a"], "topn": "7"}).json()["results"][0]["topn"] == 7
+    for topn in ("abc", 0, 51, 2.5, True):
+        assert client.post("/formula_query_batch", json={"inputs": ["a"], "topn": topn}).status_code == 400
+    assert client.post("/formula_query_batch", content=b"not json").status_code == 400
+
+
+def test_formula_query_batch_validates_filters(monkeypatch):
+    client = _client(monkeypatch)
+    resp = client.post("/formula_query_batch", json={"inputs": ["a"], "filters": {"ISLATEST": ["1"]}})
+    assert resp.status_code == 200 and resp.json()["results"][0]["filters"] == {"ISLATEST": ["1"]}
+    resp = client.post("/formula_query_batch", json={"inputs": ["a"], "filters": "ISLATEST=1"})
+    assert resp.json()["results"][0]["filters"] == {"ISLATEST": ["1"]}
+    for filters in (["ISLATEST"], 1, {"ISLATEST": [{"v": 1}]}):
+        resp = client.post("/formula_query_batch", json={"inputs": ["a"], "filters": filters})
+        assert resp.status_code == 400 and "invalid filters" in resp.json()["error"]
@@ -0,0 +1,16 @@
+# tests/unit/test_onnx_embedder.py
+import numpy as np
+from app.domains.energy.api import onnx_embedder
+
+
+def test_mean_pooling_ignores_padding():
+    tokens = np.array([[[1.0, 2.0], [3.0, 4.0], [100.0, 100.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+    assert onnx_embedder.mean_pooling(tokens, mask).tolist() == [[2.0, 3.0]]
+
+
+def test_find_onnx_model(tmp_path):
+    assert onnx_embedder.find_onnx_model(str(tmp_path)) is None
+    (tmp_path / "onnx").mkdir()
+    (tmp_path / "onnx" / "model.onnx").write_bytes(b"")
+    assert onnx_embedder.find_onnx_model(str(tmp_path)) == str(tmp_path / "onnx" / "model.onnx")
@@ -0,0 +1,240 @@
+# tests/unit/test_platform_api.py
+import asyncio
+import time
+from datetime import timedelta
+
+from aiohttp import web
+
+from app.domains.energy.api import platform_api
+from app.domains.energy.api.platform_cache import PlatformResultCache
+
+
+async def _start_platform_server(stats: dict):
+    """本地模拟平台：登录返回 token，查询原样回显公式；记录每个请求所用的客户端端口"""
+    async def login(request):
+        stats.setdefault("peers", []).append(request.transport.get_extra_info("peername")[1])
+        stats["logins"] = stats.get("logins", 0) + 1
+        return web.json_response({"data": {"token": "t-1"}})
+
+    async def query(request):
+        stats.setdefault("peers", []).append(request.transport.get_extra_info("peername")[1])
+        body = await request.json()
+        formulas = body.get("expressionList") or body.get("formulas")
+        return web.json_response({"data": [{"formula": f, "value": 1.0} for f in formulas]})
+
+    app = web.Application()
+    app.router.add_post("/login", login)
+    app.router.add_post("/query", query)
+    app.router.add_post("/range", query)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def _use_server(monkeypatch, base: str):
+    monkeypatch.setattr(platform_api, "LOGIN_URL", base + "/login")
+    monkeypatch.setattr(platform_api, "QUERY_URL", base + "/query")
+    monkeypatch.setattr(platform_api, "RANGE_QUERY_URL", base + "/range")
+    monkeypatch.setattr(platform_api, "_cached_token", None)
+    monkeypatch.setattr(platform_api, "_token_timestamp", 0)
+    monkeypatch.setattr(platform_api, "_result_cache", None)   # 需要缓存的用例自行启用
+
+
+def test_query_platform_reuses_one_connection(monkeypatch):
+    stats = {}
+
+    async def main():
+        runner, base = await _start_platform_server(stats)
+        _use_server(monkeypatch, base)
+        try:
+            await platform_api.init_session()
+            results = []
+            for plant in ("1#", "2#", "3#", "4#", "5#"):
+                results.append(await platform_api.query_platform(f"{plant}GX.IXRL", "2024-09-01", "DAY"))
+            results.append(await platform_api.query_platform("1#GX.IXRL", "2024-09-01~2024-09-07", "DAY"))
+            return results
+        finally:
+            await platform_api.close_session()
+            await runner.cleanup()
+
+    results = asyncio.run(main())
+    assert results[0] == [{"formula": "1#GX.IXRL", "value": 1.0}]
+    assert len(results) == 6
+    # 1 次登录 + 6 次查询全部走同一条 keep-alive 连接
+    assert stats["logins"] == 1
+    assert len(stats["peers"]) == 7 and len(set(stats["peers"])) == 1
+    assert platform_api._session is None
+
+
+def test_session_is_shared_within_a_loop_and_recreated_after_close():
+    async def open_twice():
+        first, second = platform_api.get_session(), platform_api.get_session()
+        await platform_api.close_session()
+        return first, second
+
+    a1, a2 = asyncio.run(open_twice())
+    b1, _ = asyncio.run(open_twice())
+    assert a1 is a2
+    assert b1 is not a1 and a1.closed
+
+
+def test_concurrent_token_refresh_logs_in_once(monkeypatch):
+    stats = {}
+
+    async def main():
+        runner, base = await _start_platform_server(stats)
+        _use_server(monkeypatch, base)
+        try:
+            tokens = await asyncio.gather(*[platform_api._get_token() for _ in range(20)])
+            # 过期后再次并发请求：仍只登录一次
+            monkeypatch.setattr(platform_api, "_token_timestamp", 0)
+            tokens += await asyncio.gather(*[platform_api._get_token() for _ in range(20)])
+            return tokens
+        finally:
+            await platform_api.close_session()
+            await runner.cleanup()
+
+    tokens = asyncio.run(main())
+    assert tokens == ["t-1"] * 40
+    assert stats["logins"] == 2
+
+
+def test_token_refresh_task_refreshes_before_expiry(monkeypatch):
+    stats = {}
+
+    async def main():
+        runner, base = await _start_platform_server(stats)
+        _use_server(monkeypatch, base)
+        monkeypatch.setattr(platform_api, "TOKEN_EXPIRE_DURATION", timedelta(seconds=0.4))
+        task = asyncio.create_task(platform_api.token_refresh_task(margin_sec=0.1))
+        try:
+            await asyncio.sleep(0.05)
+            assert stats["logins"] == 1            # 启动即登录
+            await asyncio.sleep(0.4)
+            assert stats["logins"] == 2            # 过期前 0.1s 提前刷新
+            assert platform_api._token_valid(time.time())
+        finally:
+            task.cancel()
+            await platform_api.close_session()
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def test_get_session_closes_session_from_previous_loop():
+    async def open_session():
+        return platform_api.get_session()
+
+    async def reopen():
+        new = platform_api.get_session()
+        await asyncio.sleep(0)   # 旧 session 在后台任务中关闭
+        await asyncio.sleep(0)
+        return new
+
+    # 显式创建两个事件循环（nest_asyncio 打补丁后 asyncio.run 会复用同一个循环）
+    first, second = asyncio.new_event_loop(), asyncio.new_event_loop()
+    try:
+        old = first.run_until_complete(open_session())
+        first.close()
+        new = second.run_until_complete(reopen())
+        assert new is not old and old.closed and not new.closed
+    finally:
+        second.run_until_complete(platform_api.close_session())
+        second.close()
+
+
+def test_unbatched_queries_respect_concurrency_limit(monkeypatch):
+    state = {"running": 0, "peak": 0}
+
+    async def fake_query(formula, time_string, time_type):
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        await asyncio.sleep(0.01)
+        state["running"] -= 1
+        return [{"formula": formula}]
+
+    monkeypatch.setattr(platform_api, "_query_and_cache", fake_query)
+    monkeypatch.setattr(platform_api, "_result_cache", None)
+    monkeypatch.setattr(platform_api, "PLATFORM_BATCH_SHAPE", "off")
+    monkeypatch.setattr(platform_api, "PLATFORM_HTTP_LIMIT_PER_HOST", 3)
+    formulas = [f"{i}#GX.IXRL" for i in range(10)]
+    results = asyncio.run(platform_api.query_platform_batch(formulas, "2024-09-01", "DAY"))
+    assert list(results) == formulas and results["4#GX.IXRL"] == [{"formula": "4#GX.IXRL"}]
+    assert state["peak"] == 3
+
+
+def test_split_batch_result_shapes():
+    split = platform_api.split_batch_result
+    assert split({"A": 1.5, "B": 2.0}, ["A", "B"], "dict") == {"A": {"A": 1.5}, "B": {"B": 2.0}}
+    assert split({"value": 1.5}, ["A", "B"], "dict") is None
+    records = [{"formula": "A", "clock": "d1", "itemValue": 1}, {"formula": "B", "clock": "d1", "itemValue": 2},
+               {"formula": "A", "clock": "d2", "itemValue": 3}]
+    assert split(records, ["A", "B"], "records") == {"A": [records[0], records[2]], "B": [records[1]]}
+    # 只认配置的字段，不猜测其他字段
+    assert split([{"code": "A", "itemValue": 1}], ["A", "B"], "records") is None
+    assert split([], ["A", "B"], "records") == {"A": [], "B": []}
+    assert split(records, ["A", "B"], "off") is None
+
+
+def _run_batch(monkeypatch, stats, formulas, time_string, shape):
+    async def main():
+        runner, base = await _start_platform_server(stats)
+        _use_server(monkeypatch, base)
+        monkeypatch.setattr(platform_api, "PLATFORM_BATCH_MAX_FORMULAS", 4)
+        monkeypatch.setattr(platform_api, "PLATFORM_BATCH_SHAPE", shape)
+        try:
+            return await platform_api.query_platform_batch(formulas, time_string, "DAY")
+        finally:
+            await platform_api.close_session()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_query_platform_batch_sends_one_request_per_chunk(monkeypatch):
+    stats = {}
+    formulas = [f"{i}#GX.IXRL" for i in range(1, 11)]
+    results = _run_batch(monkeypatch, stats, formulas, "2024-09-01", "records")
+    assert list(results) == formulas
+    assert results["3#GX.IXRL"] == [{"formula": "3#GX.IXRL", "value": 1.0}]
+    assert len(stats["peers"]) == 1 + 3   # 登录 + ceil(10 / 4) 个批量请求
+
+
+def test_query_platform_batch_disabled_or_range_queries_per_formula(monkeypatch):
+    formulas = [f"{i}#GX.IXRL" for i in range(1, 4)]
+    for time_string, shape in (("2024-09-01", "off"), ("2024-09-01~2024-09-07", "records")):
+        stats = {}
+        results = _run_batch(monkeypatch, stats, formulas, time_string, shape)
+        assert list(results) == formulas
+        assert len(stats["peers"]) == 1 + 3   # 登录 + 每个公式一次，不会先批量再重发
+
+
+def test_query_platform_serves_repeats_from_cache(monkeypatch):
+    stats = {}
+
+    async def main():
+        runner, base = await _start_platform_server(stats)
+        _use_server(monkeypatch, base)
+        monkeypatch.setattr(platform_api, "_result_cache", PlatformResultCache(maxsize=16))
+        try:
+            first = await platform_api.query_platform("1#GX.IXRL", "2024-09-01", "DAY")
+            first.append("调用方修改返回值不影响缓存")
+            second = await platform_api.query_platform("1#GX.IXRL", "2024-09-01", "DAY")
+            batch = await platform_api.query_platform_batch(["2#GX.IXRL", "1#GX.IXRL"], "2024-09-01", "DAY")
+            assert platform_api.invalidate_cache(formula="1#GX.IXRL") == 1
+            await platform_api.query_platform("1#GX.IXRL", "2024-09-01", "DAY")
+            return second, batch
+        finally:
+            await platform_api.close_session()
+            await runner.cleanup()
+
+    second, batch = asyncio.run(main())
+    assert second == [{"formula": "1#GX.IXRL", "value": 1.0}]
+    assert list(batch) == ["2#GX.IXRL", "1#GX.IXRL"]
+    # 登录 + 首次查询 + 2# 单独补查 + 失效后重查
+    assert len(stats["peers"]) == 1 + 3
+    cache = platform_api.cache_stats()
+    assert cache["hits"] == 2 and cache["tiers"]["closed"]["hits"] == 2
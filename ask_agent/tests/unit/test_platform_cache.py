@@ -0,0 +1,43 @@
+# tests/unit/test_platform_cache.py
+from datetime import datetime
+
+from app.domains.energy.api.platform_cache import PlatformResultCache, cache_policy, period_end
+from app.domains.energy.api.query_cache import TTLCache
+
+
+def test_period_end_formats():
+    assert period_end("2024-09-01 13", "HOUR") == datetime(2024, 9, 1, 14)
+    assert period_end("2024-09-01 夜班", "SHIFT") == datetime(2024, 9, 2, 12)
+    assert period_end("2024-09-01", "DAY") == datetime(2024, 9, 2)
+    assert period_end("2024 W01", "WEEK") == datetime(2024, 1, 8)
+    assert period_end("2019-08 中旬", "TENDAYS") == datetime(2019, 8, 21)
+    assert period_end("2019-08 下旬", "TENDAYS") == datetime(2019, 9, 1)
+    assert period_end("2024-12", "MONTH") == datetime(2025, 1, 1)
+    assert period_end("2017 Q4", "QUARTER") == datetime(2018, 1, 1)
+    assert period_end("2024", "YEAR") == datetime(2025, 1, 1)
+    assert period_end("2024-09-01~2024-09-07", "DAY") == datetime(2024, 9, 8)
+    assert period_end("本月", "MONTH") is None
+
+
+def test_cache_policy_tiers():
+    now = datetime(2024, 9, 10, 0, 30)
+    assert cache_policy("2024-09", "MONTH", now) == ("current", 900)
+    assert cache_policy("2024-09-09", "DAY", now, settle_sec=3600) == ("settling", 300)
+    assert cache_policy("2024-08", "MONTH", now) == ("closed", None)
+    assert cache_policy("2024-08", "MONTH", now, closed_ttl=86400) == ("closed", 86400)
+    assert cache_policy("明天", "UNKNOWN", now, current_ttl=42) == ("current", 42)
+
+
+def test_ttl_cache_expiry_and_empty_results():
+    cache = TTLCache(maxsize=4)
+    cache.put("a", 1, ttl=10, now=100)
+    assert cache.get("a", now=105) == 1
+    assert cache.get("a", now=111) is None
+    assert cache.stats()["expired"] == 1
+
+    results = PlatformResultCache(maxsize=4)
+    results.put("F", "2020-01-01", "DAY", [])
+    results.put("G", "2020-01-01", "DAY", None)
+    assert results.get("F", "2020-01-01", "DAY") == []
+    assert results.get("G", "2020-01-01", "DAY") is None
+    assert results._cache._data[("F", "2020-01-01", "DAY")][0] is not None   # 空结果不会永久缓存
@@ -0,0 +1,66 @@
+# tests/unit/test_search_executor.py
+import asyncio
+import threading
+
+from app.domains.energy.api.search_executor import SearchExecutor
+
+
+def _square(x):
+    return x * x
+
+
+def test_thread_executor_bounds_workers_and_tracks_queue_depth():
+    executor = SearchExecutor(max_workers=2, mode="thread")
+    release = threading.Event()
+
+    def blocked(x):
+        release.wait(5)
+        return x
+
+    async def main():
+        tasks = [asyncio.ensure_future(executor.run(blocked, i)) for i in range(5)]
+        await asyncio.sleep(0.05)
+        assert executor.in_flight == 5
+        assert executor.queue_depth == 3
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(main()) == [0, 1, 2, 3, 4]
+    stats = executor.stats()
+    assert stats["max_queue_depth"] == 3
+    assert stats["completed"] == 5 and stats["in_flight"] == 0 and stats["failed"] == 0
+    executor.shutdown()
+
+
+def test_failures_are_counted_and_raised():
+    executor = SearchExecutor(max_workers=1)
+
+    async def main():
+        try:
+            await executor.run(_square, "x")
+        except TypeError:
+            return True
+        return False
+
+    assert asyncio.run(main())
+    stats = executor.stats()
+    assert stats["failed"] == 1 and stats["completed"] == 0 and stats["avg_ms"] == 0.0
+    executor.shutdown()
+
+
+def test_process_executor_rebuilds_pool_on_generation_change():
+    generation = {"v": 1}
+    prepared = []
+    executor = SearchExecutor(max_workers=1, mode="process", generation=lambda: generation["v"],
+                              prepare=lambda: prepared.append(generation["v"]))
+
+    async def main():
+        first = await executor.run(_square, 3)
+        generation["v"] = 2
+        second = await executor.run(_square, 4)
+        return first, second
+
+    assert asyncio.run(main()) == (9, 16)
+    if executor.mode == "process":
+        assert prepared == [1, 2]
+    executor.shutdown(wait=True)
@@ -0,0 +1,63 @@
+# tests/unit/test_typo_index.py
+import pytest
+from app.domains.energy.api import typo_index
+from app.domains.energy.api.typo_index import TypoIndex, deletes
+
+NAMES_TOKENS = [
+    "1 高炉 电耗 实绩 报出 值",
+    "2 高炉 电耗 计划 报出 值",
+    "冷轧 水耗",
+    "焦化 氧气 消耗",
+    "酸轧 纯水 使用量",
+]
+
+
+def test_deletes_includes_word_and_variants():
+    assert deletes("abc", 1) == {"abc", "ab", "ac", "bc"}
+    assert "a" in deletes("abc", 2)
+    assert deletes("abc", 0) == {"abc"}
+
+
+def test_known_terms_are_not_corrected():
+    index = TypoIndex(NAMES_TOKENS)
+    assert index.correct("高炉 电耗") is None
+    assert index.correct("1 高炉") is None
+
+
+def test_edit_distance_on_cjk_terms():
+    index = TypoIndex(NAMES_TOKENS)
+    assert index.lookup("使用两") == ["使用量"]
+    # 两字词不做汉字编辑距离纠错（pypinyin 缺失时）
+    if not typo_index.HAVE_PINYIN:
+        assert index.lookup("氧汽") is None
+
+
+@pytest.mark.skipif(not typo_index.HAVE_PINYIN, reason="pypinyin not installed")
+def test_homophones_and_pinyin_input():
+    index = TypoIndex(NAMES_TOKENS)
+    assert index.correct("高路 电耗") == "高炉 电耗"
+    assert index.correct("焦化 氧汽") == "焦化 氧气"
+    assert index.correct("冷扎 水耗") == "冷轧 水耗"       # 多音字 轧 -> zha
+    assert index.correct("gaolu dianhao") == "高炉 电耗"
+    assert index.correct("gaoludianhao") == "高炉 电耗"    # 连写拼音切分
+    assert index.correct("gaoluu dianhao") == "高炉 电耗"  # 拼音编辑距离
+    assert index.correct("高 路 电耗") == "高炉 电耗"        # 连续未知单字合并后查
+    assert index.lookup("f00001") is None
+
+
+def test_short_cjk_terms_are_not_replaced_by_other_words():
+    index = TypoIndex(["锅炉 电耗", "锅炉 水耗"])
+    # "高炉" 不在词表中：读音 gaolu 与 guolu 只差一个字母，但两字词不允许编辑距离纠错
+    assert index.lookup("高炉") is None
+    assert index.correct("高炉 电耗") is None
+
+
+@pytest.mark.skipif(not typo_index.HAVE_PINYIN, reason="pypinyin not installed")
+def test_correction_quality():
+    index = TypoIndex(NAMES_TOKENS)
+    assert index.correct_scored("高炉 电耗") is None
+    corrected, quality = index.correct_scored("高路 电耗")
+    assert corrected == "高炉 电耗" and 0.8 < quality < 1
+    assert index.correct_scored("gaolu dianhao") == ("高炉 电耗", 1.0)
+    # 同音但没有相同字的两字词不纠正
+    assert TypoIndex(["锅炉 电耗"]).lookup("果露") is None
@@ -0,0 +1,89 @@
+# tests/unit/test_vector_index.py
+import numpy as np
+from app.domains.energy.api import vector_index
+
+
+def _random_embeddings(n=2000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def test_flat_index_matches_full_sort():
+    emb = _random_embeddings()
+    q = emb[7]
+    idxs, sims = vector_index.FlatIndex(emb).search(q, 10)
+
+    expected = np.argsort(-np.dot(emb, q))[:10]
+    assert idxs.tolist() == expected.tolist()
+    assert np.all(np.diff(sims) <= 0)
+
+
+def test_ivf_full_probe_is_exact():
+    emb = _random_embeddings()
+    index = vector_index.IVFIndex.build(emb, nlist=16, nprobe=16)
+    flat = vector_index.FlatIndex(emb)
+    for q in emb[:20]:
+        assert index.search(q, 5)[0].tolist() == flat.search(q, 5)[0].tolist()
+
+
+def test_ivf_save_and_load(tmp_path):
+    emb = _random_embeddings()
+    path = str(tmp_path / "emb.ivf.npz")
+    index = vector_index.build_vector_index(emb, "ivf", path, nlist=16, nprobe=4)
+    assert index.kind == "ivf"
+
+    loaded = vector_index.IVFIndex.load(path, emb, nprobe=4)
+    assert loaded is not None
+    assert loaded.search(emb[3], 5)[0].tolist() == index.search(emb[3], 5)[0].tolist()
+
+    # 嵌入变化后持久化索引失效
+    assert vector_index.IVFIndex.load(path, _random_embeddings(seed=1)) is None
+
+
+def test_ivf_cache_rebuilt_when_any_row_changes(tmp_path):
+    emb = _random_embeddings(n=4000)
+    path = str(tmp_path / "emb.ivf.npz")
+    vector_index.build_vector_index(emb, "ivf", path, nlist=16, nprobe=4)
+
+    # 第 1 行不在旧版抽样（每 N // 1024 行取一行）范围内，改动后也必须失效
+    changed = emb.copy()
+    changed[1] = -emb[0]
+    assert vector_index.IVFIndex.load(path, changed, nprobe=4) is None
+    rebuilt = vector_index.build_vector_index(changed, "ivf", path, nlist=16, nprobe=16)
+    assert rebuilt.search(changed[1], 1)[0].tolist() == [1]
+
+
+def test_int8_quantized_index_with_rerank():
+    emb = _random_embeddings()
+    index = vector_index.QuantizedFlatIndex.build(emb, "int8", rerank=100)
+    assert index.codes.dtype == np.int8
+    assert index.codes.nbytes * 4 == emb.nbytes
+
+    flat = vector_index.FlatIndex(emb)
+    for q in emb[:20]:
+        idxs, sims = index.search(q, 5)
+        # 精排后分数为 float32 原始余弦
+        assert idxs.tolist() == flat.search(q, 5)[0].tolist()
+        assert np.allclose(sims, np.dot(emb[idxs], q))
+
+
+def test_search_batch_matches_single_search():
+    emb = _random_embeddings()
+    queries = emb[:8]
+    for index in (vector_index.FlatIndex(emb), vector_index.IVFIndex.build(emb, nlist=16, nprobe=4)):
+        batch = vector_index.search_batch(index, queries, 5)
+        for q, (idxs, sims) in zip(queries, batch):
+            single_idxs, single_sims = index.search(q, 5)
+            assert idxs.tolist() == single_idxs.tolist()
+            assert np.allclose(sims, single_sims)
+
+
+def test_build_does_not_evaluate_by_default(tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("evaluate_index should not run on the serving path")
+
+    monkeypatch.setattr(vector_index, "evaluate_index", fail)
+    emb = _random_embeddings()
+    vector_index.build_vector_index(emb, "ivf", str(tmp_path / "emb.ivf.npz"), nlist=16)
+    vector_index.build_vector_index(emb, "flat", quantization="int8")
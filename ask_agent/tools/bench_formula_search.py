@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+bench_formula_search.py
+
+功能：
+    公式检索的性能与召回基准：
+    - 加载公式 CSV（默认 FORMULA_CSV_NAME，例如 simple_formula.csv），可用 --rows 合成放大到 10 万行
+      （按原名称替换 / 追加 "N#" 机组前缀，FORMULAID 追加 .S<N>，元数据列原样复制）
+    - 回放带标注的查询集（--queries JSONL，每行 {"query": "...", "expected": ["FORMULAID", ...]}），
+      未提供时从目录中抽样生成：完整名称 / 删掉一个字 / 相邻两字互换
+    - 分别测量 exact（hierarchical_exact_match）、fuzzy、semantic、hybrid：
+      p50 / p95 / p99 延迟、QPS、单核 QPS（按进程 CPU 时间）、进程内存，以及 recall@k 与 MRR
+    每个方法开始前清空查询向量缓存，测的是冷查询；--repeat > 1 时后续轮次会命中缓存。
+    合成 CSV 与嵌入缓存写在 --workdir 中（默认临时目录），指定固定目录可复用嵌入缓存。
+
+用法：
+    python tools/bench_formula_search.py [--csv data/simple_formula.csv] [--rows 100000]
+        [--queries labeled.jsonl] [--num-queries 500] [--methods exact,fuzzy,semantic,hybrid]
+        [--topk 5] [--repeat 1] [--workdir /tmp/formula_bench] [--out result.json]
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# ---------------- 配置 ----------------
+DEFAULT_METHODS = ("exact", "fuzzy", "semantic", "hybrid")
+RECALL_KS = (1, 3, 5, 10)
+WARMUP_QUERIES = 5
+_PLANT_PREFIX_RE = re.compile(r"^\d+#")
+
+
+# ---------------- 数据 ----------------
+def _strip(s) -> str:
+    return str(s if s is not None else "").strip().strip('"').strip("'")
+
+
+def read_formula_csv(path: str) -> List[Dict[str, str]]:
+    """读取公式 CSV（标准 CSV 引号规则，字段值不带引号）"""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        return [{_strip(k): _strip(v) for k, v in row.items() if k is not None} for row in reader]
+
+
+def write_formula_csv(path: str, rows: List[Dict[str, str]]):
+    """与原始文件相同的全引号格式写出"""
+    fieldnames = list(rows[0]) if rows else ["FORMULAID", "FORMULANAME"]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def generate_synthetic_rows(rows: List[Dict[str, str]], target: int) -> List[Dict[str, str]]:
+    """
+    将样本目录放大到 target 行（确定性）：原始行全部保留，
+    第 v 轮复制把名称的机组前缀替换为 "<v+1>#"（无前缀的追加），FORMULAID 追加 ".S<v>"
+    """
+    if not rows or target <= len(rows):
+        return rows[:target] if target > 0 else list(rows)
+    out = list(rows)
+    n = len(rows)
+    for i in range(target - n):
+        base = rows[i % n]
+        v = i // n + 1
+        row = dict(base)
+        row["FORMULAID"] = f"{base['FORMULAID']}.S{v}"
+        row["FORMULANAME"] = f"{v + 1}#" + _PLANT_PREFIX_RE.sub("", base["FORMULANAME"])
+        out.append(row)
+    return out
+
+
+def _mutate(name: str, kind: str, rng: random.Random) -> str:
+    # 机组前缀（"1#"）保持不变，只改动后面的名称部分
+    m = _PLANT_PREFIX_RE.match(name)
+    prefix, body = (m.group(0), name[m.end():]) if m else ("", name)
+    if len(body) < 3:
+        return name
+    i = rng.randrange(1, len(body) - 1)
+    if kind == "drop_char":
+        body = body[:i] + body[i + 1:]
+    elif kind == "swap_chars":
+        body = body[:i] + body[i + 1] + body[i] + body[i + 2:]
+    return prefix + body
+
+
+def build_labeled_queries(rows: List[Dict[str, str]], count: int, seed: int = 42) -> List[dict]:
+    """从目录抽样生成带标注查询：exact / drop_char / swap_chars 轮流"""
+    rng = random.Random(seed)
+    kinds = ("exact", "drop_char", "swap_chars")
+    sample = rng.sample(rows, min(count, len(rows)))
+    queries = []
+    for i, row in enumerate(sample):
+        kind = kinds[i % len(kinds)]
+        queries.append({
+            "query": _mutate(row["FORMULANAME"], kind, rng),
+            "expected": [row["FORMULAID"]],
+            "kind": kind,
+        })
+    return queries
+
+
+def load_labeled_queries(path: str) -> List[dict]:
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            expected = item.get("expected", [])
+            if isinstance(expected, str):
+                expected = [expected]
+            queries.append({"query": item["query"], "expected": expected, "kind": item.get("kind", "labeled")})
+    return queries
+
+
+# ---------------- 指标 ----------------
+def latency_summary(latencies_ms: Iterable[float]) -> Dict[str, float]:
+    arr = np.asarray(list(latencies_ms), dtype=np.float64)
+    if arr.size == 0:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0, "max_ms": 0.0}
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(arr.mean()), 3),
+        "max_ms": round(float(arr.max()), 3),
+    }
+
+
+def ranking_metrics(ranked: List[List[str]], expected: List[List[str]], ks: Iterable[int] = RECALL_KS) -> Dict[str, float]:
+    """
+    ranked[i] 为第 i 个查询返回的 FORMULAID（按名次），expected[i] 为标注的正确 FORMULAID。
+    recall@k = top-k 中命中的正确项 / 正确项数（对查询取平均）；MRR 为首个正确项名次倒数的平均。
+    """
+    ks = list(ks)
+    recall = {k: 0.0 for k in ks}
+    rr_sum = 0.0
+    n = 0
+    for ids, gold in zip(ranked, expected):
+        gold = {_strip(g) for g in gold}
+        if not gold:
+            continue
+        n += 1
+        ids = [_strip(x) for x in ids]
+        for k in ks:
+            recall[k] += len(gold.intersection(ids[:k])) / len(gold)
+        rank = next((r for r, x in enumerate(ids, start=1) if x in gold), None)
+        if rank:
+            rr_sum += 1.0 / rank
+    metrics = {f"recall@{k}": round(recall[k] / n, 4) if n else 0.0 for k in ks}
+    metrics["mrr"] = round(rr_sum / n, 4) if n else 0.0
+    metrics["labeled"] = n
+    return metrics
+
+
+def rss_mb() -> Optional[float]:
+    if psutil is None:
+        return None
+    return round(psutil.Process().memory_info().rss / 1024 / 1024, 1)
+
+
+# ---------------- 基准 ----------------
+def _search_fn(formula_api, method: str, topk: int):
+    if method == "exact":
+        def run(q, cat):
+            hit = formula_api.hierarchical_exact_match(q, cat)
+            return [hit["FORMULAID"]] if hit else []
+        return run
+    search = {
+        "fuzzy": lambda q, cat: formula_api.fuzzy_search(q, topk, cat),
+        "semantic": lambda q, cat: formula_api.semantic_search(q, topk, cat),
+        "hybrid": lambda q, cat: formula_api.hybrid_search(q, topk, catalog=cat),
+    }[method]
+    return lambda q, cat: [c["FORMULAID"] for c in search(q, cat)]
+
+
+def bench_method(formula_api, cat, method: str, queries: List[dict], topk: int, repeat: int = 1) -> dict:
+    run = _search_fn(formula_api, method, topk)
+    formula_api._query_embedding_cache.clear()
+    for item in queries[:WARMUP_QUERIES]:
+        run(item["query"], cat)
+    formula_api._query_embedding_cache.clear()
+
+    latencies, ranked = [], []
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for r in range(repeat):
+        for item in queries:
+            t0 = time.perf_counter()
+            ids = run(item["query"], cat)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if r == 0:
+                ranked.append(ids)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    result = {"method": method, "queries": len(latencies)}
+    result.update(latency_summary(latencies))
+    result["qps"] = round(len(latencies) / wall, 1) if wall > 0 else 0.0
+    result["qps_per_core"] = round(len(latencies) / cpu, 1) if cpu > 0 else 0.0
+    result.update(ranking_metrics(ranked, [q["expected"] for q in queries],
+                                  [k for k in RECALL_KS if k <= max(topk, 1)]))
+    result["rss_mb"] = rss_mb()
+    return result
+
+
+def load_catalog(formula_api, csv_path: str, workdir: str, semantic: bool):
+    """把 formula_api 的数据路径指向 workdir 中的 CSV，构建快照（不影响正式数据目录）"""
+    formula_api.FORMULA_CSV_PATH = csv_path
+    formula_api.EMBEDDING_CACHE_PATH = os.path.join(workdir, "formula_embeddings.pkl")
+    formula_api.VECTOR_INDEX_PATH = os.path.join(workdir, "formula_embeddings.ivf.npz")
+    if semantic:
+        formula_api._load_embedding_model()
+    cat = formula_api.build_catalog(version=1)
+    formula_api._catalog = cat
+    return cat
+
+
+def print_report(report: dict):
+    print(f"\n=== 公式检索基准：{report['rows']} 行 / {report['num_queries']} 条查询 / top{report['topk']} ===")
+    print(f"目录构建 {report['build_sec']}s，内存 {report['rss_before_mb']} -> {report['rss_after_build_mb']} MB")
+    ev = report.get("vector_index")
+    if ev:
+        print(f"向量索引 {ev['kind']} vs Flat: recall@{ev['k']}={ev['recall']:.3f}, "
+              f"flat {ev['flat_ms']:.3f}ms/query, {ev['kind']} {ev['index_ms']:.3f}ms/query")
+    if not report["results"]:
+        return
+    recall_cols = [k for k in report["results"][0] if k.startswith("recall@")]
+    cols = ["method", "p50_ms", "p95_ms", "p99_ms", "qps", "qps_per_core"] + recall_cols + ["mrr"]
+    print(" | ".join(f"{c:>12}" for c in cols))
+    for r in report["results"]:
+        print(" | ".join(f"{str(r.get(c, '')):>12}" for c in cols))
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description="公式检索性能与召回基准")
+    parser.add_argument("--csv", default="", help="公式 CSV，默认 data/<FORMULA_CSV_NAME>")
+    parser.add_argument("--rows", type=int, default=0, help="合成放大到的行数（0 表示使用原始行数）")
+    parser.add_argument("--queries", default="", help="带标注查询 JSONL")
+    parser.add_argument("--num-queries", type=int, default=500, help="未提供 --queries 时自动生成的查询数")
+    parser.add_argument("--methods", default=",".join(DEFAULT_METHODS))
+    parser.add_argument("--topk", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default="", help="合成 CSV / 嵌入缓存目录，默认临时目录")
+    parser.add_argument("--out", default="", help="结果 JSON 输出路径")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, PROJECT_ROOT)
+    from app.domains.energy.api import formula_api
+
+    methods = [m.strip() for m in args.methods.split(",") if m.strip()]
+    unknown = set(methods) - set(DEFAULT_METHODS)
+    if unknown:
+        parser.error(f"未知方法: {sorted(unknown)}")
+
+    src_csv = args.csv or formula_api.FORMULA_CSV_PATH
+    rows = read_formula_csv(src_csv)
+    if args.rows:
+        rows = generate_synthetic_rows(rows, args.rows)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="formula_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    csv_path = os.path.join(workdir, f"formula_{len(rows)}.csv")
+    write_formula_csv(csv_path, rows)
+    print(f"🔹 公式目录: {src_csv} -> {csv_path} ({len(rows)} 行)")
+
+    queries = load_labeled_queries(args.queries) if args.queries else \
+        build_labeled_queries(rows, args.num_queries, args.seed)
+
+    rss_before = rss_mb()
+    start = time.time()
+    cat = load_catalog(formula_api, csv_path, workdir, semantic=any(m in ("semantic", "hybrid") for m in methods))
+    build_sec = round(time.time() - start, 2)
+
+    # 近似 / 量化向量索引相对精确检索的召回（服务启动时不做这项评估）
+    index_eval = None
+    if cat.vector_index is not None and cat.vector_index.kind != "flat":
+        from app.domains.energy.api.vector_index import evaluate_index
+        index_eval = {"kind": cat.vector_index.kind, **evaluate_index(cat.vector_index, cat.embeddings)}
+
+    results = []
+    for method in methods:
+        if method == "semantic" and cat.vector_index is None:
+            print("⚠️ 嵌入模型不可用，跳过 semantic")
+            continue
+        print(f"🔄 {method} ...")
+        results.append(bench_method(formula_api, cat, method, queries, args.topk, args.repeat))
+
+    report = {
+        "csv": src_csv,
+        "rows": cat.size,
+        "num_queries": len(queries),
+        "topk": args.topk,
+        "repeat": args.repeat,
+        "build_sec": build_sec,
+        "rss_before_mb": rss_before,
+        "rss_after_build_mb": rss_mb(),
+        "vector_index": index_eval,
+        "results": results,
+    }
+    print_report(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ 结果已写入 {args.out}")
+    return report
+
+
+# ---------------- 执行 ----------------
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+export_sbert_onnx.py
+
+功能：
+    将离线 Sentence-Transformer 模型目录中的 transformer 部分导出为 ONNX，
+    保存到 <模型目录>/onnx/model.onnx，供 EMBEDDING_BACKEND=onnx 使用。
+    输出为 last_hidden_state，mean pooling 在 onnx_embedder.py 中完成，
+    与 SentenceTransformer 的向量一致，已有的嵌入缓存无需重建。
+
+用法：
+    python tools/export_sbert_onnx.py [模型目录]
+"""
+
+import os
+import sys
+
+import numpy as np
+import torch
+from transformers import AutoModel, AutoTokenizer
+
+# ---------------- 配置 ----------------
+# 默认与 formula_api.OFFLINE_MODEL_PATH 相同
+DEFAULT_MODEL_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..",
+    "app", "domains", "energy", "models", "sbert_offline_models", "86741b4e3f5cb7765a600d3a3d55a0f6a6cb443d"
+)
+OPSET = 17
+
+
+# ---------------- 函数 ----------------
+class _HiddenStateWrapper(torch.nn.Module):
+    """
+    固定输入顺序并只返回 last_hidden_state（不同 transformers 版本的 forward 位置参数不一致）
+    """
+    def __init__(self, model, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model(**dict(zip(self.input_names, inputs))).last_hidden_state
+
+
+def export_onnx(model_dir: str) -> str:
+    """
+    导出 ONNX（batch / sequence 维度动态）
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModel.from_pretrained(model_dir).eval()
+
+    sample = tokenizer(["1#高炉工序能耗", "测试"], padding=True, return_tensors="pt")
+    input_names = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in sample]
+    dynamic_axes = {k: {0: "batch", 1: "sequence"} for k in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    out_path = os.path.join(model_dir, "onnx", "model.onnx")
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    print(f"🔹 导出 ONNX 到 {out_path} ...")
+    with torch.no_grad():
+        torch.onnx.export(
+            _HiddenStateWrapper(model, input_names),
+            tuple(sample[k] for k in input_names),
+            out_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET,
+            dynamo=False,
+        )
+    print(f"✅ 导出完成")
+
+    # tokenizers 库只认 tokenizer.json，旧模型目录没有时顺带生成
+    if not os.path.exists(os.path.join(model_dir, "tokenizer.json")) and tokenizer.is_fast:
+        tokenizer.backend_tokenizer.save(os.path.join(model_dir, "tokenizer.json"))
+        print(f"✅ 已生成 tokenizer.json")
+    return out_path
+
+
+def verify(model_dir: str):
+    """
+    对比 ONNX 与 PyTorch 的 mean pooling 输出
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "domains", "energy", "api"))
+    from onnx_embedder import OnnxSentenceEncoder, mean_pooling
+
+    texts = ["1#高炉工序能耗实绩报出值", "酸轧纯水使用量", "焦化氧气"]
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModel.from_pretrained(model_dir).eval()
+    batch = tokenizer(texts, padding=True, truncation=True, return_tensors="pt")
+    with torch.no_grad():
+        hidden = model(**batch).last_hidden_state.numpy()
+    expected = mean_pooling(hidden, batch["attention_mask"].numpy())
+
+    actual = OnnxSentenceEncoder(model_dir).encode(texts)
+    diff = float(np.abs(actual - expected).max())
+    print(f"{'✅' if diff < 1e-4 else '⚠️'} ONNX 与 PyTorch 最大误差: {diff:.2e}")
+
+
+# ---------------- 执行 ----------------
+if __name__ == "__main__":
+    model_dir = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL_DIR)
+    export_onnx(model_dir)
+    verify(model_dir)
+    print(f"✅ 完成！设置 EMBEDDING_BACKEND=onnx 后重启服务即可使用")